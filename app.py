@@ -38,11 +38,49 @@ def create_app(config_name='development'):
     from app.utils.database import Database
     try:
         Database.initialize(app.config['MONGO_URI'])
+        Database.DEFAULT_BATCH_SIZE = app.config.get('CURSOR_BATCH_SIZE', Database.DEFAULT_BATCH_SIZE)
         logger.info(f"Database initialized successfully: {app.config['MONGO_URI']}")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
 
+    # Apply the indexes declared on the models
+    if app.config.get('ENSURE_INDEXES_ON_STARTUP'):
+        from app.utils.indexes import IndexManager
+        try:
+            _, failed = IndexManager.ensure_indexes()
+        except Exception as e:
+            logger.error(f"Index bootstrap failed: {e}")
+            failed = {}
+        # Bulk upserts and $merge rely on the unique indexes to stay duplicate-free
+        unique_failed = IndexManager.unique_failures(failed)
+        if unique_failed:
+            raise RuntimeError(
+                f"Unique indexes could not be built: {', '.join(unique_failed)}. "
+                "Fix the data, then run `flask --app app indexes ensure`."
+            )
+
+    from app.models.system_config import SystemConfig
+    SystemConfig.SNAPSHOT_TTL_SECONDS = app.config.get('SYSTEM_CONFIG_TTL_SECONDS', SystemConfig.SNAPSHOT_TTL_SECONDS)
+    from app.utils.site_directory import SiteDirectory
+    SiteDirectory.TTL_SECONDS = app.config.get('SITE_DIRECTORY_TTL_SECONDS', SiteDirectory.TTL_SECONDS)
+    from app.utils.data_upload_processor import DataUploadProcessor
+    DataUploadProcessor.CHUNK_SIZE = app.config.get('UPLOAD_CHUNK_SIZE', DataUploadProcessor.CHUNK_SIZE)
+    DataUploadProcessor.DELTA_MAX_ROWS = app.config.get('UPLOAD_DELTA_MAX_ROWS', DataUploadProcessor.DELTA_MAX_ROWS)
+    from app.utils.mismatch_processor import MismatchProcessor
+    MismatchProcessor.DETECTION_WORKERS = app.config.get('MISMATCH_DETECTION_WORKERS', MismatchProcessor.DETECTION_WORKERS)
+    MismatchProcessor.ENGINE = app.config.get('MISMATCH_DETECTION_ENGINE', MismatchProcessor.ENGINE)
+    from app.utils.upload_jobs import UploadJobRunner
+    UploadJobRunner.init_app(app)
+
+    # Time Database facade calls per request
+    from app.utils.query_stats import init_query_stats
+    init_query_stats(app)
+
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.vendor import vendor_bp
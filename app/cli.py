@@ -0,0 +1,85 @@
+"""Flask CLI commands (run with `flask --app app <command>`)"""
+import click
+
+
+def register_commands(app):
+    """Attach the maintenance commands to the Flask app"""
+
+    @app.cli.group('indexes')
+    def indexes():
+        """Manage MongoDB indexes declared on the models"""
+
+    @indexes.command('ensure')
+    def ensure_indexes():
+        """Create any missing declared indexes"""
+        from app.utils.indexes import IndexManager
+        applied, failed = IndexManager.ensure_indexes()
+        for collection_name, names in sorted(applied.items()):
+            click.echo(f"{collection_name}: {', '.join(names) or '-'}")
+        for collection_name, indexes in sorted(failed.items()):
+            for name, failure in sorted(indexes.items()):
+                click.echo(f"{collection_name}: FAILED {name}: {failure['error']}")
+        if failed:
+            raise SystemExit(1)
+
+    @indexes.command('verify')
+    def verify_indexes():
+        """Report missing, unused and undeclared indexes"""
+        from app.utils.indexes import IndexManager
+        report = IndexManager.verify()
+        missing = False
+        for collection_name, result in sorted(report.items()):
+            for kind in ('missing', 'unused', 'undeclared'):
+                if result[kind]:
+                    click.echo(f"{collection_name}: {kind}: {', '.join(result[kind])}")
+            missing = missing or bool(result['missing'])
+        if missing:
+            raise SystemExit(1)
+        click.echo("All declared indexes are present")
+
+    @app.cli.group('mismatches')
+    def mismatches():
+        """Mismatch detection maintenance"""
+
+    @mismatches.command('detect')
+    @click.argument('site_id')
+    @click.argument('month_year')
+    @click.option('--workers', type=int, default=None,
+                  help='Worker processes for large months (default: MISMATCH_DETECTION_WORKERS)')
+    def detect_mismatches(site_id, month_year, workers):
+        """Run full mismatch detection for a site-month outside the web workers"""
+        from app.utils.mismatch_processor import MismatchProcessor
+        count = MismatchProcessor.detect_and_create_mismatches(
+            site_id, month_year, workers=workers or MismatchProcessor.DETECTION_WORKERS
+        )
+        click.echo(f"Detected {count} mismatches for {site_id} {month_year}")
+
+    @mismatches.command('benchmark')
+    @click.argument('site_id')
+    @click.argument('month_year')
+    @click.option('--repeat', default=3, show_default=True, help='Runs per engine; the best is reported')
+    def benchmark_detection(site_id, month_year, repeat):
+        """Compare the Python and aggregation detection engines on a site-month (nothing is written)"""
+        from app.utils.mismatch_aggregation import MismatchAggregation
+        report = MismatchAggregation.benchmark(site_id, month_year, repeat)
+        if report is None:
+            click.echo(f"No monthly cycle for {site_id} {month_year}, or a pipeline failed")
+            raise SystemExit(1)
+        for engine in ('python', 'aggregation'):
+            click.echo(f"{engine}: {report['count'][engine]} mismatches in {report[engine] * 1000:.1f}ms")
+        differing = report['differing']
+        if differing:
+            for user_id, date in differing[:20]:
+                click.echo(f"differs: {user_id} {date}")
+            click.echo(f"{len(differing)} records differ between the engines")
+            raise SystemExit(1)
+        click.echo("Both engines found the same mismatches")
+
+    @mismatches.command('expire')
+    @click.option('--status', 'default_status', default=None,
+                  help='Final attendance status to apply (default: default_expired_mismatch_status)')
+    def expire_mismatches(default_status):
+        """Auto-resolve every pending mismatch past its deadline (schedule with cron)"""
+        from app.models.mismatch import MismatchManagement
+        expired = MismatchManagement.expire_overdue(default_status)
+        click.echo(f"Expired {expired} overdue mismatches")
@@ -1,5 +1,6 @@
 """Attendance model"""
 from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel, UpdateOne
 from bson.objectid import ObjectId
 from datetime import datetime
 
@@ -8,6 +9,22 @@ class Attendance:
 
     COLLECTION = 'attendance'
 
+    # Fields rendered by attendance list pages
+    LIST_FIELDS = {
+        'user_id': 1, 'site_id': 1, 'date': 1, 'status': 1, 'final_status': 1,
+        'approval_status': 1, 'comments': 1, 'updated_at': 1
+    }
+
+    # List fields plus the before/after data of a reapproval request,
+    # rendered by the manager's approval queue
+    APPROVAL_FIELDS = dict(LIST_FIELDS, reapproval_required=1, previous_data=1, current_data=1)
+
+    INDEXES = [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date'),
+        IndexModel([('site_id', ASCENDING), ('date', ASCENDING)], name='site_date'),
+        IndexModel([('user_id', ASCENDING), ('approval_status', ASCENDING)], name='user_approval_status')
+    ]
+
     STATUSES = [
         'In office full day',
         'Office half + work from home half',
@@ -35,15 +52,15 @@ class Attendance:
         return str(attendance_id) if attendance_id else None
 
     @staticmethod
-    def find_by_user_and_date(user_id, date):
+    def find_by_user_and_date(user_id, date, projection=None):
         """Find attendance record by user and date"""
         return Database.find_one(Attendance.COLLECTION, {
             'user_id': user_id,
             'date': date
-        })
+        }, projection)
 
     @staticmethod
-    def find_by_user_and_month(user_id, year, month):
+    def find_by_user_and_month(user_id, year, month, projection=None):
         """Find all attendance records for a user in a specific month"""
         start_date = f"{year}-{month:02d}-01"
         if month == 12:
@@ -54,7 +71,21 @@ class Attendance:
         return Database.find(Attendance.COLLECTION, {
             'user_id': user_id,
             'date': {'$gte': start_date, '$lt': end_date}
-        }, sort=[('date', 1)])
+        }, sort=[('date', 1)], projection=projection)
+
+    @staticmethod
+    def find_by_users_and_month(user_ids, year, month, projection=None):
+        """Attendance records of many users in a month, in one query sorted by date"""
+        start_date = f"{year}-{month:02d}-01"
+        if month == 12:
+            end_date = f"{year+1}-01-01"
+        else:
+            end_date = f"{year}-{month+1:02d}-01"
+
+        return Database.find(Attendance.COLLECTION, {
+            'user_id': {'$in': [str(user_id) for user_id in user_ids]},
+            'date': {'$gte': start_date, '$lt': end_date}
+        }, sort=[('date', 1)], projection=projection)
 
     @staticmethod
     def get_pending_approvals(manager_id):
@@ -72,9 +103,9 @@ class Attendance:
         }, sort=[('date', -1)])
 
         # Add user info to records
+        users = User.get_many_by_ids(set(record['user_id'] for record in records))
         for record in records:
-            user = User.find_by_id(record['user_id'])
-            record['user_info'] = user
+            record['user_info'] = users.get(str(record['user_id']))
 
         return records
 
@@ -135,10 +166,15 @@ class Attendance:
         return summary
     
     @staticmethod
-    def find(query, sort=None):
-        """Find attendance records matching query (optionally sorted)"""
-        return Database.find(Attendance.COLLECTION, query, sort=sort)
+    def find(query, sort=None, projection=None):
+        """Find attendance records matching query (optionally sorted and projected)"""
+        return Database.find(Attendance.COLLECTION, query, sort=sort, projection=projection)
     
+    @staticmethod
+    def iter_find(query, sort=None, projection=None):
+        """Yield attendance records matching query without loading them all"""
+        return Database.iter_find(Attendance.COLLECTION, query, sort=sort, projection=projection)
+
     @classmethod
     def mark_as_mismatch(cls, attendance_id, is_mismatch=True):
         return Database.update_one(
@@ -147,6 +183,23 @@ class Attendance:
             {"$set": {"is_mismatch": is_mismatch, "updated_at": datetime.utcnow()}}
         )
     
+    @classmethod
+    def mark_many_as_mismatch(cls, attendance_ids, is_mismatch=True):
+        """Set is_mismatch on many attendance records in one update"""
+        if not attendance_ids:
+            return 0
+        return Database.update_many(
+            cls.COLLECTION,
+            {"_id": {"$in": [ObjectId(a_id) for a_id in attendance_ids]}},
+            {"$set": {"is_mismatch": is_mismatch}}
+        )
+
+    @staticmethod
+    def _user_date_filter(user_id, date):
+        # Attendance stores user_id as the string the session carried;
+        # mismatches hand it over as an ObjectId
+        return {"user_id": {"$in": [str(user_id), ObjectId(user_id)]}, "date": date}
+
     @classmethod
     def update_final_status(cls, user_id, date, final_status, mismatch_id=None):
         update_data = {
@@ -158,9 +211,29 @@ class Attendance:
             update_data["mismatch_id"] = ObjectId(mismatch_id)
         return Database.update_one(
             cls.COLLECTION,
-            {"user_id": ObjectId(user_id), "date": date},
+            cls._user_date_filter(user_id, date),
             {"$set": update_data}
         )
+
+    @classmethod
+    def bulk_update_final_status(cls, updates):
+        """
+        update_final_status for many records as one unordered bulk write;
+        updates are (user_id, date, final_status, mismatch_id) tuples.
+        Returns the number of records modified.
+        """
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(cls._user_date_filter(user_id, date), {"$set": {
+                "final_status": final_status,
+                "mismatch_resolved": True,
+                "mismatch_id": ObjectId(mismatch_id),
+                "updated_at": now
+            }})
+            for user_id, date, final_status, mismatch_id in updates
+        ]
+        return Database.bulk_write(cls.COLLECTION, operations, ordered=False)['modified']
+
     @classmethod
     def find_by_month(cls, site_id, month_year):
         start_date = f"{month_year}-01"
@@ -174,6 +247,17 @@ class Attendance:
             sort=[("date", 1)]
         )    
 
+    @classmethod
+    def month_state(cls, site_id, month_year):
+        """Number of a site-month's records and the latest updated_at among them"""
+        rows = Database.aggregate(cls.COLLECTION, [
+            {"$match": {"site_id": site_id, "date": {"$regex": f"^{month_year}"}}},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "updated_at": {"$max": "$updated_at"}}}
+        ])
+        if not rows:
+            return {"count": 0, "updated_at": None}
+        return {"count": rows[0]["count"], "updated_at": rows[0]["updated_at"]}
+
     @classmethod
     def count_team_records(cls, manager_id):
         from app.models.user import User
@@ -197,6 +281,8 @@ class Attendance:
     @staticmethod
     def update_one(filter_query, update_data):
         """Update one attendance document matching filter_query with update_data"""
+        # updated_at feeds the mismatch preview version (Attendance.month_state)
+        update_data.setdefault('$set', {})['updated_at'] = datetime.utcnow()
         return Database.update_one(Attendance.COLLECTION, filter_query, update_data)
     
     @staticmethod
@@ -208,6 +294,7 @@ class Attendance:
             return None
         # Remove _id from updated fields to avoid errors
         updated_record = {k: v for k, v in record.items() if k != '_id'}
+        updated_record['updated_at'] = datetime.utcnow()
         result = Database.update_one(Attendance.COLLECTION, {'_id': record_id}, {'$set': updated_record})
         return result
 
@@ -1,10 +1,15 @@
 from bson.objectid import ObjectId
 from datetime import datetime
 from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel
 
 class AttendanceOffset:
     COLLECTION = 'attendance_offsets'
 
+    INDEXES = [
+        IndexModel([('vendor_id', ASCENDING), ('month_year', ASCENDING)], name='vendor_month')
+    ]
+
     @classmethod
     def create_offset(cls, vendor_id, month_year, attendance_id, date, hours, source="late_attendance_update"):
         """Create offset record for attendance changes after timesheet generation"""
@@ -30,7 +35,22 @@ class AttendanceOffset:
     @classmethod
     def get_offsets_summary(cls, vendor_id, month_year):
         """Get offset summary with dates and hours"""
-        offsets = cls.get_offsets_for_vendor(vendor_id, month_year)
+        return cls.summarize(cls.get_offsets_for_vendor(vendor_id, month_year))
+
+    @classmethod
+    def find_for_vendors(cls, vendor_ids, month_year):
+        """Map str(vendor_id) -> offsets in a month, for many vendors in one query"""
+        by_vendor = {}
+        for offset in Database.find(cls.COLLECTION, {
+            "vendor_id": {"$in": [ObjectId(vendor_id) for vendor_id in vendor_ids]},
+            "month_year": month_year
+        }):
+            by_vendor.setdefault(str(offset['vendor_id']), []).append(offset)
+        return by_vendor
+
+    @staticmethod
+    def summarize(offsets):
+        """Offset summary (dates and hours) of a vendor's offset records"""
         dates_hours = {}
         total_hours = 0
         
@@ -1,11 +1,17 @@
 from datetime import datetime
 from bson.objectid import ObjectId
 from app.utils.database import Database
+from app.utils.site_directory import SiteDirectory
+from pymongo import ASCENDING, IndexModel
 
 
 class Department:
     COLLECTION = 'departments'
 
+    INDEXES = [
+        IndexModel([('site_id', ASCENDING)], name='site')
+    ]
+
     @classmethod
     def create(cls, site_id, name, subdepartment, manager_id=None):
         """Create a new department with optional initial manager assignment"""
@@ -24,6 +30,7 @@ class Department:
                 'to': None
             })
         inserted_id = Database.insert_one(cls.COLLECTION, doc)
+        SiteDirectory.invalidate(site_id)
         return str(inserted_id) if inserted_id else None
 
     @classmethod
@@ -46,6 +53,8 @@ class Department:
             return Database.update_one(cls.COLLECTION, {'_id': ObjectId(dept_id)}, {'$set': update_data})
         except:
             return 0
+        finally:
+            SiteDirectory.invalidate()
 
     @classmethod
     def change_manager(cls, dept_id, new_manager_id):
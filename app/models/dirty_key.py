@@ -0,0 +1,78 @@
+# app/models/dirty_key.py
+from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from datetime import datetime
+
+
+class MismatchDirtyKey:
+    """
+    A (user, date) whose attendance or uploaded data changed since mismatch
+    detection last looked at it. MismatchProcessor.detect_incremental
+    re-evaluates and clears them.
+    """
+    COLLECTION = "mismatch_dirty_keys"
+
+    INDEXES = [
+        IndexModel([("site_id", ASCENDING), ("user_id", ASCENDING), ("date", ASCENDING)],
+                   name="site_user_date", unique=True),
+        IndexModel([("site_id", ASCENDING), ("month_year", ASCENDING)], name="site_month")
+    ]
+
+    SOURCES = ["attendance", "resolution", "upload"]
+
+    @classmethod
+    def mark(cls, site_id, keys, source):
+        """Record (user_id, date) pairs as dirty. Returns the number of keys sent."""
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"site_id": str(site_id), "user_id": str(user_id), "date": date},
+                {"$set": {"month_year": date[:7], "source": source, "marked_at": now}},
+                upsert=True
+            )
+            for user_id, date in keys
+        ]
+        Database.bulk_write(cls.COLLECTION, operations, ordered=False)
+        return len(operations)
+
+    @classmethod
+    def find_for_month(cls, site_id, month_year):
+        """Dirty keys of a site-month as a set of (user_id, date)"""
+        documents = Database.find(
+            cls.COLLECTION,
+            {"site_id": str(site_id), "month_year": month_year},
+            projection={"user_id": 1, "date": 1}
+        )
+        return set((document["user_id"], document["date"]) for document in documents)
+
+    @classmethod
+    def count_by_month(cls, site_id):
+        """month_year -> number of dirty keys for a site"""
+        rows = Database.aggregate(cls.COLLECTION, [
+            {"$match": {"site_id": str(site_id)}},
+            {"$group": {"_id": "$month_year", "count": {"$sum": 1}}}
+        ])
+        return {row["_id"]: row["count"] for row in rows}
+
+    @classmethod
+    def month_state(cls, site_id, month_year):
+        """Number of a site-month's dirty keys and when the latest was marked"""
+        rows = Database.aggregate(cls.COLLECTION, [
+            {"$match": {"site_id": str(site_id), "month_year": month_year}},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "marked_at": {"$max": "$marked_at"}}}
+        ])
+        if not rows:
+            return {"count": 0, "marked_at": None}
+        return {"count": rows[0]["count"], "marked_at": rows[0]["marked_at"]}
+
+    @classmethod
+    def clear(cls, site_id, month_year, marked_before):
+        """
+        Remove a site-month's keys marked before a detection run started;
+        keys marked again during the run stay for the next one.
+        """
+        return Database.delete_many(cls.COLLECTION, {
+            "site_id": str(site_id),
+            "month_year": month_year,
+            "marked_at": {"$lt": marked_before}
+        })
@@ -1,10 +1,15 @@
 from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel
 from datetime import datetime
 
 
 class Holiday:
     COLLECTION = 'holidays'
 
+    INDEXES = [
+        IndexModel([("site_id", ASCENDING), ("date", ASCENDING)], name="site_date")
+    ]
+
     @staticmethod
     def add(site_id, date, name):
         return Database.insert_one(Holiday.COLLECTION, {
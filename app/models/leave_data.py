@@ -1,12 +1,22 @@
 # app/models/leave_data.py
 from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel
 from bson.objectid import ObjectId
 from datetime import datetime, date as date_obj
 import re
 
+# Leave start/end are stored as start_ts/end_ts: minutes since this date
+EPOCH = date_obj(1970, 1, 1)
+
 class LeaveData:
     COLLECTION = "leave_data"
 
+    INDEXES = [
+        IndexModel([("user_id", ASCENDING), ("start_date", ASCENDING), ("end_date", ASCENDING)], name="user_date_range"),
+        IndexModel([("month_year", ASCENDING)], name="month_year"),
+        IndexModel([("batch_id", ASCENDING)], name="batch")
+    ]
+
     @classmethod
     def create(cls, employee_code, user_id, start_date, end_date, leave_type, duration, is_full_day, month_year):
         """Create leave data record"""
@@ -24,16 +34,16 @@ class LeaveData:
         return Database.insert_one(cls.COLLECTION, leave_data)
 
     @classmethod
-    def find_by_user_date(cls, user_id, date):
+    def find_by_user_date(cls, user_id, date, batch_filter=None):
         """Find leave data for user on specific date"""
-        return Database.find_one(
-            cls.COLLECTION, 
-            {
-                "user_id": ObjectId(user_id),
-                "start_date": {"$lte": date},
-                "end_date": {"$gte": date}
-            }
-        )
+        query = {
+            "user_id": ObjectId(user_id),
+            "start_date": {"$lte": date},
+            "end_date": {"$gte": date}
+        }
+        if batch_filter:
+            query.update(batch_filter)
+        return Database.find_one(cls.COLLECTION, query)
 
     @classmethod
     def find_by_month(cls, user_id, month_year):
@@ -55,6 +65,18 @@ class LeaveData:
             sort=[("start_date", 1)]
         )
 
+    @classmethod
+    def find_by_users_overlapping(cls, user_ids, start_date, end_date, batch_filter=None):
+        """Find leave data for many users whose date range overlaps start_date..end_date"""
+        query = {
+            "user_id": {"$in": list(user_ids)},
+            "start_date": {"$lte": end_date},
+            "end_date": {"$gte": start_date}
+        }
+        if batch_filter:
+            query.update(batch_filter)
+        return Database.find(cls.COLLECTION, query)
+
     @classmethod
     def bulk_insert(cls, leave_records):
         """Bulk insert leave data records"""
@@ -70,11 +92,42 @@ class LeaveData:
             return 0
 
     @classmethod
-    def delete_by_month(cls, month_year):
-        """Delete all leave data for a month (for re-upload)"""
-        collection = Database.get_collection(cls.COLLECTION)
-        result = collection.delete_many({"month_year": month_year})
-        return result.deleted_count
+    def delete_batch(cls, batch_id):
+        """Delete every leave record of an upload batch"""
+        return Database.delete_many(cls.COLLECTION, {"batch_id": batch_id})
+
+    @classmethod
+    def delete_unbatched_month(cls, user_ids, month_year):
+        """Delete a month's leave records for the given users that were uploaded before batch ids"""
+        return Database.delete_many(cls.COLLECTION, {
+            "user_id": {"$in": list(user_ids)},
+            "month_year": month_year,
+            "batch_id": {"$exists": False}
+        })
+
+    @staticmethod
+    def day_number(date_str):
+        """Days between EPOCH and a YYYY-MM-DD date"""
+        return (datetime.strptime(date_str, "%Y-%m-%d").date() - EPOCH).days
+
+    @classmethod
+    def to_minutes(cls, date_str, time_str):
+        """Minutes since EPOCH of a YYYY-MM-DD date and HH:MM[:SS] time"""
+        parts = [int(part) for part in time_str.split(':')] + [0, 0]
+        return cls.day_number(date_str) * 1440 + parts[0] * 60 + parts[1] + parts[2] / 60
+
+    @classmethod
+    def interval(cls, leave):
+        """
+        (start_ts, end_ts) of a leave record in minutes since EPOCH. Records
+        stored before start_ts/end_ts existed are parsed from their strings.
+        """
+        if 'start_ts' in leave and 'end_ts' in leave:
+            return leave['start_ts'], leave['end_ts']
+        return (
+            cls.to_minutes(leave['start_date'], leave.get('start_time', '00:00:00')),
+            cls.to_minutes(leave['end_date'], leave.get('end_time', '23:59:00'))
+        )
 
     @classmethod
     def parse_date_range(cls, start_date_str, end_date_str):
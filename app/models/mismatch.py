@@ -1,6 +1,7 @@
 # app/models/mismatch.py
 from app.utils.database import Database
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, IndexModel, ReplaceOne, UpdateOne
 from datetime import datetime, timedelta
 import logging
 
@@ -9,6 +10,26 @@ logger = logging.getLogger(__name__)
 class MismatchManagement:
     COLLECTION = "mismatches"
 
+    # Fields rendered by mismatch list pages
+    LIST_FIELDS = {
+        "site_id": 1, "user_id": 1, "date": 1, "month_year": 1,
+        "mismatch_type": 1, "original_status": 1, "status": 1, "deadline": 1,
+        "vendor_status": 1, "vendor_reason": 1, "manager_comments": 1
+    }
+
+    INDEXES = [
+        IndexModel([("site_id", ASCENDING), ("month_year", ASCENDING), ("status", ASCENDING)], name="site_month_status"),
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)], name="user_date", unique=True),
+        IndexModel([("user_id", ASCENDING), ("month_year", ASCENDING)], name="user_month"),
+        IndexModel([("status", ASCENDING), ("deadline", ASCENDING)], name="status_deadline")
+    ]
+
+    # Overdue mismatches expired per bulk update by expire_overdue
+    EXPIRY_BATCH_SIZE = 1000
+
+    # Where dedupe_user_date moves the duplicate rows it removes
+    DUPLICATES_COLLECTION = "mismatch_duplicates"
+
     MISMATCH_TYPES = {
         "pending_status": "Attendance status pending",
         "office_no_swipe": "In office full day - no swipe data",
@@ -47,27 +68,159 @@ class MismatchManagement:
         return Database.insert_one(cls.COLLECTION, mismatch_data)
 
     @classmethod
-    def get_user_mismatches(cls, user_id, status=None):
+    def prepare_indexes(cls):
+        """Run by IndexManager before building INDEXES: user_date is unique"""
+        cls.dedupe_user_date()
+
+    @classmethod
+    def dedupe_user_date(cls):
+        """
+        Keep one mismatch per (user_id, date), the most recently updated,
+        and move the others to DUPLICATES_COLLECTION (with duplicate_of set
+        to the kept _id). Mismatches written before user_date was unique
+        could be inserted twice for a day. Returns the number moved.
+        """
+        groups = Database.aggregate(cls.COLLECTION, [
+            {"$group": {
+                "_id": {"user_id": "$user_id", "date": "$date"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allow_disk_use=True)
+        if not groups:
+            return 0
+
+        grouped_ids = [_id for group in groups for _id in group["ids"]]
+        timestamps = {}
+        for start in range(0, len(grouped_ids), 1000):
+            for row in Database.find(cls.COLLECTION, {"_id": {"$in": grouped_ids[start:start + 1000]}},
+                                     projection={"updated_at": 1, "created_at": 1}):
+                timestamps[row["_id"]] = row
+
+        kept_by_duplicate = {}
+        for group in groups:
+            rows = sorted(
+                (timestamps[_id] for _id in group["ids"] if _id in timestamps),
+                key=lambda row: (row.get("updated_at") or row.get("created_at") or datetime.min, row["_id"]),
+                reverse=True
+            )
+            for row in rows[1:]:
+                kept_by_duplicate[row["_id"]] = rows[0]["_id"]
+        if not kept_by_duplicate:
+            return 0
+
+        duplicate_ids = list(kept_by_duplicate)
+        moved = 0
+        for start in range(0, len(duplicate_ids), 1000):
+            batch_ids = duplicate_ids[start:start + 1000]
+            now = datetime.utcnow()
+            duplicates = Database.find(cls.COLLECTION, {"_id": {"$in": batch_ids}})
+            totals = Database.bulk_write(cls.DUPLICATES_COLLECTION, [
+                ReplaceOne(
+                    {"_id": duplicate["_id"]},
+                    dict(duplicate, duplicate_of=kept_by_duplicate[duplicate["_id"]], archived_at=now),
+                    upsert=True
+                )
+                for duplicate in duplicates
+            ])
+            if totals["upserted"] + totals["modified"] < len(duplicates):
+                # Leave the rest in place rather than delete rows that were not archived
+                logger.error(f"Archiving duplicate mismatches failed; {moved} moved so far")
+                break
+            moved += Database.delete_many(cls.COLLECTION, {"_id": {"$in": [d["_id"] for d in duplicates]}})
+
+        logger.warning(f"Moved {moved} duplicate (user_id, date) mismatches to {cls.DUPLICATES_COLLECTION}")
+        return moved
+
+    @classmethod
+    def find_existing_for_keys(cls, keys):
+        """
+        Map (user_id str, date) -> existing mismatch for the given keys,
+        fetched in a single query.
+        """
+        keys = set((str(user_id), date) for user_id, date in keys)
+        if not keys:
+            return {}
+        user_ids = [ObjectId(user_id) for user_id in set(k[0] for k in keys)]
+        dates = list(set(k[1] for k in keys))
+        existing = {}
+        for mismatch in Database.find(cls.COLLECTION, {
+            "user_id": {"$in": user_ids},
+            "date": {"$in": dates}
+        }):
+            key = (str(mismatch['user_id']), mismatch['date'])
+            if key in keys:
+                existing.setdefault(key, mismatch)
+        return existing
+
+    @classmethod
+    def bulk_upsert_mismatches(cls, mismatches, deadline_days=7):
+        """
+        Write detected mismatches as unordered upserts keyed on (user_id, date).
+
+        Mismatches whose stored type is unchanged are left alone; changed
+        ones are reset to pending, new ones get a fresh deadline. Returns
+        the number of write operations sent.
+        """
+        existing = cls.find_existing_for_keys(
+            (m['user_id'], m['date']) for m in mismatches
+        )
+        now = datetime.utcnow()
+        deadline = now + timedelta(days=deadline_days)
+
+        operations = []
+        for mismatch in mismatches:
+            current = existing.get((str(mismatch['user_id']), mismatch['date']))
+            if current and current.get('mismatch_type') == mismatch['mismatch_type']:
+                continue
+            operations.append(UpdateOne(
+                {"user_id": ObjectId(mismatch['user_id']), "date": mismatch['date']},
+                {
+                    "$set": {
+                        "site_id": ObjectId(mismatch['site_id']),
+                        "month_year": mismatch['date'][:7],
+                        "mismatch_type": mismatch['mismatch_type'],
+                        "original_status": mismatch['original_status'],
+                        "expected_data": mismatch['expected_data'],
+                        "actual_data": mismatch['actual_data'],
+                        "status": "pending",
+                        "updated_at": now
+                    },
+                    "$setOnInsert": {
+                        "deadline": deadline,
+                        "created_at": now
+                    }
+                },
+                upsert=True
+            ))
+
+        Database.bulk_write(cls.COLLECTION, operations, ordered=False)
+        return len(operations)
+
+    @classmethod
+    def get_user_mismatches(cls, user_id, status=None, projection=None):
         """Get all mismatches for a user"""
         query = {"user_id": ObjectId(user_id)}
         if status:
             query["status"] = status
-        return Database.find(cls.COLLECTION, query, sort=[("date", 1)])
+        return Database.find(cls.COLLECTION, query, sort=[("date", 1)], projection=projection)
 
     @classmethod
-    def get_team_mismatches(cls, manager_id):
+    def get_team_mismatches(cls, manager_id, projection=None):
         """Get all mismatches for a manager's team"""
         from app.models.user import User
 
         # Get team members
-        team_members = User.get_vendors_by_manager(manager_id)
+        team_members = User.get_vendors_by_manager(manager_id, projection=User.DISPLAY_FIELDS)
         team_user_ids = [ObjectId(str(member['_id'])) for member in team_members]
 
         # Get mismatches for team
         mismatches = Database.find(
             cls.COLLECTION, 
             {"user_id": {"$in": team_user_ids}}, 
-            sort=[("date", -1)]
+            sort=[("date", -1)],
+            projection=projection
         )
 
         # Add user info to each mismatch
@@ -135,6 +288,14 @@ class MismatchManagement:
             mismatch['status'],
             mismatch['_id']
         )
+        cls._mark_dirty(mismatch)
+
+    @classmethod
+    def _mark_dirty(cls, mismatch):
+        """Queue the mismatch's (user, date) for incremental re-detection"""
+        from app.models.dirty_key import MismatchDirtyKey
+
+        MismatchDirtyKey.mark(mismatch['site_id'], [(mismatch['user_id'], mismatch['date'])], 'resolution')
 
     @classmethod
     def get_by_id(cls, mismatch_id):
@@ -174,9 +335,76 @@ class MismatchManagement:
                     default_status,
                     mismatch_id
                 )
+                cls._mark_dirty(mismatch)
 
         return result
 
+    @classmethod
+    def expire_overdue(cls, default_status=None, now=None):
+        """
+        Auto-resolve every pending mismatch past its deadline in one pass,
+        like auto_resolve_expired: EXPIRY_BATCH_SIZE mismatches per update,
+        their attendance records' final status (default_status, else the
+        default_expired_mismatch_status setting) as one bulk write, and
+        their keys queued for incremental re-detection. A mismatch updated
+        by someone else meanwhile is left alone. Returns the number expired.
+        """
+        from app.models.attendance import Attendance
+        from app.models.dirty_key import MismatchDirtyKey
+        from app.models.system_config import SystemConfig
+
+        now = now or datetime.utcnow()
+        if default_status is None:
+            default_status = SystemConfig.get_setting('default_expired_mismatch_status', 'Leave')
+        overdue = {"status": "pending", "deadline": {"$lt": now}}
+
+        expired_count = 0
+        while True:
+            # Expired mismatches leave the query, so each round reads the next batch
+            batch = Database.find(cls.COLLECTION, overdue, sort=[("deadline", ASCENDING)],
+                                  limit=cls.EXPIRY_BATCH_SIZE, projection={"_id": 1})
+            if not batch:
+                break
+            swept_at = datetime.utcnow()
+            modified = Database.update_many(
+                cls.COLLECTION,
+                dict(overdue, _id={"$in": [mismatch["_id"] for mismatch in batch]}),
+                {"$set": {
+                    "vendor_resolution": {
+                        "new_status": default_status,
+                        "comments": "Auto-resolved due to deadline expiry",
+                        "updated_at": swept_at
+                    },
+                    "status": "expired",
+                    "expired_at": swept_at,
+                    "updated_at": swept_at
+                }}
+            )
+            if not modified:
+                break
+
+            expired = Database.find(
+                cls.COLLECTION,
+                {"_id": {"$in": [mismatch["_id"] for mismatch in batch]}, "status": "expired", "expired_at": swept_at},
+                projection={"site_id": 1, "user_id": 1, "date": 1}
+            )
+            Attendance.bulk_update_final_status(
+                (mismatch["user_id"], mismatch["date"], default_status, mismatch["_id"]) for mismatch in expired
+            )
+            keys_by_site = {}
+            for mismatch in expired:
+                keys_by_site.setdefault(mismatch["site_id"], []).append((mismatch["user_id"], mismatch["date"]))
+            for site_id, keys in keys_by_site.items():
+                MismatchDirtyKey.mark(site_id, keys, 'resolution')
+
+            expired_count += len(expired)
+            if len(batch) < cls.EXPIRY_BATCH_SIZE:
+                break
+
+        if expired_count:
+            logger.info(f"Expired {expired_count} overdue mismatches with final status '{default_status}'")
+        return expired_count
+
     @classmethod
     def count_user_mismatches(cls, user_id, status=None):
         """Count mismatches for a user"""
@@ -237,14 +465,14 @@ class MismatchManagement:
         return collection.count_documents(query)
     
     @classmethod
-    def get_site_mismatches(cls, site_id, month_year=None, status=None, limit=None):
+    def get_site_mismatches(cls, site_id, month_year=None, status=None, limit=None, projection=None):
         query = {"site_id": ObjectId(site_id)}
         if month_year:
             query["month_year"] = month_year
         if status:
             query["status"] = status
         collection = Database.get_collection(cls.COLLECTION)
-        cursor = collection.find(query)
+        cursor = collection.find(query, projection)
         if limit:
             cursor = cursor.limit(limit)
         return list(cursor)
@@ -299,8 +527,11 @@ class MismatchManagement:
         }
         return Database.find(cls.COLLECTION, query, sort=[("date", 1)])
 
-
-
-
-
-
+    @classmethod
+    def find_by_users_and_month(cls, user_ids, month_year, projection=None):
+        """Mismatches of many users in a month, in one query sorted by date"""
+        query = {
+            "user_id": {"$in": [ObjectId(user_id) for user_id in user_ids]},
+            "month_year": month_year
+        }
+        return Database.find(cls.COLLECTION, query, sort=[("date", 1)], projection=projection)
@@ -0,0 +1,76 @@
+# app/models/monthly_coverage.py
+from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel, ReplaceOne
+from bson.objectid import ObjectId
+from datetime import datetime
+
+
+class MonthlyCoverage:
+    """
+    What the uploaded data says about one user's month, one slot per day:
+    swipe_hours (None where there is no swipe record), wfh_mask (bit
+    day-1 set where a WFH record covers the day) and leave_hours (leave
+    within the 6AM-7PM window). Built by CoverageIndex from the active
+    upload batches; users without any data have no document.
+    """
+    COLLECTION = "monthly_coverage"
+
+    INDEXES = [
+        IndexModel([("site_id", ASCENDING), ("month_year", ASCENDING), ("user_id", ASCENDING)],
+                   name="site_month_user", unique=True)
+    ]
+
+    DAYS = 31
+
+    @classmethod
+    def find_by_month(cls, site_id, month_year, user_ids=None):
+        """Coverage documents of a site-month, optionally only of user_ids"""
+        query = {"site_id": site_id, "month_year": month_year}
+        if user_ids is not None:
+            query["user_id"] = {"$in": [ObjectId(str(user_id)) for user_id in user_ids if ObjectId.is_valid(str(user_id))]}
+        return Database.find(cls.COLLECTION, query)
+
+    @classmethod
+    def find_for_user(cls, site_id, user_id, month_year):
+        """Coverage document of one user-month, or None"""
+        try:
+            user_id = ObjectId(user_id)
+        except Exception:
+            return None
+        return Database.find_one(cls.COLLECTION, {"site_id": site_id, "user_id": user_id, "month_year": month_year})
+
+    @classmethod
+    def replace_users(cls, site_id, month_year, documents, user_ids):
+        """
+        Store documents (one per user with data) and remove the documents of
+        the other user_ids. Returns the number of documents written.
+        """
+        now = datetime.utcnow()
+        operations = []
+        for document in documents:
+            document["updated_at"] = now
+            operations.append(ReplaceOne(
+                {"site_id": site_id, "month_year": month_year, "user_id": document["user_id"]},
+                document,
+                upsert=True
+            ))
+        totals = Database.bulk_write(cls.COLLECTION, operations)
+
+        stored = set(document["user_id"] for document in documents)
+        empty = [user_id for user_id in user_ids if user_id not in stored]
+        if empty:
+            Database.delete_many(cls.COLLECTION, {
+                "site_id": site_id, "month_year": month_year, "user_id": {"$in": empty}
+            })
+        return totals["upserted"] + totals["modified"]
+
+    @classmethod
+    def replace_month(cls, site_id, month_year, documents):
+        """Store documents as the whole coverage of a site-month"""
+        written = cls.replace_users(site_id, month_year, documents, [])
+        Database.delete_many(cls.COLLECTION, {
+            "site_id": site_id,
+            "month_year": month_year,
+            "user_id": {"$nin": [document["user_id"] for document in documents]}
+        })
+        return written
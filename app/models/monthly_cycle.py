@@ -1,11 +1,16 @@
 # app/models/monthly_cycle.py
 from app.utils.database import Database
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
 
 class MonthlyCycle:
     COLLECTION = "monthly_cycles"
 
+    INDEXES = [
+        IndexModel([("site_id", ASCENDING), ("month_year", DESCENDING)], name="site_month")
+    ]
+
     STATUSES = ["active", "processing", "closed"]
     DATA_TYPES = ["swipe_data", "wfh_data", "leave_data"]
 
@@ -76,6 +81,86 @@ class MonthlyCycle:
             {"$set": update_data}
         )
 
+    @classmethod
+    def activate_batch(cls, site_id, month_year, data_type, batch_id, file_hash=None):
+        """
+        Point data_type of a site-month at an uploaded batch and mark it
+        uploaded, in one atomic update. Returns the batch id it replaced,
+        or None if the previous data predates batch ids.
+        """
+        previous = Database.find_one_and_update(
+            cls.COLLECTION,
+            {"site_id": ObjectId(site_id), "month_year": month_year},
+            {"$set": {
+                f"data_upload_status.{data_type}.batch_id": batch_id,
+                f"data_upload_status.{data_type}.file_hash": file_hash,
+                f"data_upload_status.{data_type}.uploaded": True,
+                f"data_upload_status.{data_type}.uploaded_at": datetime.utcnow()
+            }},
+            projection={f"data_upload_status.{data_type}.batch_id": 1}
+        )
+        if not previous:
+            return None
+        return previous.get("data_upload_status", {}).get(data_type, {}).get("batch_id")
+
+    @classmethod
+    def record_upload(cls, site_id, month_year, data_type, file_hash):
+        """Record a file applied as a delta to the active batch of data_type"""
+        return Database.update_one(
+            cls.COLLECTION,
+            {"site_id": ObjectId(site_id), "month_year": month_year},
+            {"$set": {
+                f"data_upload_status.{data_type}.file_hash": file_hash,
+                f"data_upload_status.{data_type}.uploaded": True,
+                f"data_upload_status.{data_type}.uploaded_at": datetime.utcnow()
+            }}
+        )
+
+    @classmethod
+    def set_coverage_signature(cls, site_id, month_year, signature):
+        """Record which upload state the site-month's MonthlyCoverage was built from"""
+        return Database.update_one(
+            cls.COLLECTION,
+            {"site_id": ObjectId(site_id), "month_year": month_year},
+            {"$set": {"coverage_signature": signature}}
+        )
+
+    @classmethod
+    def active_batch_filters(cls, site_id):
+        """
+        Filter per data type selecting the uploaded records readers should
+        see: the active batch of every month that has one, plus records
+        uploaded before batch ids existed for months that have none.
+        """
+        cycles = Database.find(
+            cls.COLLECTION,
+            {"site_id": ObjectId(site_id)},
+            projection={"month_year": 1, "data_upload_status": 1}
+        )
+        filters = {}
+        for data_type in cls.DATA_TYPES:
+            active_batches = []
+            batched_months = []
+            for cycle in cycles:
+                batch_id = cycle.get("data_upload_status", {}).get(data_type, {}).get("batch_id")
+                if batch_id:
+                    active_batches.append(batch_id)
+                    batched_months.append(cycle["month_year"])
+            filters[data_type] = {"$or": [
+                {"batch_id": {"$in": active_batches}},
+                {"batch_id": {"$exists": False}, "month_year": {"$nin": batched_months}}
+            ]}
+        return filters
+
+    @classmethod
+    def set_full_mismatch_scan_required(cls, site_id, month_year, required=True):
+        """Flag (or unflag) a site-month whose changes are too broad for incremental detection"""
+        return Database.update_one(
+            cls.COLLECTION,
+            {"site_id": ObjectId(site_id), "month_year": month_year},
+            {"$set": {"mismatch_full_scan_required": required}}
+        )
+
     @classmethod
     def update_mismatch_processed(cls, site_id, month_year):
         """Mark mismatch as processed for given site and month"""
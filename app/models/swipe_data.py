@@ -1,11 +1,18 @@
 # app/models/swipe_data.py
 from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel
 from bson.objectid import ObjectId
 from datetime import datetime
 
 class SwipeData:
     COLLECTION = "swipe_data"
 
+    INDEXES = [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)], name="user_date"),
+        IndexModel([("month_year", ASCENDING)], name="month_year"),
+        IndexModel([("batch_id", ASCENDING)], name="batch")
+    ]
+
     @classmethod
     def create(cls, employee_code, user_id, date, login, logout, total_hours, month_year):
         """Create swipe data record"""
@@ -22,12 +29,12 @@ class SwipeData:
         return Database.insert_one(cls.COLLECTION, swipe_data)
 
     @classmethod
-    def find_by_user_date(cls, user_id, date):
+    def find_by_user_date(cls, user_id, date, batch_filter=None):
         """Find swipe data for user on specific date"""
-        return Database.find_one(
-            cls.COLLECTION, 
-            {"user_id": ObjectId(user_id), "date": date}
-        )
+        query = {"user_id": ObjectId(user_id), "date": date}
+        if batch_filter:
+            query.update(batch_filter)
+        return Database.find_one(cls.COLLECTION, query)
 
     @classmethod
     def find_by_month(cls, user_id, month_year):
@@ -38,6 +45,17 @@ class SwipeData:
             sort=[("date", 1)]
         )
 
+    @classmethod
+    def find_by_users_in_range(cls, user_ids, start_date, end_date, batch_filter=None):
+        """Find swipe data for many users between two dates (inclusive)"""
+        query = {
+            "user_id": {"$in": list(user_ids)},
+            "date": {"$gte": start_date, "$lte": end_date}
+        }
+        if batch_filter:
+            query.update(batch_filter)
+        return Database.find(cls.COLLECTION, query)
+
     @classmethod
     def bulk_insert(cls, swipe_records):
         """Bulk insert swipe data records"""
@@ -53,8 +71,15 @@ class SwipeData:
             return 0
 
     @classmethod
-    def delete_by_month(cls, month_year):
-        """Delete all swipe data for a month (for re-upload)"""
-        collection = Database.get_collection(cls.COLLECTION)
-        result = collection.delete_many({"month_year": month_year})
-        return result.deleted_count
+    def delete_batch(cls, batch_id):
+        """Delete every swipe record of an upload batch"""
+        return Database.delete_many(cls.COLLECTION, {"batch_id": batch_id})
+
+    @classmethod
+    def delete_unbatched_month(cls, user_ids, month_year):
+        """Delete a month's swipe records for the given users that were uploaded before batch ids"""
+        return Database.delete_many(cls.COLLECTION, {
+            "user_id": {"$in": list(user_ids)},
+            "month_year": month_year,
+            "batch_id": {"$exists": False}
+        })
@@ -1,10 +1,24 @@
 # app/models/system_config.py
 from app.utils.database import Database
+import time
+from pymongo import ASCENDING, IndexModel
 from datetime import datetime
 
 class SystemConfig:
     COLLECTION = "system_config"
 
+    # Seconds a settings snapshot is reused before it is reloaded. Writes
+    # through update_setting invalidate it at once in this process; other
+    # processes pick the change up when their snapshot expires.
+    SNAPSHOT_TTL_SECONDS = 60
+
+    _snapshot = None
+    _snapshot_loaded_at = 0.0
+
+    INDEXES = [
+        IndexModel([("key", ASCENDING)], name="key")
+    ]
+
     DEFAULT_SETTINGS = {
         "mismatch_resolution_deadline_days": 7,
         "manager_approval_deadline_days": 3,
@@ -19,21 +33,38 @@ class SystemConfig:
 
     @classmethod
     def get_setting(cls, key, default=None):
-        """Get a system setting value"""
-        setting = Database.find_one(cls.COLLECTION, {"key": key})
-        if setting:
-            return setting.get("value", default)
-        return cls.DEFAULT_SETTINGS.get(key, default)
+        """Get a system setting value (from the cached snapshot)"""
+        return cls.get_snapshot().get(key, default)
+
+    @classmethod
+    def get_snapshot(cls):
+        """
+        All settings (defaults overlaid with stored values) as a dict,
+        loaded with one query and cached for SNAPSHOT_TTL_SECONDS.
+        Processors take one snapshot per run and read thresholds from it.
+        """
+        now = time.monotonic()
+        if cls._snapshot is None or now - cls._snapshot_loaded_at > cls.SNAPSHOT_TTL_SECONDS:
+            cls._snapshot = cls.get_all_settings()
+            cls._snapshot_loaded_at = now
+        return cls._snapshot
+
+    @classmethod
+    def invalidate_snapshot(cls):
+        """Force the next read to reload settings from the database"""
+        cls._snapshot = None
 
     @classmethod  
     def update_setting(cls, key, value):
         """Update or create a system setting"""
-        return Database.update_one(
+        result = Database.update_one(
             cls.COLLECTION, 
             {"key": key}, 
             {"$set": {"value": value, "updated_at": datetime.utcnow()}},
             upsert=True
         )
+        cls.invalidate_snapshot()
+        return result
 
     @classmethod
     def get_all_settings(cls):
@@ -42,7 +73,8 @@ class SystemConfig:
         settings_dict = cls.DEFAULT_SETTINGS.copy()
 
         for setting in settings:
-            settings_dict[setting["key"]] = setting["value"]
+            if "value" in setting:
+                settings_dict[setting["key"]] = setting["value"]
 
         return settings_dict
 
@@ -1,12 +1,27 @@
 from bson.objectid import ObjectId
 from datetime import datetime
 from app.utils.database import Database
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
 from app.models.user import User
-from app.models.vending_company import VendingCompany
+from app.utils.site_directory import SiteDirectory
 
 class Timesheet:
     COLLECTION = 'timesheets'
 
+    # Leaves out the per-date hour maps for pages that only show totals
+    SUMMARY_PROJECTION = {'work_dates_hours': 0, 'offset_dates_hours': 0}
+
+    EXPORT_COLUMNS = [
+        'Vendor Name', 'Vendor Email', 'Company', 'Month-Year',
+        'Total Work Hours', 'Mismatch Leave Days', 'Total Offset Hours',
+        'Total Hours (with offset)', 'Date', 'Hours Worked', 'Type'
+    ]
+
+    INDEXES = [
+        IndexModel([('vendor_id', ASCENDING), ('month_year', DESCENDING)], name='vendor_month'),
+        IndexModel([('month_year', ASCENDING)], name='month_year')
+    ]
+
     @classmethod
     def find_one(cls, vendor_id, month_year):
         return Database.find_one(cls.COLLECTION, {
@@ -31,16 +46,15 @@ class Timesheet:
         else:
             return Database.insert_one(cls.COLLECTION, data)
 
-    @classmethod
-    def create_or_update_detailed(cls, vendor_id, vending_company_id, month_year,
-                                  work_dates_hours, mismatch_leave_days,
-                                  offset_dates_hours, total_offset_hours):
-        existing = cls.find_one(vendor_id, month_year)
-        
+    @staticmethod
+    def detailed_document(vendor_id, vending_company_id, month_year,
+                          work_dates_hours, mismatch_leave_days,
+                          offset_dates_hours, total_offset_hours):
+        """Fields of a detailed timesheet, totals included"""
         total_work_hours = sum(work_dates_hours.values())
         total_hours_with_offset = total_work_hours + total_offset_hours
-        
-        data = {
+
+        return {
             'vendor_id': ObjectId(vendor_id),
             'vending_company_id': ObjectId(vending_company_id) if vending_company_id else None,
             'month_year': month_year,
@@ -54,26 +68,66 @@ class Timesheet:
             'offset_days': len([h for h in offset_dates_hours.values() if h > 0]),
             'generated_on': datetime.utcnow()
         }
-        
+
+    @classmethod
+    def create_or_update_detailed(cls, vendor_id, vending_company_id, month_year,
+                                  work_dates_hours, mismatch_leave_days,
+                                  offset_dates_hours, total_offset_hours):
+        existing = cls.find_one(vendor_id, month_year)
+
+        data = cls.detailed_document(vendor_id, vending_company_id, month_year,
+                                     work_dates_hours, mismatch_leave_days,
+                                     offset_dates_hours, total_offset_hours)
+
         if existing:
             Database.update_one(cls.COLLECTION, {'_id': existing['_id']}, {'$set': data})
             return existing['_id']
         else:
             return Database.insert_one(cls.COLLECTION, data)
 
+    @classmethod
+    def bulk_upsert_detailed(cls, documents):
+        """
+        Store detailed_document()s, replacing each vendor-month's fields like
+        create_or_update_detailed, as one unordered bulk write. Returns the
+        number of timesheets created or updated.
+        """
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {'vendor_id': document['vendor_id'], 'month_year': document['month_year']},
+                {'$set': dict(document, updated_at=now), '$setOnInsert': {'created_at': now}},
+                upsert=True
+            )
+            for document in documents
+        ]
+        totals = Database.bulk_write(cls.COLLECTION, operations, ordered=False)
+        return totals['upserted'] + totals['modified']
+
+    @classmethod
+    def find(cls, query, sort=None, projection=None):
+        """Find timesheets matching query (optionally sorted and projected)"""
+        return Database.find(cls.COLLECTION, query, sort=sort, projection=projection)
+
     @classmethod
     def get_latest_timesheet(cls, vendor_id):
         results = list(Database.find(
             cls.COLLECTION,
             {'vendor_id': ObjectId(vendor_id)},
             sort=[('month_year', -1)],
-            limit=1
+            limit=1,
+            projection=cls.SUMMARY_PROJECTION
         ))
         return results[0] if results else None
 
 
     @classmethod
-    def get_timesheets(cls, filters):
+    def get_timesheets(cls, filters, projection=None):
+        return list(cls.iter_timesheets(filters, projection=projection))
+
+    @classmethod
+    def iter_timesheets(cls, filters, projection=None):
+        """Yield timesheets matching filters, enriched with vendor and company info"""
         query = {}
         if 'vending_company_id' in filters and filters['vending_company_id']:
             query['vending_company_id'] = ObjectId(filters['vending_company_id'])
@@ -81,22 +135,20 @@ class Timesheet:
             query['month_year'] = filters['month_year']
         if 'manager_id' in filters and filters['manager_id']:
             # Find vendors under this manager
-            vendors = User.find({'manager_id': ObjectId(filters['manager_id']), 'role': 'vendor'})
+            vendors = User.find({'manager_id': ObjectId(filters['manager_id']), 'role': 'vendor'}, projection={'_id': 1})
             vendor_ids = [v['_id'] for v in vendors]
             query['vendor_id'] = {'$in': vendor_ids}
             
-        timesheets = list(Database.find(cls.COLLECTION, query))
-        
         # Enrich with vendor and company info
-        for ts in timesheets:
-            vendor = User.find_one({'_id': ts['vendor_id']})
+        for ts in Database.iter_find(cls.COLLECTION, query, projection=projection):
+            vendor = User.find_one({'_id': ts['vendor_id']}, projection=User.DISPLAY_FIELDS)
             if vendor:
                 ts['vendor_name'] = vendor.get('name', 'N/A')
                 ts['vendor_email'] = vendor.get('email', 'N/A')
 
                 # Get vending company from vendor
                 if vendor.get('vendor_company_id'):
-                    company = VendingCompany.find_by_id(vendor['vendor_company_id'])
+                    company = SiteDirectory.company(vendor.get('site_id'), vendor['vendor_company_id'])
                     if company:
                         ts['vending_company_name'] = company.get('name', 'N/A')
                     else:
@@ -107,15 +159,17 @@ class Timesheet:
                 ts['vendor_name'] = 'N/A'
                 ts['vendor_email'] = 'N/A'
                 ts['vending_company_name'] = 'N/A'
-        
-        return timesheets
+
+            yield ts
 
     @classmethod
     def get_export_data(cls, filters):
-        timesheets = cls.get_timesheets(filters)
-        export_data = []
-        
-        for ts in timesheets:
+        return list(cls.iter_export_rows(filters))
+
+    @classmethod
+    def iter_export_rows(cls, filters):
+        """Yield export rows (see EXPORT_COLUMNS) one timesheet at a time"""
+        for ts in cls.iter_timesheets(filters):
             # Main timesheet row
             base_row = {
                 'Vendor Name': ts.get('vendor_name', 'N/A'),
@@ -135,7 +189,7 @@ class Timesheet:
                 row['Date'] = date
                 row['Hours Worked'] = hours
                 row['Type'] = 'Work'
-                export_data.append(row)
+                yield row
             
             # Add offset dates details
             offset_dates = ts.get('offset_dates_hours', {})
@@ -144,13 +198,11 @@ class Timesheet:
                 row['Date'] = date
                 row['Hours Worked'] = hours
                 row['Type'] = 'Offset'
-                export_data.append(row)
+                yield row
                 
             # If no work or offset dates, add summary row
             if not work_dates and not offset_dates:
-                export_data.append(base_row)
-        
-        return export_data
+                yield base_row
     
     @classmethod
     def count_generated_timesheets(cls, vendor_ids):
@@ -0,0 +1,91 @@
+# app/models/upload_job.py
+from app.utils.database import Database
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from bson.objectid import ObjectId
+from datetime import datetime
+
+
+class UploadJob:
+    """A data file upload processed in the background, with its progress counters"""
+    COLLECTION = "upload_jobs"
+
+    INDEXES = [
+        IndexModel([("site_id", ASCENDING), ("created_at", DESCENDING)], name="site_created")
+    ]
+
+    STATUSES = ["queued", "running", "completed", "failed"]
+
+    @classmethod
+    def create(cls, site_id, month_year, data_type, filename, file_path, created_by=None):
+        """Record a queued upload job"""
+        job = {
+            "site_id": site_id,
+            "month_year": month_year,
+            "data_type": data_type,
+            "filename": filename,
+            "file_path": file_path,
+            "created_by": created_by,
+            "status": "queued",
+            "parsed": 0,
+            "inserted": 0,
+            "rejected": 0,
+            "unmatched": [],
+            "error": None,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None
+        }
+        inserted_id = Database.insert_one(cls.COLLECTION, job)
+        return str(inserted_id) if inserted_id else None
+
+    @classmethod
+    def find_by_id(cls, job_id):
+        """Find an upload job by ID"""
+        try:
+            return Database.find_one(cls.COLLECTION, {"_id": ObjectId(job_id)})
+        except Exception:
+            return None
+
+    @classmethod
+    def get_recent(cls, site_id, limit=10):
+        """Latest upload jobs for a site"""
+        return Database.find(
+            cls.COLLECTION,
+            {"site_id": site_id},
+            sort=[("created_at", -1)],
+            limit=limit,
+            projection={"file_path": 0}
+        )
+
+    @classmethod
+    def mark_running(cls, job_id):
+        return Database.update_one(
+            cls.COLLECTION,
+            {"_id": ObjectId(job_id)},
+            {"$set": {"status": "running", "started_at": datetime.utcnow()}}
+        )
+
+    @classmethod
+    def update_progress(cls, job_id, parsed, inserted, rejected):
+        """Store the running totals after a chunk has been ingested"""
+        return Database.update_one(
+            cls.COLLECTION,
+            {"_id": ObjectId(job_id)},
+            {"$set": {"parsed": parsed, "inserted": inserted, "rejected": rejected}}
+        )
+
+    @classmethod
+    def finish(cls, job_id, result):
+        """Record the outcome returned by DataUploadProcessor.process_upload"""
+        update = {
+            "status": "completed" if result.get("success") else "failed",
+            "error": result.get("error"),
+            "unmatched": (result.get("unmatched") or [])[:100],
+            "finished_at": datetime.utcnow()
+        }
+        if result.get("success"):
+            update["inserted"] = result.get("count", 0)
+            update["unchanged"] = result.get("unchanged", False)
+            if "changed" in result:
+                update["changes"] = {key: result[key] for key in ("inserted", "changed", "removed")}
+        return Database.update_one(cls.COLLECTION, {"_id": ObjectId(job_id)}, {"$set": update})
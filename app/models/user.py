@@ -1,8 +1,11 @@
 """User model"""
 from app.utils.database import Database
+from app.utils.site_directory import SiteDirectory
+from pymongo import ASCENDING, IndexModel
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
 from datetime import datetime
+from flask import g, has_app_context
 
 
 class User:
@@ -10,6 +13,21 @@ class User:
 
     COLLECTION = 'users'
 
+    # Fields needed to display or link a user; leaves out password_hash
+    # and the assignment_history array
+    DISPLAY_FIELDS = {
+        'name': 1, 'username': 1, 'email': 1, 'role': 1, 'employee_code': 1,
+        'site_id': 1, 'manager_id': 1, 'vendor_company_id': 1,
+        'department_id': 1, 'active': 1
+    }
+
+    INDEXES = [
+        IndexModel([('username', ASCENDING)], name='username'),
+        IndexModel([('employee_code', ASCENDING)], name='employee_code'),
+        IndexModel([('manager_id', ASCENDING), ('role', ASCENDING), ('active', ASCENDING)], name='manager_role_active'),
+        IndexModel([('site_id', ASCENDING), ('role', ASCENDING), ('active', ASCENDING)], name='site_role_active')
+    ]
+
     @staticmethod
     def create(username, password, role, name, site_id, **kwargs):
         """Create a new user"""
@@ -45,6 +63,8 @@ class User:
             })
 
         user_id = Database.insert_one(User.COLLECTION, user_data)
+        if role == 'manager':
+            SiteDirectory.invalidate(site_id)
         return str(user_id) if user_id else None
 
     @staticmethod
@@ -78,6 +98,7 @@ class User:
         }
 
         Database.update_one(User.COLLECTION, {'_id': ObjectId(user_id)}, {'$set': update_data})
+        User._forget(user_id)
         return True
 
     @staticmethod
@@ -86,34 +107,82 @@ class User:
         return Database.find_one(User.COLLECTION, {'username': username, 'active': True})
 
     @staticmethod
-    def find_by_id(user_id):
-        """Find user by ID (only active users)"""
+    def find_by_id(user_id, projection=None):
+        """
+        Find user by ID (only active users).
+        Lookups with projection=User.DISPLAY_FIELDS go through the
+        request's identity map, so repeated ids cost one query per request.
+        """
+        if projection is User.DISPLAY_FIELDS and has_app_context():
+            return User.get_many_by_ids([user_id]).get(str(user_id))
         try:
-            return Database.find_one(User.COLLECTION, {'_id': ObjectId(user_id), 'active': True})
+            return Database.find_one(User.COLLECTION, {'_id': ObjectId(user_id), 'active': True}, projection)
         except:
             return None
 
+    @staticmethod
+    def _identity_map():
+        """Request-scoped map of str(user_id) -> DISPLAY_FIELDS document (or None)"""
+        if 'user_identity_map' not in g:
+            g.user_identity_map = {}
+        return g.user_identity_map
+
+    @staticmethod
+    def get_many_by_ids(user_ids):
+        """
+        Map str(user_id) -> active user (DISPLAY_FIELDS) for the given ids.
+        Ids not yet seen in this request are fetched with a single $in
+        query; unknown or inactive ids map to None. Outside a request the
+        map only lives for this call.
+        """
+        identity_map = User._identity_map() if has_app_context() else {}
+
+        missing = []
+        for user_id in user_ids:
+            key = str(user_id)
+            if key in identity_map:
+                continue
+            identity_map[key] = None
+            try:
+                missing.append(ObjectId(key))
+            except Exception:
+                continue
+
+        if missing:
+            for user in Database.find(User.COLLECTION,
+                                      {'_id': {'$in': missing}, 'active': True},
+                                      projection=User.DISPLAY_FIELDS):
+                identity_map[str(user['_id'])] = user
+
+        return {str(user_id): identity_map.get(str(user_id)) for user_id in user_ids}
+
+    @staticmethod
+    def _forget(user_id):
+        """Drop a user from the request's identity map after a write"""
+        if has_app_context():
+            User._identity_map().pop(str(user_id), None)
+
     @staticmethod
     def verify_password(user, password):
         """Verify user password"""
         return check_password_hash(user['password_hash'], password)
 
     @staticmethod
-    def get_vendors_by_manager(manager_id):
+    def get_vendors_by_manager(manager_id, projection=None):
         """Get all vendors managed by a specific manager (only active)"""
         return Database.find(User.COLLECTION, {
             'role': 'vendor',
             'manager_id': manager_id,
             'active': True
-        })
+        }, projection=projection)
 
     @staticmethod
-    def get_all_by_site(site_id, role=None):
+    def get_all_by_site(site_id, role=None, projection=None):
         """Get all active users in a site, optionally filtered by role"""
         query = {'site_id': site_id, 'active': True}
         if role:
             query['role'] = role
-        return Database.find(User.COLLECTION, query)
+        return Database.find(User.COLLECTION, query, projection=projection)
 
     @staticmethod
     def deactivate(user_id):
@@ -124,13 +193,15 @@ class User:
                 {'_id': ObjectId(user_id), 'active': True},
                 {'$set': {'active': False}}
             )
+            User._forget(user_id)
+            SiteDirectory.invalidate()
             return count
         except Exception as e:
             # You may want to log error here based on your logger setup
             return 0
 
     @staticmethod
-    def find(query):
+    def find(query, projection=None):
         """
         Generic find method: support any MongoDB query.
         Use for admin filtering by name, manager, company, active/inactive, etc.
@@ -138,8 +209,9 @@ class User:
             User.find({'site_id': sid, 'active': False})
             User.find({'role':'vendor', 'active': True, 'manager_id': X})
             User.find({'name': {'$regex': 'John', '$options': 'i'}})
+            User.find({'site_id': sid}, projection=User.DISPLAY_FIELDS)
         """
-        return Database.find(User.COLLECTION, query)
+        return Database.find(User.COLLECTION, query, projection=projection)
     
     # @classmethod
     # def get_vendors_by_manager(cls, manager_id):
@@ -156,6 +228,6 @@ class User:
     )
 
     @staticmethod
-    def find_one(query):
+    def find_one(query, projection=None):
         """Find a single user document matching a MongoDB query."""
-        return Database.find_one(User.COLLECTION, query)
\ No newline at end of file
+        return Database.find_one(User.COLLECTION, query, projection)
\ No newline at end of file
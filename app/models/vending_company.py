@@ -1,10 +1,16 @@
 from bson.objectid import ObjectId
 from app.utils.database import Database
+from app.utils.site_directory import SiteDirectory
+from pymongo import ASCENDING, IndexModel
 
 
 class VendingCompany:
     COLLECTION = 'vending_companies'
 
+    INDEXES = [
+        IndexModel([('site_id', ASCENDING)], name='site')
+    ]
+
     @classmethod
     def add(cls, site_id, name):
         """Add a new vending company for a site"""
@@ -13,6 +19,7 @@ class VendingCompany:
             'name': name
         }
         inserted_id = Database.insert_one(cls.COLLECTION, doc)
+        SiteDirectory.invalidate(site_id)
         return str(inserted_id) if inserted_id else None
 
     @classmethod
@@ -35,6 +42,8 @@ class VendingCompany:
             return Database.update_one(cls.COLLECTION, {'_id': ObjectId(company_id)}, {'$set': update_data})
         except:
             return 0
+        finally:
+            SiteDirectory.invalidate()
 
     @classmethod
     def remove(cls, company_id):
@@ -43,3 +52,5 @@ class VendingCompany:
             return Database.delete_one(cls.COLLECTION, {'_id': ObjectId(company_id)})
         except:
             return 0
+        finally:
+            SiteDirectory.invalidate()
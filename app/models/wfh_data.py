@@ -1,11 +1,18 @@
 # app/models/wfh_data.py
 from app.utils.database import Database
+from pymongo import ASCENDING, IndexModel
 from bson.objectid import ObjectId
 from datetime import datetime
 
 class WFHData:
     COLLECTION = "wfh_data"
 
+    INDEXES = [
+        IndexModel([("user_id", ASCENDING), ("start_date", ASCENDING), ("end_date", ASCENDING)], name="user_date_range"),
+        IndexModel([("month_year", ASCENDING)], name="month_year"),
+        IndexModel([("batch_id", ASCENDING)], name="batch")
+    ]
+
     @classmethod
     def create(cls, employee_code, user_id, start_date, end_date, duration, month_year):
         """Create WFH data record"""
@@ -21,19 +28,19 @@ class WFHData:
         return Database.insert_one(cls.COLLECTION, wfh_data)
 
     @classmethod
-    def find_by_user_date(cls, user_id, date_str):
+    def find_by_user_date(cls, user_id, date_str, batch_filter=None):
         """
         Find WFH data for user covering a specific date
         where start_date <= date <= end_date
         """
-        return Database.find_one(
-            cls.COLLECTION,
-            {
-                "user_id": ObjectId(user_id),
-                "start_date": {"$lte": date_str},
-                "end_date": {"$gte": date_str}
-            }
-        )
+        query = {
+            "user_id": ObjectId(user_id),
+            "start_date": {"$lte": date_str},
+            "end_date": {"$gte": date_str}
+        }
+        if batch_filter:
+            query.update(batch_filter)
+        return Database.find_one(cls.COLLECTION, query)
 
     @classmethod
     def find_by_month(cls, user_id, month_year):
@@ -44,6 +51,18 @@ class WFHData:
             sort=[("date", 1)]
         )
 
+    @classmethod
+    def find_by_users_overlapping(cls, user_ids, start_date, end_date, batch_filter=None):
+        """Find WFH data for many users whose date range overlaps start_date..end_date"""
+        query = {
+            "user_id": {"$in": list(user_ids)},
+            "start_date": {"$lte": end_date},
+            "end_date": {"$gte": start_date}
+        }
+        if batch_filter:
+            query.update(batch_filter)
+        return Database.find(cls.COLLECTION, query)
+
     @classmethod
     def bulk_insert(cls, wfh_records):
         """Bulk insert WFH data records"""
@@ -59,8 +78,15 @@ class WFHData:
             return 0
 
     @classmethod
-    def delete_by_month(cls, month_year):
-        """Delete all WFH data for a month (for re-upload)"""
-        collection = Database.get_collection(cls.COLLECTION)
-        result = collection.delete_many({"month_year": month_year})
-        return result.deleted_count
+    def delete_batch(cls, batch_id):
+        """Delete every WFH record of an upload batch"""
+        return Database.delete_many(cls.COLLECTION, {"batch_id": batch_id})
+
+    @classmethod
+    def delete_unbatched_month(cls, user_ids, month_year):
+        """Delete a month's WFH records for the given users that were uploaded before batch ids"""
+        return Database.delete_many(cls.COLLECTION, {
+            "user_id": {"$in": list(user_ids)},
+            "month_year": month_year,
+            "batch_id": {"$exists": False}
+        })
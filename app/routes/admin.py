@@ -1,10 +1,11 @@
 """Admin routes"""
 from io import BytesIO
-from flask import Blueprint, render_template, request, redirect, send_file, url_for, session, flash
+from flask import Blueprint, jsonify, render_template, request, redirect, send_file, url_for, session, flash
 from app.models.user import User
 from app.models.department import Department
 from app.models.vending_company import VendingCompany
 from app.utils.helpers import login_required, role_required
+from app.utils.site_directory import SiteDirectory
 from app.utils.database import Database
 from bson.objectid import ObjectId
 from app.models.holiday import Holiday
@@ -13,11 +14,13 @@ import logging
 import calendar
 from app.models.mismatch import MismatchManagement
 from app.models.monthly_cycle import MonthlyCycle
+from app.models.dirty_key import MismatchDirtyKey
 from app.models.swipe_data import SwipeData
 from app.models.wfh_data import WFHData
 from app.models.leave_data import LeaveData
 from app.utils.mismatch_processor import MismatchProcessor
-from app.utils.data_upload_processor import DataUploadProcessor
+from app.utils.upload_jobs import UploadJobRunner
+from app.models.upload_job import UploadJob
 from app.utils.helpers import allowed_file
 import pandas as pd
 from dateutil.relativedelta import relativedelta
@@ -147,8 +150,8 @@ def dashboard():
     
     # Get site statistics
     site_stats = {
-        'total_vendors': len(User.get_all_by_site(site_id, 'vendor')),
-        'total_managers': len(User.get_all_by_site(site_id, 'manager')),
+        'total_vendors': len(User.get_all_by_site(site_id, 'vendor', projection={'_id': 1})),
+        'total_managers': len(User.get_all_by_site(site_id, 'manager', projection={'_id': 1})),
     }
     
     # Get mismatch statistics
@@ -160,7 +163,9 @@ def dashboard():
     months = [(datetime.utcnow() - relativedelta(months=i)).strftime('%Y-%m') for i in range(12)]
 
     # Get recent mismatches
-    recent_mismatches = MismatchManagement.get_site_mismatches(site_id, limit=10)
+    recent_mismatches = MismatchManagement.get_site_mismatches(
+        site_id, limit=10, projection=MismatchManagement.LIST_FIELDS
+    )
     
     return render_template('admin/dashboard.html', 
                          site_stats=site_stats,
@@ -218,8 +223,8 @@ def users():
         m['vendor_count'] = sum(1 for v in vendors if str(v.get('manager_id')) == str(m['_id']))
 
     # Fetch all departments and vending companies for dropdowns and mapping
-    departments = Department.get_all(site_id)
-    vendor_companies = VendingCompany.get_all(site_id)
+    departments = SiteDirectory.departments(site_id)
+    vendor_companies = SiteDirectory.companies(site_id)
 
     # Create maps for efficient lookup
     department_map = {str(d['_id']): d for d in departments}
@@ -269,9 +274,9 @@ def users():
 @role_required('admin')
 def add_user():
     site_id = session['site_id']
-    managers = User.get_all_by_site(site_id, 'manager')
-    departments = Department.get_all(site_id)
-    vendor_companies = VendingCompany.get_all(site_id)
+    managers = SiteDirectory.managers(site_id)
+    departments = SiteDirectory.departments(site_id)
+    vendor_companies = SiteDirectory.companies(site_id)
 
     if request.method == 'POST':
         username = request.form.get('username')
@@ -297,6 +302,7 @@ def add_user():
                     {'_id': ObjectId(kwargs['department_id'])},
                     {'$set': {'manager_id': ObjectId(new_user_id)}}
                 )
+                SiteDirectory.invalidate(site_id)
             flash('User created successfully!', 'success')
             return redirect(url_for('admin.users'))
         flash('Error creating user.', 'error')
@@ -319,9 +325,9 @@ def edit_user(user_id):
         return redirect(url_for('admin.users'))
 
     site_id = session['site_id']
-    managers = User.get_all_by_site(site_id, 'manager')
-    departments = Department.get_all(site_id)
-    vendor_companies = VendingCompany.get_all(site_id)
+    managers = SiteDirectory.managers(site_id)
+    departments = SiteDirectory.departments(site_id)
+    vendor_companies = SiteDirectory.companies(site_id)
 
     if request.method == 'POST':
         name = request.form.get('name')
@@ -346,6 +352,8 @@ def edit_user(user_id):
                     {'_id': ObjectId(update_data['department_id'])},
                     {'$set': {'manager_id': ObjectId(user_id)}}
                 )
+            if user.get('role') == 'manager':
+                SiteDirectory.invalidate(site_id)
 
             flash('User updated successfully.', 'success')
             return redirect(url_for('admin.users'))
@@ -385,7 +393,7 @@ def add_vending_company():
 @role_required('admin')
 def add_department():
     site_id = session['site_id']
-    managers = User.get_all_by_site(site_id, 'manager')  # For optional assignment
+    managers = SiteDirectory.managers(site_id)  # For optional assignment
 
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
@@ -404,6 +412,7 @@ def add_department():
                         {'_id': mgr_obj_id},
                         {'$set': {'department_id': new_dept_id}}
                     )
+                    SiteDirectory.invalidate(site_id)
                 flash('Department created successfully.', 'success')
                 return redirect(url_for('admin.add_user'))
             else:
@@ -527,34 +536,92 @@ def deactivate_user():
 def monthly_cycles():
     site_id = session['site_id']
     cycles = MonthlyCycle.get_all(site_id)
+    dirty_counts = MismatchDirtyKey.count_by_month(site_id)
+    for cycle in cycles:
+        cycle['dirty_count'] = dirty_counts.get(cycle['month_year'], 0)
     return render_template('admin/monthly_cycles.html', cycles=cycles)
 
 @admin_bp.route('/upload-monthly-data/<month_year>', methods=['GET', 'POST'])
 @login_required
 @role_required('admin')
 def upload_monthly_data(month_year):
+    site_id = session['site_id']
     if request.method == 'POST':
         data_type = request.form.get('data_type') # swipe/wfh/leave
         file = request.files['file']
-        site_id = session['site_id']
         if file and allowed_file(file.filename):
-            result = DataUploadProcessor.process_upload(file, data_type, month_year, site_id)
-            if result:
-                flash(f'{data_type.title()} data uploaded successfully!', 'success')
-                return redirect(url_for('admin.monthly_cycles'))
-            else:
-                flash(f'Error uploading {data_type} data', 'error')
-    return render_template('admin/upload_monthly_data.html', month_year=month_year)
+            # Processed in the background; the page polls the job for progress
+            job_id = UploadJobRunner.submit(file, data_type, month_year, site_id, session.get('user_id'))
+            if job_id:
+                flash(f'{data_type.title()} file received, processing in the background.', 'info')
+                return redirect(url_for('admin.upload_monthly_data', month_year=month_year, job_id=job_id))
+            flash(f'Error uploading {data_type} data', 'error')
+
+    job = None
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = UploadJob.find_by_id(job_id)
+        if job and job.get('site_id') != site_id:
+            job = None
+    return render_template('admin/upload_monthly_data.html', month_year=month_year, job=job)
+
+@admin_bp.route('/upload-jobs/<job_id>')
+@login_required
+@role_required('admin')
+def upload_job_status(job_id):
+    job = UploadJob.find_by_id(job_id)
+    if not job or job.get('site_id') != session['site_id']:
+        return jsonify({'error': 'Upload job not found'}), 404
+    return jsonify({
+        'id': str(job['_id']),
+        'status': job['status'],
+        'data_type': job['data_type'],
+        'filename': job['filename'],
+        'parsed': job.get('parsed', 0),
+        'inserted': job.get('inserted', 0),
+        'rejected': job.get('rejected', 0),
+        'unmatched': job.get('unmatched', [])[:20],
+        'unchanged': job.get('unchanged', False),
+        'changes': job.get('changes'),
+        'error': job.get('error')
+    })
 
 @admin_bp.route('/process-mismatches/<month_year>', methods=['POST'])
 @login_required
 @role_required('admin')
 def process_mismatches(month_year):
     site_id = session['site_id']
+    if request.form.get('mode') == 'incremental':
+        mismatch_count = MismatchProcessor.detect_incremental(site_id, month_year)
+        flash(f'{mismatch_count} mismatches detected among changed records', 'info')
+        return redirect(url_for('admin.monthly_cycles'))
+    if request.form.get('mode') == 'apply':
+        mismatch_count, reused = MismatchProcessor.apply_preview(site_id, month_year, request.form.get('version'))
+        if not reused:
+            flash('Data changed since the preview; mismatches were detected again', 'warning')
+        flash(f'{mismatch_count} mismatches detected and created', 'info')
+        return redirect(url_for('admin.monthly_cycles'))
     mismatch_count = MismatchProcessor.detect_and_create_mismatches(site_id, month_year)
     flash(f'{mismatch_count} mismatches detected and created', 'info')
     return redirect(url_for('admin.monthly_cycles'))
 
+@admin_bp.route('/mismatch-preview/<month_year>')
+@login_required
+@role_required('admin')
+def preview_mismatches(month_year):
+    site_id = session['site_id']
+    preview = MismatchProcessor.preview_mismatches(site_id, month_year)
+    if preview is None:
+        flash('No monthly cycle found for this month', 'error')
+        return redirect(url_for('admin.monthly_cycles'))
+
+    sections = ('new', 'changed', 'reopened', 'resolved')
+    users = User.get_many_by_ids(set(
+        entry['user_id'] for section in sections for entry in preview[section]
+    ))
+    return render_template('admin/mismatch_preview.html', month_year=month_year,
+                           preview=preview, sections=sections, users=users)
+
 @admin_bp.route('/upload-with-month-selector')
 @login_required
 @role_required('admin')
@@ -588,10 +655,12 @@ def view_mismatches():
     site_id = session.get('site_id')
     mismatches = []
     if site_id:
-        mismatches = MismatchManagement.get_site_mismatches(site_id)
+        mismatches = MismatchManagement.get_site_mismatches(
+            site_id, projection=MismatchManagement.LIST_FIELDS
+        )
+        users = User.get_many_by_ids(set(mismatch['user_id'] for mismatch in mismatches))
         for mismatch in mismatches:
-            user = User.find_by_id(mismatch['user_id'])
-            mismatch['user_info'] = user
+            mismatch['user_info'] = users.get(str(mismatch['user_id']))
     return render_template('admin/mismatches.html', mismatches=mismatches)
 
 @admin_bp.route('/vendor-timesheets')
@@ -600,7 +669,6 @@ def view_mismatches():
 def vendor_timesheets():
     from app.models.timesheet import Timesheet
     from app.models.user import User
-    from app.models.vending_company import VendingCompany
     from io import BytesIO
     import pandas as pd
 
@@ -654,7 +722,7 @@ def vendor_timesheets():
             # Get vending company info
             if vendor.get('vendor_company_id'):
                 if vendor['vendor_company_id'] not in vending_companies_map:
-                    company = company = VendingCompany.find_by_id(vendor['vendor_company_id'])
+                    company = SiteDirectory.company(site_id, vendor['vendor_company_id'])
                     vending_companies_map[vendor['vendor_company_id']] = company
                 
                 company = vending_companies_map.get(vendor['vendor_company_id'])
@@ -667,7 +735,7 @@ def vendor_timesheets():
             ts['vending_company_name'] = 'N/A'
     
     # Get all vending companies for filter dropdown
-    vending_companies = VendingCompany.get_all(site_id)
+    vending_companies = SiteDirectory.companies(site_id)
     
     # Prepare filters for template
     filters = {
@@ -687,7 +755,7 @@ def vendor_timesheets():
 def generate_timesheets():
     site_id = session['site_id']
     months = MonthlyCycle.get_available_months(site_id)
-    vending_companies = VendingCompany.get_all(site_id)
+    vending_companies = SiteDirectory.companies(site_id)
     managers = User.find({'site_id': site_id, 'role': 'manager'})
 
     filters = {
@@ -1,8 +1,7 @@
 """Authentication routes"""
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from app.models.user import User
-from app.models.department import Department
-from app.models.vending_company import VendingCompany
+from app.utils.site_directory import SiteDirectory
 import logging
 
 logger = logging.getLogger(__name__)
@@ -89,7 +88,7 @@ def profile():
 
     if user and user.get('role') == 'vendor':
         # Direct fetch by ID (assuming you have find_by_id implemented)
-        vc = VendingCompany.find_by_id(user.get('vendor_company_id'))
+        vc = SiteDirectory.company(user.get('site_id'), user.get('vendor_company_id'))
         company_name = vc.get('name') if vc else 'N/A'
         user['vendor_company'] = company_name
 
@@ -98,7 +97,7 @@ def profile():
         user['manager_name'] = manager_name
 
     if user and (user.get('role') == 'vendor' or user.get('role') == 'manager'):
-        dept = Department.find_by_id(user.get('department_id'))
+        dept = SiteDirectory.department(user.get('site_id'), user.get('department_id'))
         department_name = f"{dept.get('name')}/{dept.get('subdepartment')}" if dept else 'N/A'
         user['department'] = department_name
         
@@ -1,5 +1,5 @@
 """Manager routes"""
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, stream_template, get_flashed_messages, request, redirect, url_for, session, flash
 from app.models.mismatch import MismatchManagement
 from app.models.user import User
 from app.models.attendance import Attendance
@@ -7,7 +7,7 @@ from app.utils.helpers import login_required, role_required
 from bson.objectid import ObjectId
 from datetime import date
 from app.utils.database import Database
-from app.models.vending_company import VendingCompany
+from app.utils.site_directory import SiteDirectory
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,7 +26,7 @@ def dashboard():
     end_date = request.args.get('end_date', '')
 
     # Get all vendors and apply filter (if implemented) or fetch all
-    team_members = User.get_vendors_by_manager(manager_id)
+    team_members = User.get_vendors_by_manager(manager_id, projection=User.DISPLAY_FIELDS)
 
     vendor_ids = [str(v['_id']) for v in team_members]
 
@@ -41,11 +41,11 @@ def dashboard():
     if start_date and end_date:
         pending_approvals_query['date'] = {'$gte': start_date, '$lte': end_date}
 
-    pending_approvals = Attendance.find(pending_approvals_query)
+    pending_approvals = Attendance.find(pending_approvals_query, projection=Attendance.APPROVAL_FIELDS)
 
+    users = User.get_many_by_ids(set(record['user_id'] for record in pending_approvals))
     for record in pending_approvals:
-        user = User.find_by_id(record['user_id'])
-        record['user_info'] = user
+        record['user_info'] = users.get(str(record['user_id']))
 
     # Optionally filter by employee name in Python if your DB does not support text search
     if employee_filter:
@@ -156,7 +156,7 @@ def team_attendance():
         user_query['vendor_company_id'] = vendor_company_id
 
     team_members = User.find(user_query)
-    vendor_companies = VendingCompany.get_all(site_id)
+    vendor_companies = SiteDirectory.companies(site_id)
     vendor_company_map = {str(vc['_id']): vc['name'] for vc in vendor_companies}
 
     # Prepare attendance aggregation pipeline for all team members
@@ -234,19 +234,24 @@ def mismatches():
     end_date = request.args.get('end_date')
 
     # Fetch all mismatches for team
-    team_mismatches = MismatchManagement.get_team_mismatches(manager_id)
+    team_mismatches = MismatchManagement.get_team_mismatches(
+        manager_id, projection=MismatchManagement.LIST_FIELDS
+    )
     
     # Attach user info and attendance status
     from app.models.user import User
     from app.models.attendance import Attendance
 
+    users = User.get_many_by_ids(set(mismatch['user_id'] for mismatch in team_mismatches))
+
     filtered_mismatches = []
     for mismatch in team_mismatches:
-        user = User.find_by_id(mismatch['user_id'])
+        user = users.get(str(mismatch['user_id']))
         mismatch['user_info'] = user
         attendance_record = Attendance.find_by_user_and_date(
             str(mismatch['user_id']),
-            mismatch['date']
+            mismatch['date'],
+            projection={'status': 1}
         )
         mismatch['attendance_status'] = attendance_record.get('status') if attendance_record else '-'
 
@@ -301,19 +306,24 @@ def team_data():
     manager_id = session['user_id']
 
     # Fetch all vendors under this manager
-    team_members = User.get_vendors_by_manager(manager_id)
+    team_members = User.get_vendors_by_manager(manager_id, projection=User.DISPLAY_FIELDS)
     user_ids = [str(m['_id']) for m in team_members]
 
-    # Fetch attendance records for the team (can be filtered/paginated as needed)
-    attendance_records = Attendance.find({"user_id": {"$in": user_ids}})
-
     # Map user info for attendance records
     user_map = {str(user['_id']): user for user in team_members}
-    for record in attendance_records:
-        record['user_info'] = user_map.get(str(record['user_id']), {})
 
-    return render_template('manager/team_data.html',
-                           attendance_records=attendance_records,
+    def attendance_records():
+        # Streamed from the cursor while the page renders
+        for record in Attendance.iter_find({"user_id": {"$in": user_ids}},
+                                           projection=Attendance.LIST_FIELDS):
+            record['user_info'] = user_map.get(str(record['user_id']), {})
+            yield record
+
+    # Pop flashes before streaming so the cleared session is saved with the headers;
+    # base.html reads the cached list from the request context
+    get_flashed_messages(with_categories=True)
+    return stream_template('manager/team_data.html',
+                           attendance_records=attendance_records(),
                            team_members=team_members)
 
 @manager_bp.route('/monthly-summary')
@@ -322,8 +332,6 @@ def team_data():
 def monthly_summary_report():
     from app.models.user import User
     from app.models.attendance import Attendance
-    from app.models.department import Department
-    from app.models.vending_company import VendingCompany
 
     site_id = session['site_id']
     manager_id = session['user_id']
@@ -352,10 +360,10 @@ def monthly_summary_report():
     vendor_ids = [v['_id'] for v in vendors]
 
     # Fetch vending companies and departments for mapping
-    vending_companies = VendingCompany.get_all(site_id)
+    vending_companies = SiteDirectory.companies(site_id)
     company_map = {str(vc['_id']): vc['name'] for vc in vending_companies}
 
-    departments = Department.get_all(site_id)
+    departments = SiteDirectory.departments(site_id)
     department_map = {str(dept['_id']): dept['name'] for dept in departments}
 
     # Fetch attendance records for all vendors for month
@@ -414,10 +422,8 @@ def vendor_timesheets():
     from bson import ObjectId
     from app.models.timesheet import Timesheet
     from app.models.user import User
-    from app.models.vending_company import VendingCompany
     from flask import send_file
-    import io
-    import pandas as pd
+    from app.utils.export_utils import build_xlsx
 
     manager_id = session['user_id']
     site_id = session['site_id']
@@ -447,13 +453,9 @@ def vendor_timesheets():
 
     # Check if export requested
     if 'export' in request.args:
-        timesheet_data = Timesheet.get_export_data(filters)
-        df = pd.DataFrame(timesheet_data)
-
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='VendorTimesheets')
-        output.seek(0)
+        output = build_xlsx([
+            ('VendorTimesheets', Timesheet.EXPORT_COLUMNS, Timesheet.iter_export_rows(filters))
+        ])
 
         filename = f'vendor_timesheets_{month_year_filter or "all"}.xlsx'
         return send_file(output, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
@@ -462,7 +464,7 @@ def vendor_timesheets():
     timesheets = Timesheet.get_timesheets(filters)
 
     # Get all vending companies for filter dropdown
-    vending_companies = VendingCompany.get_all(site_id)
+    vending_companies = SiteDirectory.companies(site_id)
 
     return render_template('manager/vendor_timesheets.html',
                            timesheets=timesheets,
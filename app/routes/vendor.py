@@ -1,12 +1,15 @@
 """Vendor routes"""
 from bson import ObjectId
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, stream_template, get_flashed_messages, request, redirect, url_for, session, flash
 from app.models.mismatch import MismatchManagement
 from app.models.monthly_cycle import MonthlyCycle
 from app.models.timesheet import Timesheet
 from app.models.user import User
 from app.models.holiday import Holiday
 from app.models.attendance import Attendance
+from app.models.dirty_key import MismatchDirtyKey
+from app.models.monthly_coverage import MonthlyCoverage
+from app.utils.coverage_index import CoverageSourceData
 from app.utils.database import Database
 from app.utils.helpers import login_required, role_required, get_month_calendar, is_working_day
 from datetime import datetime, date, timedelta
@@ -128,8 +131,7 @@ def dashboard():
 @role_required('vendor')
 def my_timesheets():
     from app.models.timesheet import Timesheet
-    from io import BytesIO
-    import pandas as pd
+    from app.utils.export_utils import build_xlsx
     from flask import send_file
     
     user_id = session['user_id']
@@ -145,36 +147,29 @@ def my_timesheets():
     if month_year:
         query['month_year'] = month_year
     
-    timesheets = list(Database.find(Timesheet.COLLECTION, query, sort=[('month_year', -1)]))
-    
     # Check for export request
     if 'export' in request.args:
-        export_data = []
-        for ts in timesheets:
-            work_dates = ts.get('work_dates_hours', {})
-            offset_dates = ts.get('offset_dates_hours', {})
-            
-            for date, hours in work_dates.items():
-                export_data.append({
-                    'Month-Year': ts['month_year'],
-                    'Date': date,
-                    'Hours Worked': hours,
-                    'Type': 'Work'
-                })
-            
-            for date, hours in offset_dates.items():
-                export_data.append({
-                    'Month-Year': ts['month_year'],
-                    'Date': date,
-                    'Hours Worked': hours,
-                    'Type': 'Offset'
-                })
-        
-        df = pd.DataFrame(export_data)
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='My Timesheets')
-        output.seek(0)
+        def export_rows():
+            # The export needs the per-date hours; stream them from the cursor
+            for ts in Database.iter_find(Timesheet.COLLECTION, query, sort=[('month_year', -1)]):
+                for date, hours in ts.get('work_dates_hours', {}).items():
+                    yield {
+                        'Month-Year': ts['month_year'],
+                        'Date': date,
+                        'Hours Worked': hours,
+                        'Type': 'Work'
+                    }
+                for date, hours in ts.get('offset_dates_hours', {}).items():
+                    yield {
+                        'Month-Year': ts['month_year'],
+                        'Date': date,
+                        'Hours Worked': hours,
+                        'Type': 'Offset'
+                    }
+
+        output = build_xlsx([
+            ('My Timesheets', ['Month-Year', 'Date', 'Hours Worked', 'Type'], export_rows())
+        ])
         
         filename = f'my_timesheets_{month_year or "all"}.xlsx'
         return send_file(output, 
@@ -182,6 +177,9 @@ def my_timesheets():
                         as_attachment=True,
                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     
+    # The list only shows totals
+    timesheets = Timesheet.find(query, sort=[('month_year', -1)], projection=Timesheet.SUMMARY_PROJECTION)
+
     return render_template('vendor/my_timesheets.html',
                            timesheets=timesheets,
                            filters=filters)
@@ -273,11 +271,13 @@ def mark_attendance():
             record, month_year,
             swipe_uploaded=swipe_uploaded,
             wfh_uploaded=wfh_uploaded,
-            leave_uploaded=leave_uploaded
+            leave_uploaded=leave_uploaded,
+            batch_filters=MonthlyCycle.active_batch_filters(site_id)
         )
         if mismatch_check:
             # If previously resolved mismatch exists, update it
-            if existing_mismatch and existing_mismatch.get('status') == 'manager_approved':
+            # (mismatches are unique per user and date)
+            if existing_mismatch:
                 mismatch_check['status'] = 'pending'
                 MismatchManagement.update_one(
                     {'_id': existing_mismatch['_id']},
@@ -315,6 +315,9 @@ def mark_attendance():
         Attendance.update_status(user_id, date_str, status, comments, site_id)
         flash('Attendance marked successfully', 'success')
 
+    # Re-checked by the next incremental mismatch detection
+    MismatchDirtyKey.mark(site_id, [(user_id, date_str)], 'attendance')
+
     return redirect(url_for('vendor.dashboard'))
 
 @vendor_bp.route('/calendar')
@@ -333,6 +336,15 @@ def calendar_view():
 
         calendar_data = get_month_calendar(year, month)
 
+        # Uploaded swipe/WFH/leave data per day, from the month's coverage document
+        month_year = f"{year}-{month:02d}"
+        coverage = MonthlyCoverage.find_for_user(site_id, user_id, month_year)
+        coverage_map = {}
+        if coverage:
+            for day in range(1, calendar.monthrange(year, month)[1] + 1):
+                date_str = f"{month_year}-{day:02d}"
+                coverage_map[date_str] = CoverageSourceData.day_summary(coverage, date_str)
+
         # Fetch holidays for the current month (all holidays for the site that match the month)
         holidays = [
             h for h in Holiday.get_all(site_id)
@@ -364,6 +376,7 @@ def calendar_view():
             'vendor/calendar.html',
             calendar_data=calendar_data,
             attendance_map=attendance_map,
+            coverage_map=coverage_map,
             holidays=holidays_dict,
             weekends=weekends,
             prev_month=prev_month,
@@ -386,6 +399,7 @@ def calendar_view():
             'vendor/calendar.html',
             calendar_data=get_month_calendar(datetime.now().year, datetime.now().month),
             attendance_map={},
+            coverage_map={},
             holidays={},
             weekends=set(),
             prev_month=datetime.now().month-1,
@@ -432,9 +446,13 @@ def history():
     if status and status in Attendance.STATUSES:
         query['status'] = status
 
-    records = Attendance.find(query, sort=[('date', -1)])
+    # Streamed from the cursor while the page renders
+    records = Attendance.iter_find(query, sort=[('date', -1)], projection=Attendance.LIST_FIELDS)
 
-    return render_template('vendor/history.html', records=records, statuses=Attendance.STATUSES,
+    # Pop flashes before streaming so the cleared session is saved with the headers;
+    # base.html reads the cached list from the request context
+    get_flashed_messages(with_categories=True)
+    return stream_template('vendor/history.html', records=records, statuses=Attendance.STATUSES,
                            filters={'start_date': start_date, 'end_date': end_date, 'status': status})
 
 @vendor_bp.route('/mismatches')
@@ -442,11 +460,14 @@ def history():
 @role_required('vendor')
 def mismatches():
     user_id = session['user_id']
-    user_mismatches = MismatchManagement.get_user_mismatches(user_id)
+    user_mismatches = MismatchManagement.get_user_mismatches(
+        user_id, projection=MismatchManagement.LIST_FIELDS
+    )
 
     # Attach user info if needed
+    users = User.get_many_by_ids(set(mismatch['user_id'] for mismatch in user_mismatches))
     for mismatch in user_mismatches:
-        mismatch['user_info'] = User.find_by_id(mismatch['user_id'])
+        mismatch['user_info'] = users.get(str(mismatch['user_id']))
 
     return render_template('vendor/mismatches.html', mismatches=user_mismatches)
 
@@ -0,0 +1,183 @@
+# app/utils/coverage_index.py
+"""Builds and reads the per user-month MonthlyCoverage documents"""
+import calendar
+import logging
+
+from bson import ObjectId
+
+from app.models.attendance import Attendance
+from app.models.monthly_coverage import MonthlyCoverage
+from app.models.monthly_cycle import MonthlyCycle
+from app.models.user import User
+from app.utils.mismatch_source_data import MismatchSourceData
+
+logger = logging.getLogger(__name__)
+
+
+class CoverageIndex:
+    """
+    Keeps MonthlyCoverage in step with the active uploads of each
+    site-month. The cycle's coverage_signature records the upload state
+    the documents were built from; readers rebuild when it is out of date.
+    """
+
+    @staticmethod
+    def signature(cycle):
+        """Identifies the active upload of every data type of a cycle"""
+        upload_status = cycle.get('data_upload_status', {})
+        parts = []
+        for data_type in MonthlyCycle.DATA_TYPES:
+            status = upload_status.get(data_type, {})
+            parts.append(f"{data_type}:{status.get('batch_id')}:{status.get('file_hash')}:{status.get('uploaded_at')}")
+        return "|".join(parts)
+
+    @classmethod
+    def _site_user_ids(cls, site_id, month_year):
+        """Site users plus anyone with attendance in the month, as ObjectIds"""
+        user_ids = set(user['_id'] for user in User.find({'site_id': site_id}, projection={'_id': 1}))
+        attendance = Attendance.find(
+            {"site_id": site_id, "date": {"$regex": f"^{month_year}"}},
+            projection={'user_id': 1}
+        )
+        for record in attendance:
+            try:
+                user_ids.add(ObjectId(record['user_id']))
+            except Exception:
+                continue
+        return user_ids
+
+    @classmethod
+    def build_documents(cls, site_id, month_year, user_ids):
+        """Coverage documents for the users that have any uploaded data in the month"""
+        source_data = MismatchSourceData.load(user_ids, month_year, MonthlyCycle.active_batch_filters(site_id))
+        year, month = map(int, month_year.split('-'))
+        days_in_month = calendar.monthrange(year, month)[1]
+
+        documents = []
+        for user_id in user_ids:
+            swipe_hours = [None] * MonthlyCoverage.DAYS
+            leave_hours = [0] * MonthlyCoverage.DAYS
+            wfh_mask = 0
+            for day in range(1, days_in_month + 1):
+                date_str = f"{month_year}-{day:02d}"
+                swipe = source_data.find_swipe(user_id, date_str)
+                if swipe:
+                    swipe_hours[day - 1] = swipe.get('total_hours', 0)
+                if source_data.find_wfh(user_id, date_str):
+                    wfh_mask |= 1 << (day - 1)
+                leave_hours[day - 1] = source_data.total_leave_hours_in_window(user_id, date_str)
+
+            if wfh_mask or any(hours is not None for hours in swipe_hours) or any(leave_hours):
+                documents.append({
+                    "site_id": site_id,
+                    "user_id": ObjectId(user_id),
+                    "month_year": month_year,
+                    "swipe_hours": swipe_hours,
+                    "wfh_mask": wfh_mask,
+                    "leave_hours": leave_hours
+                })
+        return documents
+
+    @classmethod
+    def rebuild(cls, site_id, month_year, user_ids=None):
+        """
+        Rebuild the coverage of a site-month, or only of user_ids when just
+        their data changed. Returns the number of documents written.
+        """
+        cycle = MonthlyCycle.get_by_month(site_id, month_year)
+        if not cycle:
+            return 0
+
+        if user_ids is None:
+            documents = cls.build_documents(site_id, month_year, cls._site_user_ids(site_id, month_year))
+            written = MonthlyCoverage.replace_month(site_id, month_year, documents)
+        else:
+            user_ids = set(ObjectId(str(user_id)) for user_id in user_ids)
+            documents = cls.build_documents(site_id, month_year, user_ids)
+            written = MonthlyCoverage.replace_users(site_id, month_year, documents, user_ids)
+
+        # Signature of the state read above: an upload activated meanwhile
+        # changes the cycle, so the next reader rebuilds again
+        MonthlyCycle.set_coverage_signature(site_id, month_year, cls.signature(cycle))
+        return written
+
+    @classmethod
+    def refresh_after_upload(cls, site_id, month_year, previous_cycle, dirty_keys):
+        """
+        Bring coverage up to date after an upload. dirty_keys (from
+        DataUploadProcessor) limits the rebuild to the users it names when
+        the coverage was current before the upload; None rebuilds everything.
+        """
+        try:
+            current = previous_cycle and previous_cycle.get('coverage_signature') == cls.signature(previous_cycle)
+            if dirty_keys is not None and current:
+                return cls.rebuild(site_id, month_year, set(user_id for user_id, _ in dirty_keys))
+            return cls.rebuild(site_id, month_year)
+        except Exception as e:
+            # Detection rebuilds stale coverage itself, so the upload stands
+            logger.error(f"Coverage rebuild failed for {site_id} {month_year}: {e}")
+            return 0
+
+    @classmethod
+    def load(cls, site_id, month_year, cycle=None, user_ids=None):
+        """
+        CoverageSourceData for a site-month (only user_ids' documents if
+        given), rebuilding the month first if it is out of date
+        """
+        cls.ensure_current(site_id, month_year, cycle)
+        return CoverageSourceData(MonthlyCoverage.find_by_month(site_id, month_year, user_ids), month_year)
+
+    @classmethod
+    def ensure_current(cls, site_id, month_year, cycle=None):
+        """Rebuild the coverage of a site-month if its uploads changed since it was built"""
+        cycle = cycle or MonthlyCycle.get_by_month(site_id, month_year)
+        if cycle and cycle.get('coverage_signature') != cls.signature(cycle):
+            cls.rebuild(site_id, month_year)
+
+
+class CoverageSourceData:
+    """
+    Drop-in for MismatchSourceData when checking records of one month,
+    answering from MonthlyCoverage documents.
+    """
+
+    def __init__(self, documents, month_year):
+        self.month_year = month_year
+        self.by_user = {str(document['user_id']): document for document in documents}
+
+    def _slot(self, user_id, date_str):
+        document = self.by_user.get(str(user_id))
+        if document is None or not date_str.startswith(self.month_year):
+            return None, None
+        return document, int(date_str[8:10]) - 1
+
+    def find_swipe(self, user_id, date_str):
+        """{'total_hours': hours} if a swipe record exists for the day, else None"""
+        document, slot = self._slot(user_id, date_str)
+        if document is None or document['swipe_hours'][slot] is None:
+            return None
+        return {'total_hours': document['swipe_hours'][slot]}
+
+    def find_wfh(self, user_id, date_str):
+        """True if a WFH record covers the day, else None"""
+        document, slot = self._slot(user_id, date_str)
+        if document is None or not document['wfh_mask'] & (1 << slot):
+            return None
+        return True
+
+    def total_leave_hours_in_window(self, user_id, date_str):
+        """Leave hours between 6AM and 7PM of the day"""
+        document, slot = self._slot(user_id, date_str)
+        if document is None:
+            return 0
+        return document['leave_hours'][slot]
+
+    @staticmethod
+    def day_summary(document, date_str):
+        """Swipe hours, WFH flag and leave hours of one day of a coverage document"""
+        slot = int(date_str[8:10]) - 1
+        return {
+            'swipe_hours': document['swipe_hours'][slot],
+            'wfh': bool(document['wfh_mask'] & (1 << slot)),
+            'leave_hours': document['leave_hours'][slot]
+        }
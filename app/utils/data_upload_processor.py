@@ -1,11 +1,19 @@
 # app/utils/data_upload_processor.py
+import hashlib
+import json
 import pandas as pd
+import threading
+from bson.objectid import ObjectId
 from datetime import datetime
+from openpyxl import load_workbook
 from app.models.swipe_data import SwipeData
 from app.models.wfh_data import WFHData
 from app.models.leave_data import LeaveData
 from app.models.user import User
 from app.models.monthly_cycle import MonthlyCycle
+from app.models.dirty_key import MismatchDirtyKey
+from app.utils.coverage_index import CoverageIndex
+from app.utils.database import Database
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,281 +21,549 @@ logger = logging.getLogger(__name__)
 class DataUploadProcessor:
     """Process CSV/Excel data uploads for swipe, WFH, and leave data"""
 
+    # Rows parsed and inserted per batch, so memory stays bounded by the
+    # chunk rather than the file
+    CHUNK_SIZE = 5000
+
+    # Re-uploads changing more rows than this are written as a new batch
+    # instead of being applied as a delta to the active one
+    DELTA_MAX_ROWS = 5000
+
+    # Identifier columns read as text so codes like '00123' survive
+    TEXT_COLUMNS = {'Employee Code': str, 'Personnel Number': str}
+
+    # data_type -> (model, required columns, chunk parser, label for logs)
+    SOURCES = {
+        'swipe_data': (
+            SwipeData,
+            ['Employee Code', 'Employee Name', 'Attendance Date', 'Login', 'Logout', 'Total Working Hours'],
+            '_parse_swipe_chunk', 'Swipe data'
+        ),
+        'wfh_data': (
+            WFHData,
+            ['Name', 'Start Date', 'End Date', 'Duration'],
+            '_parse_wfh_chunk', 'WFH data'
+        ),
+        'leave_data': (
+            LeaveData,
+            ['Personnel Number', 'Start Date', 'End Date', 'Attendance or Absence Type',
+             'Start Time', 'End Time', 'Days'],
+            '_parse_leave_chunk', 'Leave data'
+        ),
+    }
+
     @classmethod
-    def process_upload(cls, file, data_type, month_year, site_id):
-        """Main method to process file upload based on data type"""
+    def process_upload(cls, file, data_type, month_year, site_id, progress=None):
+        """
+        Main method to process file upload based on data type.
+        progress, if given, is called as progress(parsed, inserted, rejected)
+        with running totals after each chunk.
+
+        A file identical to the active upload is a no-op. Otherwise, if the
+        site-month already has an active batch, only the rows that differ
+        from it are inserted or removed (see _apply_delta). Large changes and
+        first uploads are written as a new batch that is swapped in at once.
+        The result's dirty_keys lists the (user_id, date) pairs whose source
+        data changed, or is None when everything must be treated as changed.
+        """
         try:
-            # Read file based on extension
-            if file.filename.endswith('.csv'):
-                df = pd.read_csv(file)
-            elif file.filename.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file)
-            else:
+            if data_type not in cls.SOURCES:
+                return {'success': False, 'error': 'Invalid data type'}
+
+            # Resolve employees against one site-wide lookup instead of per row
+            user_maps = cls._load_user_maps(site_id)
+            file_hash = cls._file_hash(file, user_maps)
+
+            # Read file based on extension, one chunk at a time
+            frames = cls._iter_frames(file)
+            if frames is None:
                 return {'success': False, 'error': 'Unsupported file format'}
 
-            if data_type == 'swipe_data':
-                result = cls._process_swipe_data(df, month_year, site_id)
-            elif data_type == 'wfh_data':
-                result = cls._process_wfh_data(df, month_year, site_id)
-            elif data_type == 'leave_data':
-                result = cls._process_leave_data(df, month_year, site_id)
+            cycle = MonthlyCycle.get_by_month(site_id, month_year)
+            active = (cycle or {}).get('data_upload_status', {}).get(data_type, {})
+
+            if active.get('batch_id') and active.get('file_hash') == file_hash:
+                logger.info(f"{data_type} for {site_id} {month_year} is identical to the active upload; skipped")
+                return {'success': True, 'count': 0, 'unchanged': True, 'unmatched': [], 'dirty_keys': []}
+
+            if active.get('batch_id'):
+                result = cls._apply_delta(frames, data_type, month_year, site_id, active['batch_id'], user_maps, progress)
+                if result is not None:
+                    if result['success']:
+                        MonthlyCycle.record_upload(site_id, month_year, data_type, file_hash)
+                        CoverageIndex.refresh_after_upload(site_id, month_year, cycle, result['dirty_keys'])
+                        MismatchDirtyKey.mark(site_id, result['dirty_keys'], 'upload')
+                    return result
+                # Too much changed for a delta: re-read the file as a new batch
+                frames = cls._iter_frames(cls._rewind(file))
+
+            # Rows are written under a new batch id that readers ignore until
+            # the monthly cycle is switched over to it
+            model = cls.SOURCES[data_type][0]
+            batch_id = ObjectId()
+            result = cls._ingest(frames, data_type, month_year, site_id, batch_id, user_maps, progress)
+
+            if not result['success']:
+                cls._drop_in_background(model.delete_batch, batch_id)
+                return result
+
+            # Swap the site-month over to the new batch, then drop the old one
+            if not cycle:
+                MonthlyCycle.create_cycle(site_id, month_year)
+            previous_batch_id = MonthlyCycle.activate_batch(site_id, month_year, data_type, batch_id, file_hash)
+
+            if previous_batch_id:
+                cls._drop_in_background(model.delete_batch, previous_batch_id)
             else:
-                return {'success': False, 'error': 'Invalid data type'}
-
-            # Update monthly cycle upload status
-            if result['success']:
-                cycle = MonthlyCycle.get_by_month(site_id, month_year)
-                if not cycle:
-                    MonthlyCycle.create_cycle(site_id, month_year)
-                MonthlyCycle.update_upload_status(site_id, month_year, data_type)
+                site_user_ids = [user['_id'] for user in user_maps['users']]
+                cls._drop_in_background(model.delete_unbatched_month, site_user_ids, month_year)
 
+            result['batch_id'] = str(batch_id)
+            result['dirty_keys'] = None
+            CoverageIndex.refresh_after_upload(site_id, month_year, cycle, None)
+            MonthlyCycle.set_full_mismatch_scan_required(site_id, month_year)
             return result
 
         except Exception as e:
             logger.error(f"Error processing upload: {str(e)}")
             return {'success': False, 'error': str(e)}
 
-    @classmethod
-    def _process_swipe_data(cls, df, month_year, site_id):
-        """Process swipe data CSV/Excel file"""
-        try:
-            # Clear existing data for the month
-            SwipeData.delete_by_month(month_year)
-
-            processed_count = 0
-            swipe_records = []
-
-            # Expected columns (adjust based on your CSV format)
-            required_columns = ['Employee Code', 'Employee Name', 'Attendance Date', 'Login', 'Logout', 'Total Working Hours']
-
-            # Validate columns
-            if not all(col in df.columns for col in required_columns):
-                missing_cols = [col for col in required_columns if col not in df.columns]
-                return {'success': False, 'error': f'Missing columns: {missing_cols}'}
-
-            for _, row in df.iterrows():
-                employee_code = str(row['Employee Code'])
-                user = User.find_by_employee_code(employee_code)
-
-                if not user:
-                    logger.warning(f"User not found for employee code: {employee_code}")
-                    continue
-
-                # Parse date
-                try:
-                    if isinstance(row['Attendance Date'], str):
-                        # Handle different date formats
-                        if len(row['Attendance Date']) == 6:  # DDMMYY
-                            date_str = row['Attendance Date']
-                            date_obj = datetime.strptime(f"20{date_str[4:]}-{date_str[2:4]}-{date_str[:2]}", "%Y-%m-%d")
-                        else:
-                            date_obj = pd.to_datetime(row['Attendance Date'])
-                    else:
-                        date_obj = pd.to_datetime(row['Attendance Date'])
-
-                    date_str = date_obj.strftime("%Y-%m-%d")
-                except:
-                    logger.warning(f"Invalid date format for {employee_code}: {row['Attendance Date']}")
-                    continue
-
-                # Parse login/logout times
-                login_time = cls._parse_time(row['Login'])
-                logout_time = cls._parse_time(row['Logout'])
-
-                # Parse total hours
-                try:
-                    total_hours = float(row['Total Working Hours'])
-                except:
-                    total_hours = 0.0
-
-                swipe_record = {
-                    'employee_code': employee_code,
-                    'user_id': user['_id'],
-                    'date': date_str,
-                    'login': login_time,
-                    'logout': logout_time,
-                    'total_hours': total_hours,
-                    'month_year': month_year,
-                    'uploaded_at': datetime.utcnow()
-                }
-
-                swipe_records.append(swipe_record)
-                processed_count += 1
+    @staticmethod
+    def _rewind(file):
+        """Seek an uploaded file back to its start so it can be read again"""
+        getattr(file, 'stream', file).seek(0)
+        return file
 
-            # Bulk insert records
-            if swipe_records:
-                SwipeData.bulk_insert(swipe_records)
+    @classmethod
+    def _file_hash(cls, file, user_maps):
+        """
+        sha256 of the uploaded file's bytes and of the employees its rows are
+        resolved against, so the same file re-uploaded after a user was added
+        is not skipped. Leaves the file rewound.
+        """
+        stream = getattr(file, 'stream', file)
+        digest = hashlib.sha256()
+        stream.seek(0)
+        for block in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(block)
+        stream.seek(0)
+        employees = sorted((str(user['_id']), str(user.get('employee_code')), str(user.get('name'))) for user in user_maps['users'])
+        digest.update(json.dumps(employees).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _row_hash(record):
+        """Fingerprint of a parsed row's content, ignoring upload metadata"""
+        content = {
+            key: value for key, value in record.items()
+            if key not in ('_id', 'uploaded_at', 'site_id', 'batch_id', 'row_hash')
+        }
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
 
-            return {'success': True, 'count': processed_count}
+    @classmethod
+    def _dirty_keys(cls, records, month_year):
+        """(user_id, date) pairs within month_year covered by swipe, WFH or leave records"""
+        keys = set()
+        for record in records:
+            user_id = str(record['user_id'])
+            if 'date' in record:
+                keys.add((user_id, record['date']))
+                continue
+            for day in pd.date_range(record['start_date'], record['end_date']):
+                date_str = day.strftime("%Y-%m-%d")
+                if date_str.startswith(month_year):
+                    keys.add((user_id, date_str))
+        return keys
 
-        except Exception as e:
-            logger.error(f"Error processing swipe data: {str(e)}")
-            return {'success': False, 'error': str(e)}
+    @classmethod
+    def _iter_frames(cls, file, chunk_size=None):
+        """
+        DataFrames of at most chunk_size rows read from an uploaded file, or
+        None for an unsupported format. Legacy .xls files cannot be streamed
+        and are read in one piece.
+        """
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        if file.filename.endswith('.csv'):
+            return pd.read_csv(file, dtype=cls.TEXT_COLUMNS, chunksize=chunk_size)
+        elif file.filename.endswith('.xlsx'):
+            return cls._iter_xlsx(getattr(file, 'stream', file), chunk_size)
+        elif file.filename.endswith('.xls'):
+            return iter([pd.read_excel(file)])
+        return None
 
     @classmethod
-    def _process_wfh_data(cls, df, month_year, site_id):
-        """Process WFH data CSV/Excel file"""
+    def _iter_xlsx(cls, stream, chunk_size):
+        """Read the first sheet with openpyxl in read-only mode, chunk_size rows at a time"""
+        workbook = load_workbook(stream, read_only=True, data_only=True)
         try:
-            # Clear existing data for the month
-            WFHData.delete_by_month(month_year)
-
-            processed_count = 0
-            wfh_records = []
-
-            # Expected columns (adjust based on your CSV format)
-            required_columns = ['Name', 'Start Date', 'End Date', 'Duration']
-
-            # Validate columns
-            if not all(col in df.columns for col in required_columns):
-                missing_cols = [col for col in required_columns if col not in df.columns]
-                return {'success': False, 'error': f'Missing columns: {missing_cols}'}
-
-            for _, row in df.iterrows():
-                employee_name = str(row['Name']).strip()
-
-                # Find user by name (you might want to use employee code instead)
-                user = User.find_one({'name': {'$regex': employee_name, '$options': 'i'}})
-
-                if not user:
-                    logger.warning(f"User not found for name: {employee_name}")
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [name if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
+
+            batch = []
+            for row in rows:
+                if all(value is None for value in row):
                     continue
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    yield pd.DataFrame(batch, columns=columns)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=columns)
+        finally:
+            workbook.close()
 
-                # Parse date
-                try:
-                    start_date_obj = pd.to_datetime(row['Start Date'])
-                    start_date_str = start_date_obj.strftime("%Y-%m-%d")
-                    end_date_obj = pd.to_datetime(row['End Date'])
-                    end_date_str = end_date_obj.strftime("%Y-%m-%d")
-                except:
-                    logger.warning(f"Invalid date format for {employee_name}: {row['Start Date']}")
-                    continue
-
-                # Parse duration
-                try:
-                    duration = float(row['Duration'])
-                except:
-                    duration = 0.5  # Default half day
-
-                wfh_record = {
-                    'employee_code': user.get('employee_code', ''),
-                    'user_id': user['_id'],
-                    'start_date': start_date_str,
-                    'end_date': end_date_str,
-                    'duration': duration,
-                    'month_year': month_year,
-                    'uploaded_at': datetime.utcnow()
-                }
+    @classmethod
+    def _iter_record_chunks(cls, frames, data_type, month_year, user_maps, totals):
+        """
+        Validate the first chunk's columns (ValueError if any are missing),
+        then yield the parsed, fingerprinted records of each chunk. Running
+        parsed/accepted counts and unmatched identifiers go into totals.
+        """
+        required_columns, parser = cls.SOURCES[data_type][1:3]
+        parse_chunk = getattr(cls, parser)
+        validated = False
 
-                wfh_records.append(wfh_record)
-                processed_count += 1
+        try:
+            for df in frames:
+                if not validated:
+                    # Validate columns
+                    missing_cols = [col for col in required_columns if col not in df.columns]
+                    if missing_cols:
+                        raise ValueError(f'Missing columns: {missing_cols}')
+                    validated = True
+
+                records, chunk_unmatched = parse_chunk(df, month_year, user_maps)
+                for record in records:
+                    record['row_hash'] = cls._row_hash(record)
+                totals['parsed'] += len(df)
+                totals['accepted'] += len(records)
+                totals['unmatched'].update(chunk_unmatched)
+                yield records
+        finally:
+            close = getattr(frames, 'close', None)
+            if close:
+                close()
+
+        if not validated:
+            raise ValueError(f'Missing columns: {required_columns}')
 
-            # Bulk insert records
-            if wfh_records:
-                WFHData.bulk_insert(wfh_records)
+    @classmethod
+    def _ingest(cls, frames, data_type, month_year, site_id, batch_id, user_maps, progress=None):
+        """Parse each chunk as it is read and insert its rows tagged with site_id and batch_id"""
+        model, label = cls.SOURCES[data_type][0], cls.SOURCES[data_type][3]
+        totals = {'parsed': 0, 'accepted': 0, 'unmatched': set()}
 
-            return {'success': True, 'count': processed_count}
+        try:
+            for records in cls._iter_record_chunks(frames, data_type, month_year, user_maps, totals):
+                for record in records:
+                    record['site_id'] = site_id
+                    record['batch_id'] = batch_id
+                if records:
+                    model.bulk_insert(records)
+                if progress:
+                    progress(totals['parsed'], totals['accepted'], totals['parsed'] - totals['accepted'])
+
+            unmatched = cls._report_unmatched(label, sorted(totals['unmatched']))
+            return {'success': True, 'count': totals['accepted'], 'unmatched': unmatched}
 
         except Exception as e:
-            logger.error(f"Error processing WFH data: {str(e)}")
+            logger.error(f"Error processing {label}: {str(e)}")
             return {'success': False, 'error': str(e)}
 
     @classmethod
-    def _process_leave_data(cls, df, month_year, site_id):
-        """Process leave data CSV/Excel file with AM/PM time parsing"""
+    def _apply_delta(cls, frames, data_type, month_year, site_id, batch_id, user_maps, progress=None):
+        """
+        Diff the upload against the active batch by row fingerprint (as a
+        multiset, so repeated identical rows are counted) and apply only the
+        difference to that batch. Returns None without writing anything when
+        the active batch has no fingerprints or more than DELTA_MAX_ROWS rows
+        would change; the caller then uploads a new batch instead.
+        """
+        model, label = cls.SOURCES[data_type][0], cls.SOURCES[data_type][3]
+        key_fields = {'user_id': 1, 'date': 1, 'start_date': 1, 'end_date': 1}
+
+        existing = {}
+        for doc in Database.iter_find(model.COLLECTION, {'batch_id': batch_id}, projection={'row_hash': 1}):
+            if not doc.get('row_hash'):
+                return None
+            existing.setdefault(doc['row_hash'], []).append(doc['_id'])
+
+        totals = {'parsed': 0, 'accepted': 0, 'unmatched': set()}
+        added = []
         try:
-            # Clear existing data for the month
-            LeaveData.delete_by_month(month_year)
-
-            processed_count = 0
-            leave_records = []
-
-            required_columns = ['Personnel Number', 'Start Date', 'End Date', 'Attendance or Absence Type',
-                                'Start Time', 'End Time', 'Days']
-
-            if not all(col in df.columns for col in required_columns):
-                missing_cols = [col for col in required_columns if col not in df.columns]
-                return {'success': False, 'error': f'Missing columns: {missing_cols}'}
-
-            def parse_time_ampm(time_str):
-                try:
-                    return datetime.strptime(time_str.strip(), '%I:%M %p').time()
-                except Exception as e:
-                    logger.warning(f"Error parsing time '{time_str}': {e}")
-                    return datetime.strptime('00:00', '%H:%M').time()
-
-            for _, row in df.iterrows():
-                employee_code = str(row['Personnel Number'])
-                user = User.find_by_employee_code(employee_code)
-                if not user:
-                    logger.warning(f"User not found for employee code: {employee_code}")
-                    continue
+            for records in cls._iter_record_chunks(frames, data_type, month_year, user_maps, totals):
+                for record in records:
+                    matches = existing.get(record['row_hash'])
+                    if matches:
+                        matches.pop()
+                    else:
+                        added.append(record)
+                if len(added) > cls.DELTA_MAX_ROWS:
+                    return None
+                if progress:
+                    progress(totals['parsed'], totals['accepted'], totals['parsed'] - totals['accepted'])
+        except Exception as e:
+            logger.error(f"Error processing {label}: {str(e)}")
+            return {'success': False, 'error': str(e)}
 
-                try:
-                    start_date = pd.to_datetime(row['Start Date']).strftime("%Y-%m-%d")
-                    end_date = pd.to_datetime(row['End Date']).strftime("%Y-%m-%d")
+        removed_ids = [doc_id for ids in existing.values() for doc_id in ids]
+        if len(removed_ids) > cls.DELTA_MAX_ROWS:
+            return None
+        removed = Database.find(model.COLLECTION, {'_id': {'$in': removed_ids}}, projection=key_fields) if removed_ids else []
+
+        for record in added:
+            record['site_id'] = site_id
+            record['batch_id'] = batch_id
+        if added:
+            model.bulk_insert(added)
+        if removed_ids:
+            Database.delete_many(model.COLLECTION, {'_id': {'$in': removed_ids}})
+
+        # A row whose key is both added and removed was changed
+        row_key = lambda record: (str(record['user_id']), record.get('date') or record.get('start_date'))
+        added_keys = set(row_key(record) for record in added)
+        removed_keys = set(row_key(record) for record in removed)
+
+        unmatched = cls._report_unmatched(label, sorted(totals['unmatched']))
+        return {
+            'success': True,
+            'count': totals['accepted'],
+            'inserted': len(added_keys - removed_keys),
+            'changed': len(added_keys & removed_keys),
+            'removed': len(removed_keys - added_keys),
+            'unmatched': unmatched,
+            'dirty_keys': sorted(cls._dirty_keys(added, month_year) | cls._dirty_keys(removed, month_year))
+        }
 
-                    start_time_str = str(row.get('Start Time', '12:00 AM')).strip()
-                    end_time_str = str(row.get('End Time', '11:59 PM')).strip()
+    @classmethod
+    def _drop_in_background(cls, delete, *args):
+        """Run a batch delete on a daemon thread so the upload can return"""
+        def run():
+            try:
+                deleted = delete(*args)
+                logger.info(f"{delete.__qualname__} removed {deleted} records")
+            except Exception as e:
+                logger.error(f"{delete.__qualname__} failed: {e}")
 
-                    start_time = parse_time_ampm(start_time_str)
-                    end_time = parse_time_ampm(end_time_str)
+        threading.Thread(target=run, daemon=True).start()
 
-                except Exception as e:
-                    logger.warning(f"Invalid date/time for {employee_code}: {e}")
-                    continue
+    @classmethod
+    def _load_user_maps(cls, site_id):
+        """
+        Load the site's users once and index them by employee code and by
+        normalized name. When two users share a name the first one wins,
+        like the single-document lookup it replaces.
+        """
+        by_code = {}
+        by_name = {}
+        users = User.find({'site_id': site_id}, projection={'_id': 1, 'employee_code': 1, 'name': 1})
+        for user in users:
+            if user.get('employee_code'):
+                by_code.setdefault(str(user['employee_code']), user)
+            if user.get('name'):
+                name_key = cls._normalize_name(user['name'])
+                if name_key in by_name:
+                    logger.warning(f"Several users in site {site_id} are named '{user['name']}'; using the first")
+                by_name.setdefault(name_key, user)
+        return {'users': users, 'by_code': by_code, 'by_name': by_name}
+
+    @staticmethod
+    def _normalize_name(name):
+        """Case- and whitespace-insensitive key for matching names"""
+        return ' '.join(str(name).split()).casefold()
 
-                leave_type = str(row['Attendance or Absence Type'])
-                try:
-                    duration = float(row['Days'])
-                except:
-                    duration = 1.0
+    @classmethod
+    def _report_unmatched(cls, data_type, unmatched):
+        """Log the identifiers that matched no user, once per upload"""
+        if unmatched:
+            logger.warning(f"{data_type}: no user found for {len(unmatched)} entries: {', '.join(unmatched[:20])}")
+        return unmatched
 
-                is_full_day = duration >= 1.0
+    @classmethod
+    def _parse_swipe_chunk(cls, df, month_year, user_maps):
+        """Swipe rows -> (records, unmatched employee codes), column-wise"""
+        users_by_code = user_maps['by_code']
+
+        records = pd.DataFrame({'employee_code': df['Employee Code'].astype(str)})
+        user_ids = records['employee_code'].map(
+            lambda code: users_by_code[code]['_id'] if code in users_by_code else None
+        )
+        unmatched = set(records['employee_code'][user_ids.isna()])
+
+        dates = cls._parse_dates(df['Attendance Date'])
+        bad_dates = dates.isna() & user_ids.notna()
+        if bad_dates.any():
+            logger.warning(f"Invalid date format in {int(bad_dates.sum())} swipe rows, e.g. {df['Attendance Date'][bad_dates].iloc[0]!r}")
+
+        records['user_id'] = user_ids
+        records['date'] = dates.dt.strftime("%Y-%m-%d")
+        records['login'] = cls._parse_times(df['Login'])
+        records['logout'] = cls._parse_times(df['Logout'])
+        records['total_hours'] = cls._parse_hours(df['Total Working Hours'])
+        records['month_year'] = month_year
+        records['uploaded_at'] = datetime.utcnow()
+
+        records = records[user_ids.notna() & dates.notna()]
+        return records.to_dict('records'), unmatched
 
-                leave_record = {
-                    'employee_code': employee_code,
-                    'user_id': user['_id'],
-                    'start_date': start_date,
-                    'start_time': str(start_time),
-                    'end_date': end_date,
-                    'end_time': str(end_time),
-                    'leave_type': leave_type,
-                    'duration': duration,
-                    'is_full_day': is_full_day,
-                    'month_year': month_year,
-                    'uploaded_at': datetime.utcnow()
-                }
+    @classmethod
+    def _parse_wfh_chunk(cls, df, month_year, user_maps):
+        """WFH rows -> (records, unmatched names)"""
+        wfh_records = []
+        unmatched = set()
+
+        for _, row in df.iterrows():
+            employee_name = str(row['Name']).strip()
+
+            # Find user by name (you might want to use employee code instead)
+            user = user_maps['by_name'].get(cls._normalize_name(employee_name))
+
+            if not user:
+                unmatched.add(employee_name)
+                continue
+
+            # Parse date
+            try:
+                start_date_obj = pd.to_datetime(row['Start Date'])
+                start_date_str = start_date_obj.strftime("%Y-%m-%d")
+                end_date_obj = pd.to_datetime(row['End Date'])
+                end_date_str = end_date_obj.strftime("%Y-%m-%d")
+            except:
+                logger.warning(f"Invalid date format for {employee_name}: {row['Start Date']}")
+                continue
+
+            # Parse duration
+            try:
+                duration = float(row['Duration'])
+            except:
+                duration = 0.5  # Default half day
+
+            wfh_record = {
+                'employee_code': user.get('employee_code', ''),
+                'user_id': user['_id'],
+                'start_date': start_date_str,
+                'end_date': end_date_str,
+                'duration': duration,
+                'month_year': month_year,
+                'uploaded_at': datetime.utcnow()
+            }
+
+            wfh_records.append(wfh_record)
+
+        return wfh_records, unmatched
 
-                leave_records.append(leave_record)
-                processed_count += 1
+    @classmethod
+    def _parse_leave_chunk(cls, df, month_year, user_maps):
+        """Leave rows -> (records, unmatched employee codes), with AM/PM time parsing"""
+        leave_records = []
+        unmatched = set()
+
+        def parse_time_ampm(time_str):
+            try:
+                return datetime.strptime(time_str.strip(), '%I:%M %p').time()
+            except Exception as e:
+                logger.warning(f"Error parsing time '{time_str}': {e}")
+                return datetime.strptime('00:00', '%H:%M').time()
+
+        for _, row in df.iterrows():
+            employee_code = str(row['Personnel Number'])
+            user = user_maps['by_code'].get(employee_code)
+            if not user:
+                unmatched.add(employee_code)
+                continue
+
+            try:
+                start_date = pd.to_datetime(row['Start Date']).strftime("%Y-%m-%d")
+                end_date = pd.to_datetime(row['End Date']).strftime("%Y-%m-%d")
+
+                start_time_str = str(row.get('Start Time', '12:00 AM')).strip()
+                end_time_str = str(row.get('End Time', '11:59 PM')).strip()
+
+                start_time = parse_time_ampm(start_time_str)
+                end_time = parse_time_ampm(end_time_str)
+
+            except Exception as e:
+                logger.warning(f"Invalid date/time for {employee_code}: {e}")
+                continue
+
+            leave_type = str(row['Attendance or Absence Type'])
+            try:
+                duration = float(row['Days'])
+            except:
+                duration = 1.0
+
+            is_full_day = duration >= 1.0
+
+            leave_record = {
+                'employee_code': employee_code,
+                'user_id': user['_id'],
+                'start_date': start_date,
+                'start_time': str(start_time),
+                'start_ts': LeaveData.to_minutes(start_date, str(start_time)),
+                'end_date': end_date,
+                'end_time': str(end_time),
+                'end_ts': LeaveData.to_minutes(end_date, str(end_time)),
+                'leave_type': leave_type,
+                'duration': duration,
+                'is_full_day': is_full_day,
+                'month_year': month_year,
+                'uploaded_at': datetime.utcnow()
+            }
+
+            leave_records.append(leave_record)
+
+        return leave_records, unmatched
 
-            if leave_records:
-                LeaveData.bulk_insert(leave_records)
+    @classmethod
+    def _parse_dates(cls, values):
+        """
+        Parse a date column to datetimes; unparseable values become NaT.
+        Six-character strings are DDMMYY, anything else is left to pandas.
+        """
+        is_ddmmyy = values.map(lambda v: isinstance(v, str) and len(v) == 6)
+        dates = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+
+        if is_ddmmyy.any():
+            compact = values[is_ddmmyy]
+            dates[is_ddmmyy] = pd.to_datetime(
+                '20' + compact.str[4:] + compact.str[2:4] + compact.str[:2],
+                format='%Y%m%d', errors='coerce'
+            )
+        if (~is_ddmmyy).any():
+            dates[~is_ddmmyy] = pd.to_datetime(values[~is_ddmmyy], format='mixed', errors='coerce')
+        return dates
 
-            return {'success': True, 'count': processed_count}
+    @classmethod
+    def _parse_times(cls, values):
+        """Parse a time column (HHMMSS, HHMM or HH:MM[:SS]) to HH:MM strings"""
+        text = values.astype(str).str.strip()
+        lengths = text.str.len()
+        parts = text.str.split(':')
 
-        except Exception as e:
-            logger.error(f"Error processing leave data: {str(e)}")
-            return {'success': False, 'error': str(e)}
+        has_colon = text.str.contains(':', regex=False)
 
+        times = pd.Series("00:00", index=values.index)
+        times[lengths == 4] = text.str[:2] + ':' + text.str[2:]
+        times[lengths == 6] = text.str[:2] + ':' + text.str[2:4]
+        times[has_colon] = parts[has_colon].str[0] + ':' + parts[has_colon].str[1]
+        times[values.isna()] = "00:00"
+        return times
 
     @classmethod
-    def _parse_time(cls, time_value):
-        """Parse time value to HH:MM format"""
-        if pd.isna(time_value):
-            return "00:00"
-
-        try:
-            # Handle different time formats
-            time_str = str(time_value).strip()
-
-            if len(time_str) == 6:  # HHMMSS
-                return f"{time_str[:2]}:{time_str[2:4]}"
-            elif len(time_str) == 4:  # HHMM
-                return f"{time_str[:2]}:{time_str[2:]}"
-            elif ':' in time_str:  # Already formatted
-                return time_str.split(':')[0] + ':' + time_str.split(':')[1]
-            else:
-                return "00:00"
-        except:
-            return "00:00"
+    def _parse_hours(cls, values):
+        """
+        Parse a duration column to float hours. HH:MM[:SS] values go through
+        pd.to_timedelta, plain numbers are taken as hours, the rest is 0.
+        """
+        hours = pd.to_numeric(values, errors='coerce')
+
+        text = values.astype(str).str.strip()
+        clock = hours.isna() & text.str.contains(':', regex=False)
+        if clock.any():
+            clock_text = text[clock].where(text[clock].str.count(':') > 1, text[clock] + ':00')
+            hours[clock] = pd.to_timedelta(clock_text, errors='coerce').dt.total_seconds() / 3600
+
+        return hours.fillna(0.0).astype(float)
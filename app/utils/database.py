@@ -1,5 +1,7 @@
 """Database connection and utilities"""
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from app.utils.query_stats import instrumented
 import logging
 from datetime import datetime
 
@@ -10,6 +12,8 @@ class Database:
 
     URI = None
     DATABASE = None
+    # Documents fetched per round trip by iter_find
+    DEFAULT_BATCH_SIZE = 500
 
     @staticmethod
     def initialize(uri):
@@ -31,6 +35,7 @@ class Database:
         return Database.DATABASE[collection_name]
 
     @staticmethod
+    @instrumented('insert_one')
     def insert_one(collection_name, document):
         """Insert a single document"""
         try:
@@ -45,21 +50,23 @@ class Database:
             return None
 
     @staticmethod
-    def find_one(collection_name, query):
-        """Find a single document"""
+    @instrumented('find_one')
+    def find_one(collection_name, query, projection=None):
+        """Find a single document, optionally limited to the projected fields"""
         try:
             collection = Database.get_collection(collection_name)
-            return collection.find_one(query)
+            return collection.find_one(query, projection)
         except Exception as e:
             logger.error(f"Find one error in {collection_name}: {e}")
             return None
 
     @staticmethod
-    def find(collection_name, query=None, sort=None, limit=None):
-        """Find multiple documents"""
+    @instrumented('find')
+    def find(collection_name, query=None, sort=None, limit=None, projection=None):
+        """Find multiple documents, optionally limited to the projected fields"""
         try:
             collection = Database.get_collection(collection_name)
-            cursor = collection.find(query or {})
+            cursor = collection.find(query or {}, projection)
             if sort:
                 cursor = cursor.sort(sort)
             if limit:
@@ -70,23 +77,158 @@ class Database:
             return []
 
     @staticmethod
-    def update_one(collection_name, query, update):
-        """Update a single document"""
+    @instrumented('iter_find')
+    def iter_find(collection_name, query=None, sort=None, limit=None, projection=None, batch_size=None):
+        """
+        Like find, but yields documents as the cursor fetches them, batch_size
+        documents per round trip, instead of materializing a list.
+        """
         try:
             collection = Database.get_collection(collection_name)
-            update.setdefault('$set', {})['updated_at'] = datetime.utcnow()
-            result = collection.update_one(query, update)
+            cursor = collection.find(query or {}, projection)
+            cursor = cursor.batch_size(batch_size or Database.DEFAULT_BATCH_SIZE)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+        except Exception as e:
+            logger.error(f"Find error in {collection_name}: {e}")
+            return
+
+        try:
+            for document in cursor:
+                yield document
+        except Exception as e:
+            logger.error(f"Cursor error in {collection_name}: {e}")
+        finally:
+            cursor.close()
+
+    @staticmethod
+    @instrumented('update_one')
+    def update_one(collection_name, query, update, upsert=False):
+        """Update a single document (inserting it if upsert and none matches)"""
+        try:
+            collection = Database.get_collection(collection_name)
+            update.setdefault('$set', {}).setdefault('updated_at', datetime.utcnow())
+            result = collection.update_one(query, update, upsert=upsert)
+            if result.upserted_id is not None:
+                return 1
             return result.modified_count
         except Exception as e:
             logger.error(f"Update error in {collection_name}: {e}")
             return 0
 
     @staticmethod
-    def aggregate(collection_name, pipeline):
-        """Run aggregation pipeline on a collection"""
+    @instrumented('update_many')
+    def update_many(collection_name, query, update):
+        """Update all documents matching query"""
         try:
             collection = Database.get_collection(collection_name)
-            return list(collection.aggregate(pipeline))
+            update.setdefault('$set', {}).setdefault('updated_at', datetime.utcnow())
+            result = collection.update_many(query, update)
+            return result.modified_count
+        except Exception as e:
+            logger.error(f"Update many error in {collection_name}: {e}")
+            return 0
+
+    @staticmethod
+    @instrumented('find_one_and_update')
+    def find_one_and_update(collection_name, query, update, projection=None):
+        """Atomically update one document and return it as it was before the update"""
+        try:
+            collection = Database.get_collection(collection_name)
+            update.setdefault('$set', {}).setdefault('updated_at', datetime.utcnow())
+            return collection.find_one_and_update(query, update, projection=projection)
+        except Exception as e:
+            logger.error(f"Find one and update error in {collection_name}: {e}")
+            return None
+
+    @staticmethod
+    @instrumented('delete_many')
+    def delete_many(collection_name, query):
+        """Delete all documents matching query"""
+        try:
+            collection = Database.get_collection(collection_name)
+            result = collection.delete_many(query)
+            return result.deleted_count
+        except Exception as e:
+            logger.error(f"Delete many error in {collection_name}: {e}")
+            return 0
+
+    @staticmethod
+    @instrumented('bulk_write')
+    def bulk_write(collection_name, operations, ordered=False, batch_size=1000):
+        """
+        Send write operations (pymongo UpdateOne, InsertOne, ...) in batches.
+        Returns a dict with the summed upserted/modified/inserted counts.
+        """
+        totals = {'inserted': 0, 'upserted': 0, 'modified': 0, 'deleted': 0}
+        if not operations:
+            return totals
+        try:
+            collection = Database.get_collection(collection_name)
+            for start in range(0, len(operations), batch_size):
+                batch = operations[start:start + batch_size]
+                try:
+                    result = collection.bulk_write(batch, ordered=ordered)
+                except BulkWriteError as e:
+                    logger.error(f"Bulk write error in {collection_name}: {e.details.get('writeErrors', [])[:5]}")
+                    details = e.details
+                    totals['inserted'] += details.get('nInserted', 0)
+                    totals['upserted'] += details.get('nUpserted', 0)
+                    totals['modified'] += details.get('nModified', 0)
+                    totals['deleted'] += details.get('nRemoved', 0)
+                    continue
+                totals['inserted'] += result.inserted_count
+                totals['upserted'] += result.upserted_count
+                totals['modified'] += result.modified_count
+                totals['deleted'] += result.deleted_count
+        except Exception as e:
+            logger.error(f"Bulk write error in {collection_name}: {e}")
+        return totals
+
+    @staticmethod
+    @instrumented('aggregate')
+    def aggregate(collection_name, pipeline, allow_disk_use=False):
+        """Run aggregation pipeline on a collection (spilling to disk if allow_disk_use)"""
+        try:
+            collection = Database.get_collection(collection_name)
+            return list(collection.aggregate(pipeline, allowDiskUse=allow_disk_use))
         except Exception as e:
             logger.error(f"Aggregate error in {collection_name}: {e}")
             return []
+
+    @staticmethod
+    @instrumented('aggregate_into')
+    def aggregate_into(collection_name, pipeline):
+        """
+        Run a pipeline ending in $merge or $out for its writes. Returns
+        True if it ran, False (after logging) if it failed.
+        """
+        try:
+            collection = Database.get_collection(collection_name)
+            collection.aggregate(pipeline).close()
+            return True
+        except Exception as e:
+            logger.error(f"Aggregate error in {collection_name}: {e}")
+            return False
+
+    @staticmethod
+    @instrumented('count_documents')
+    def count_documents(collection_name, query=None):
+        """Number of documents matching query"""
+        try:
+            collection = Database.get_collection(collection_name)
+            return collection.count_documents(query or {})
+        except Exception as e:
+            logger.error(f"Count error in {collection_name}: {e}")
+            return 0
+
+    @staticmethod
+    @instrumented('drop_collection')
+    def drop_collection(collection_name):
+        """Drop a collection (a no-op if it does not exist)"""
+        try:
+            Database.get_collection(collection_name).drop()
+        except Exception as e:
+            logger.error(f"Drop error in {collection_name}: {e}")
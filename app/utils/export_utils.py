@@ -0,0 +1,25 @@
+"""Spreadsheet export helpers"""
+from io import BytesIO
+from openpyxl import Workbook
+
+
+def build_xlsx(sheets):
+    """
+    Build an .xlsx file from (sheet_name, columns, rows) tuples.
+
+    rows may be any iterable of dicts (e.g. a generator over a cursor); each
+    row is written as soon as it is produced, using openpyxl's write-only
+    mode, so rows are never collected into a list or DataFrame first.
+    Missing keys are written as empty cells. Returns a BytesIO at offset 0.
+    """
+    workbook = Workbook(write_only=True)
+    for sheet_name, columns, rows in sheets:
+        worksheet = workbook.create_sheet(title=sheet_name)
+        worksheet.append(columns)
+        for row in rows:
+            worksheet.append([row.get(column) for column in columns])
+
+    output = BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
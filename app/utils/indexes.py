@@ -0,0 +1,145 @@
+# app/utils/indexes.py
+"""Index registry: applies and verifies the INDEXES declared on each model"""
+from pymongo.errors import OperationFailure
+from app.utils.database import Database
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def registered_models():
+    """Model classes that declare INDEXES"""
+    from app.models.attendance import Attendance
+    from app.models.attendance_offset import AttendanceOffset
+    from app.models.department import Department
+    from app.models.dirty_key import MismatchDirtyKey
+    from app.models.holiday import Holiday
+    from app.models.leave_data import LeaveData
+    from app.models.mismatch import MismatchManagement
+    from app.models.monthly_coverage import MonthlyCoverage
+    from app.models.monthly_cycle import MonthlyCycle
+    from app.models.swipe_data import SwipeData
+    from app.models.system_config import SystemConfig
+    from app.models.timesheet import Timesheet
+    from app.models.upload_job import UploadJob
+    from app.models.user import User
+    from app.models.vending_company import VendingCompany
+    from app.models.wfh_data import WFHData
+
+    return [
+        Attendance, AttendanceOffset, Department, Holiday, LeaveData,
+        MismatchDirtyKey, MismatchManagement, MonthlyCoverage, MonthlyCycle,
+        SwipeData, SystemConfig, Timesheet, UploadJob, User, VendingCompany,
+        WFHData
+    ]
+
+
+class IndexManager:
+    """Create and report on the indexes declared by the models"""
+
+    @classmethod
+    def declared_indexes(cls):
+        """Map collection name -> list of IndexModel declared for it"""
+        declared = {}
+        for model in registered_models():
+            declared.setdefault(model.COLLECTION, []).extend(getattr(model, 'INDEXES', []))
+        return declared
+
+    @classmethod
+    def ensure_indexes(cls):
+        """
+        Create every declared index that does not exist yet, after each
+        model's prepare_indexes() (e.g. removing rows a unique index would
+        reject), if it has one.
+        Returns (applied, failed): collection -> list of index names created
+        or confirmed, and collection -> {index name: {'error', 'unique'}}
+        for indexes that could not be built. A failing index does not stop
+        the others.
+        """
+        for model in registered_models():
+            prepare = getattr(model, 'prepare_indexes', None)
+            if prepare is not None:
+                try:
+                    prepare()
+                except Exception as e:
+                    logger.error(f"Preparing indexes of {model.COLLECTION} failed: {e}")
+
+        applied = {}
+        failed = {}
+        for collection_name, indexes in cls.declared_indexes().items():
+            collection = Database.get_collection(collection_name)
+            applied[collection_name] = []
+            for index in indexes:
+                name = index.document['name']
+                try:
+                    collection.create_indexes([index])
+                    applied[collection_name].append(name)
+                except OperationFailure as e:
+                    logger.error(f"Could not create index {name} on {collection_name}: {e}")
+                    failed.setdefault(collection_name, {})[name] = {
+                        'error': str(e),
+                        'unique': bool(index.document.get('unique'))
+                    }
+        return applied, failed
+
+    @staticmethod
+    def unique_failures(failed):
+        """'collection.index' names of the unique indexes in an ensure_indexes failure map"""
+        return sorted(
+            f"{collection_name}.{name}"
+            for collection_name, indexes in failed.items()
+            for name, failure in indexes.items() if failure['unique']
+        )
+
+    @staticmethod
+    def _normalize_keys(keys):
+        """Key spec as a list of (field, direction) with integer directions"""
+        return [
+            (field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in keys
+        ]
+
+    @classmethod
+    def verify(cls):
+        """
+        Compare declared indexes with the database.
+
+        Returns a dict collection -> {
+            'missing': declared index names not present (or with other keys),
+            'unused': existing index names with zero recorded accesses,
+            'undeclared': existing index names not in the registry
+        }
+        Access counts come from $indexStats and reset when mongod restarts.
+        """
+        report = {}
+        for collection_name, indexes in cls.declared_indexes().items():
+            collection = Database.get_collection(collection_name)
+            existing = {
+                name: cls._normalize_keys(info['key'])
+                for name, info in collection.index_information().items()
+            }
+
+            missing = []
+            for index in indexes:
+                name = index.document['name']
+                keys = cls._normalize_keys(index.document['key'].items())
+                if name not in existing or existing[name] != keys:
+                    missing.append(name)
+
+            unused = []
+            try:
+                for stats in collection.aggregate([{"$indexStats": {}}]):
+                    if stats['name'] != '_id_' and stats.get('accesses', {}).get('ops', 0) == 0:
+                        unused.append(stats['name'])
+            except OperationFailure as e:
+                logger.warning(f"$indexStats unavailable for {collection_name}: {e}")
+
+            declared_names = set(index.document['name'] for index in indexes)
+            undeclared = [name for name in existing if name != '_id_' and name not in declared_names]
+
+            report[collection_name] = {
+                'missing': missing,
+                'unused': sorted(unused),
+                'undeclared': sorted(undeclared)
+            }
+        return report
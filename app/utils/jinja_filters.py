@@ -1,3 +1,31 @@
+from flask import g, has_app_context
+
+
+def _index_by_str_id(collection):
+    """
+    Map str(_id) -> first item with that id, built once per collection per
+    request. Cached on g by id(collection); the collection itself is kept
+    in the cache entry so its id cannot be reused while the request lives.
+    """
+    if not has_app_context():
+        return _build_index(collection)
+
+    cache = g.get('jinja_id_indexes')
+    if cache is None:
+        cache = g.jinja_id_indexes = {}
+    entry = cache.get(id(collection))
+    if entry is None or entry[0] is not collection:
+        entry = cache[id(collection)] = (collection, _build_index(collection))
+    return entry[1]
+
+
+def _build_index(collection):
+    index = {}
+    for item in collection:
+        index.setdefault(str(item.get('_id')), item)
+    return index
+
+
 def lookup_name_by_id(collection, id_str, default='N/A'):
     """
     Lookup the 'name' field in a collection by its id string.
@@ -5,10 +33,10 @@ def lookup_name_by_id(collection, id_str, default='N/A'):
     """
     if not id_str:
         return default
-    for item in collection:
-        if str(item.get('_id')) == str(id_str):
-            return item.get('name') or default
-    return default
+    item = _index_by_str_id(collection).get(str(id_str))
+    if item is None:
+        return default
+    return item.get('name') or default
 
 
 def lookup_department_by_id(departments, id_str, default='N/A'):
@@ -17,12 +45,12 @@ def lookup_department_by_id(departments, id_str, default='N/A'):
     """
     if not id_str:
         return default
-    for dept in departments:
-        if str(dept.get('_id')) == str(id_str):
-            name = dept.get('name', default)
-            subdept = dept.get('subdepartment')
-            return f"{name}/{subdept}" if subdept else name
-    return default
+    dept = _index_by_str_id(departments).get(str(id_str))
+    if dept is None:
+        return default
+    name = dept.get('name', default)
+    subdept = dept.get('subdepartment')
+    return f"{name}/{subdept}" if subdept else name
 
 def find_by_str_id(collection, id_str):
     """
@@ -31,7 +59,6 @@ def find_by_str_id(collection, id_str):
     """
     if not id_str or not collection:
         return None
-    for item in collection:
-        if str(item.get('_id')) == id_str:
-            return item
-    return None
+    if not isinstance(id_str, str):
+        return None
+    return _index_by_str_id(collection).get(id_str)
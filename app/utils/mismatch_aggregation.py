@@ -0,0 +1,356 @@
+# app/utils/mismatch_aggregation.py
+"""Mismatch detection as MongoDB aggregation pipelines run by the server"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.enums.mismatch_types import MismatchType
+from app.models.attendance import Attendance
+from app.models.leave_data import LeaveData
+from app.models.mismatch import MismatchManagement
+from app.models.swipe_data import SwipeData
+from app.models.wfh_data import WFHData
+from app.utils.database import Database
+from app.utils.mismatch_processor import MismatchProcessor
+from app.utils.mismatch_rules import MISMATCH_RULES
+
+logger = logging.getLogger(__name__)
+
+MINUTE_MS = 60 * 1000
+
+
+def _minutes(date_expression, time_expression=None):
+    """Expression: minutes since LeaveData.EPOCH of a 'YYYY-MM-DD' (plus 'HH:MM[:SS]') string"""
+    date_string = date_expression
+    if time_expression is not None:
+        date_string = {"$concat": [date_expression, "T", time_expression]}
+    return {"$divide": [
+        {"$toLong": {"$dateFromString": {"dateString": date_string, "timezone": "UTC", "onError": None}}},
+        MINUTE_MS
+    ]}
+
+
+def _user_date_match(batch_filter, *conditions):
+    """$lookup $match on the joined user plus conditions, limited to the active batches"""
+    match = dict(batch_filter or {})
+    match["$expr"] = {"$and": [{"$eq": ["$user_id", "$$user_id"]}, *conditions]}
+    return {"$match": match}
+
+
+def _covers_date():
+    return [{"$lte": ["$start_date", "$$date"]}, {"$gte": ["$end_date", "$$date"]}]
+
+
+def _swipe_lookup(batch_filter):
+    return {"$lookup": {
+        "from": SwipeData.COLLECTION,
+        "let": {"user_id": "$_user_id", "date": "$date"},
+        "pipeline": [
+            _user_date_match(batch_filter, {"$eq": ["$date", "$$date"]}),
+            {"$limit": 1},
+            {"$project": {"_id": 0, "total_hours": {"$ifNull": ["$total_hours", 0]}}}
+        ],
+        "as": "_swipe"
+    }}
+
+
+def _wfh_lookup(batch_filter):
+    return {"$lookup": {
+        "from": WFHData.COLLECTION,
+        "let": {"user_id": "$_user_id", "date": "$date"},
+        "pipeline": [
+            _user_date_match(batch_filter, *_covers_date()),
+            {"$limit": 1},
+            {"$project": {"_id": 1}}
+        ],
+        "as": "_wfh"
+    }}
+
+
+def _leave_lookup(batch_filter):
+    # Same interval as LeaveData.interval: start_ts/end_ts, or the strings
+    # of records stored before them
+    start = {"$ifNull": ["$start_ts", _minutes("$start_date", {"$ifNull": ["$start_time", "00:00:00"]})]}
+    end = {"$ifNull": ["$end_ts", _minutes("$end_date", {"$ifNull": ["$end_time", "23:59:00"]})]}
+    return {"$lookup": {
+        "from": LeaveData.COLLECTION,
+        "let": {"user_id": "$_user_id", "date": "$date",
+                "window_start": "$_window_start", "window_end": "$_window_end"},
+        "pipeline": [
+            _user_date_match(batch_filter, *_covers_date()),
+            {"$project": {"_id": 0, "minutes": {"$max": [0, {"$subtract": [
+                {"$min": [end, "$$window_end"]},
+                {"$max": [start, "$$window_start"]}
+            ]}]}}}
+        ],
+        "as": "_leave"
+    }}
+
+
+def _found(mismatch_type, expected, actual):
+    return {"type": mismatch_type, "expected": expected, "actual": actual}
+
+
+def _pending_check(rule, threshold):
+    return {"$literal": _found(MismatchType.PENDING_STATUS.value, {}, {})}
+
+
+def _swipe_check(rule, threshold):
+    hours = {"$arrayElemAt": ["$_swipe.total_hours", 0]}
+    expected = {"$literal": {"swipe_hours": threshold}}
+    return {"$cond": [
+        {"$eq": [{"$size": "$_swipe"}, 0]},
+        {"$literal": _found(MismatchType.NO_SWIPE.value, {"swipe_hours": threshold}, {"swipe_hours": 0})},
+        {"$cond": [
+            {"$lt": [hours, threshold]},
+            {"type": rule["short"].value, "expected": expected, "actual": {"swipe_hours": hours}},
+            None
+        ]}
+    ]}
+
+
+def _wfh_check(rule, threshold):
+    return {"$cond": [
+        {"$eq": [{"$size": "$_wfh"}, 0]},
+        {"$literal": _found(MismatchType.NO_WFH.value, {"wfh_required": True}, {"wfh_present": False})},
+        None
+    ]}
+
+
+def _leave_check(rule, threshold):
+    expected = {"leave_hours_6AM_to_7PM": rule["expected_hours"]}
+    return {"$cond": [
+        {"$eq": ["$_leave_hours", 0]},
+        {"$literal": _found(MismatchType.NO_LEAVE.value, expected, {"leave_hours_present_6AM_to_7PM": 0})},
+        {"$cond": [
+            {"$lt": ["$_leave_hours", threshold]},
+            {"type": rule["short"].value, "expected": {"$literal": expected},
+             "actual": {"leave_hours_present_6AM_to_7PM": "$_leave_hours"}},
+            None
+        ]}
+    ]}
+
+
+# The same checks as app.utils.mismatch_rules.CHECK_BUILDERS, as expressions
+# evaluating to {type, expected, actual} or null
+CHECK_EXPRESSIONS = {
+    "pending": _pending_check,
+    "swipe": _swipe_check,
+    "wfh": _wfh_check,
+    "leave": _leave_check
+}
+
+LOOKUPS = {
+    "swipe": ("swipe_data", _swipe_lookup),
+    "wfh": ("wfh_data", _wfh_lookup),
+    "leave": ("leave_data", _leave_lookup)
+}
+
+
+class MismatchAggregation:
+    """
+    Detects a site-month's mismatches inside MongoDB. MISMATCH_RULES
+    compiles to one pipeline per attendance status that joins only the
+    sources its checks read ($lookup with let/pipeline, limited to the
+    active upload batches) and evaluates the checks as expressions. Results
+    collect in a run collection and are $merge'd into mismatches and
+    attendance with the same effect as the bulk Python engine.
+    """
+
+    RUN_COLLECTION_PREFIX = "mismatch_run_"
+
+    @classmethod
+    def status_pipeline(cls, site_id, month_year, status, status_rules, settings, uploaded, batch_filters):
+        """
+        Pipeline over attendance yielding one document per mismatched record
+        of the status, or None when no check of the status applies
+        """
+        rules = [rule for rule in status_rules if uploaded[rule["source"]]]
+        if not rules:
+            return None
+
+        pipeline = [
+            {"$match": {"site_id": site_id, "date": {"$regex": f"^{month_year}"}, "status": status}},
+            {"$set": {
+                "_user_id": {"$convert": {"input": "$user_id", "to": "objectId", "onError": None, "onNull": None}},
+                "_window_start": {"$add": [_minutes("$date"), MismatchProcessor.LEAVE_WINDOW_START]},
+                "_window_end": {"$add": [_minutes("$date"), MismatchProcessor.LEAVE_WINDOW_END]}
+            }}
+        ]
+        for source in dict.fromkeys(rule["source"] for rule in rules):
+            if source in LOOKUPS:
+                data_type, lookup = LOOKUPS[source]
+                pipeline.append(lookup(batch_filters.get(data_type)))
+        if any(rule["source"] == "leave" for rule in rules):
+            pipeline.append({"$set": {"_leave_hours": {"$divide": [{"$sum": "$_leave.minutes"}, 60]}}})
+
+        checks = []
+        for rule in rules:
+            threshold = settings.get(*rule["threshold"]) if "threshold" in rule else None
+            checks.append(CHECK_EXPRESSIONS[rule["source"]](rule, threshold))
+
+        pipeline += [
+            {"$set": {"_found": {"$filter": {"input": checks, "cond": {"$ne": ["$$this", None]}}}}},
+            {"$match": {"_found.0": {"$exists": True}}},
+            {"$project": {
+                "site_id": {"$toObjectId": "$site_id"},
+                "user_id": "$_user_id",
+                "date": 1,
+                "month_year": {"$substrCP": ["$date", 0, 7]},
+                "mismatch_type": "$_found.type",
+                "original_status": "$status",
+                "expected_data": "$_found.expected",
+                "actual_data": "$_found.actual"
+            }}
+        ]
+        return pipeline
+
+    @classmethod
+    def detect(cls, site_id, month_year, settings, uploaded_flags, batch_filters):
+        """
+        Run every status pipeline into a new run collection, keyed by the
+        attendance _id. Returns its name, or None if a pipeline failed.
+        """
+        swipe_uploaded, wfh_uploaded, leave_uploaded = uploaded_flags
+        uploaded = {"pending": True, "swipe": swipe_uploaded, "wfh": wfh_uploaded, "leave": leave_uploaded}
+        run_collection = f"{cls.RUN_COLLECTION_PREFIX}{ObjectId()}"
+
+        for status, status_rules in MISMATCH_RULES.items():
+            pipeline = cls.status_pipeline(site_id, month_year, status, status_rules, settings, uploaded, batch_filters)
+            if pipeline is None:
+                continue
+            pipeline.append({"$merge": {"into": run_collection, "whenMatched": "replace", "whenNotMatched": "insert"}})
+            if not Database.aggregate_into(Attendance.COLLECTION, pipeline):
+                Database.drop_collection(run_collection)
+                return None
+        return run_collection
+
+    @classmethod
+    def write_mismatches(cls, run_collection, deadline_days=7):
+        """
+        $merge a run collection into mismatches and flag the attendance
+        records, like MismatchManagement.bulk_upsert_mismatches and
+        Attendance.mark_many_as_mismatch. Returns True if both ran.
+        """
+        now = datetime.utcnow()
+        changed_fields = {
+            field: f"$$new.{field}"
+            for field in ("site_id", "month_year", "mismatch_type", "original_status",
+                          "expected_data", "actual_data", "status", "updated_at")
+        }
+        mismatches_written = Database.aggregate_into(run_collection, [
+            {"$project": {
+                "_id": 0,
+                "site_id": 1, "user_id": 1, "date": 1, "month_year": 1, "mismatch_type": 1,
+                "original_status": 1, "expected_data": 1, "actual_data": 1,
+                "status": {"$literal": "pending"},
+                "updated_at": {"$literal": now},
+                "deadline": {"$literal": now + timedelta(days=deadline_days)},
+                "created_at": {"$literal": now}
+            }},
+            {"$merge": {
+                "into": MismatchManagement.COLLECTION,
+                "on": ["user_id", "date"],
+                # Unchanged types are left alone; changed ones keep their
+                # deadline, creation time and resolution fields
+                "whenMatched": [{"$replaceWith": {"$cond": [
+                    {"$eq": ["$mismatch_type", "$$new.mismatch_type"]},
+                    "$$ROOT",
+                    {"$mergeObjects": ["$$ROOT", changed_fields]}
+                ]}}],
+                "whenNotMatched": "insert"
+            }}
+        ])
+        attendance_flagged = Database.aggregate_into(run_collection, [
+            {"$project": {"_id": 1, "is_mismatch": {"$literal": True}, "updated_at": {"$literal": now}}},
+            {"$merge": {"into": Attendance.COLLECTION, "on": "_id",
+                        "whenMatched": "merge", "whenNotMatched": "discard"}}
+        ])
+        return mismatches_written and attendance_flagged
+
+    @classmethod
+    def detect_and_write(cls, site_id, month_year, settings, uploaded_flags, batch_filters):
+        """
+        Detect and write a site-month's mismatches on the server. Returns
+        the mismatch count, or None if any pipeline (detection or writes)
+        failed, so the caller can rerun the month with the Python engine;
+        its bulk upserts are idempotent over partial writes.
+        """
+        run_collection = cls.detect(site_id, month_year, settings, uploaded_flags, batch_filters)
+        if run_collection is None:
+            return None
+        try:
+            mismatch_count = Database.count_documents(run_collection)
+            if not cls.write_mismatches(run_collection):
+                logger.error(f"Writing aggregated mismatches failed for {site_id} {month_year}")
+                return None
+            return mismatch_count
+        finally:
+            Database.drop_collection(run_collection)
+
+    @classmethod
+    def benchmark(cls, site_id, month_year, repeat=3):
+        """
+        Time detection of a site-month by the Python bulk engine and by the
+        pipelines, without writing mismatches, and compare what they find.
+        Returns {'python': seconds, 'aggregation': seconds, 'count': {...},
+        'differing': [(user_id, date), ...]} with the best of repeat runs;
+        None if the month has no cycle or a pipeline failed.
+        """
+        from app.models.monthly_cycle import MonthlyCycle
+        from app.models.system_config import SystemConfig
+        from app.utils.coverage_index import CoverageIndex
+        from app.utils.mismatch_rules import MismatchRules
+
+        cycle = MonthlyCycle.get_by_month(site_id, month_year)
+        if not cycle:
+            return None
+        settings = SystemConfig.get_snapshot()
+        uploaded_flags = MismatchProcessor._uploaded_flags(cycle)
+        batch_filters = MonthlyCycle.active_batch_filters(site_id)
+        # Coverage is maintained by uploads, so a stale month is not timed
+        CoverageIndex.ensure_current(site_id, month_year, cycle)
+
+        def key(mismatch):
+            return (str(mismatch['user_id']), mismatch['date'])
+
+        def result(mismatch):
+            return (mismatch['mismatch_type'], mismatch['expected_data'], mismatch['actual_data'])
+
+        timings = {'python': [], 'aggregation': []}
+        found = {}
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            rules = MismatchRules.compile(settings, *uploaded_flags)
+            detected, _ = MismatchProcessor.collect_mismatches(
+                month_year,
+                Attendance.find({"site_id": site_id, "date": {"$regex": f"^{month_year}"}}),
+                CoverageIndex.load(site_id, month_year, cycle),
+                rules
+            )
+            timings['python'].append(time.perf_counter() - started)
+            found['python'] = {key(mismatch): result(mismatch) for mismatch in detected}
+
+            started = time.perf_counter()
+            run_collection = cls.detect(site_id, month_year, settings, uploaded_flags, batch_filters)
+            if run_collection is None:
+                return None
+            try:
+                detected = Database.find(run_collection)
+            finally:
+                Database.drop_collection(run_collection)
+            timings['aggregation'].append(time.perf_counter() - started)
+            found['aggregation'] = {key(mismatch): result(mismatch) for mismatch in detected}
+
+        python_found, aggregation_found = found['python'], found['aggregation']
+        return {
+            'python': min(timings['python']),
+            'aggregation': min(timings['aggregation']),
+            'count': {engine: len(results) for engine, results in found.items()},
+            'differing': sorted(
+                k for k in set(python_found) | set(aggregation_found)
+                if python_found.get(k) != aggregation_found.get(k)
+            )
+        }
@@ -1,47 +1,315 @@
 # app/utils/mismatch_processor.py
-from datetime import datetime , time, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+import zlib
 from bson import ObjectId
+from app.models.dirty_key import MismatchDirtyKey
 from app.models.mismatch import MismatchManagement
 from app.models.attendance import Attendance
 from app.models.monthly_cycle import MonthlyCycle
-from app.models.swipe_data import SwipeData
-from app.models.wfh_data import WFHData
 from app.models.leave_data import LeaveData
 from app.models.system_config import SystemConfig
 from app.utils.database import Database
-from app.enums.mismatch_types import MismatchType
+from app.utils.coverage_index import CoverageIndex
+from app.utils.mismatch_rules import MISMATCH_RULES, MismatchRules
+from app.utils.mismatch_source_data import DatabaseSourceData
+
+logger = logging.getLogger(__name__)
+
+
+def _init_detection_worker(uri):
+    """Process pool initializer: every detection worker opens its own MongoClient"""
+    Database.initialize(uri)
+
+
+def _detect_partition(site_id, month_year, user_ids, settings, uploaded_flags):
+    """Run in a detection worker: bulk detection for one partition of users"""
+    return MismatchProcessor._detect_users(site_id, month_year, user_ids, settings, uploaded_flags)
+
 
 class MismatchProcessor:
     """Process and detect mismatches between attendance and uploaded data"""
 
+    # Worker processes for `flask mismatches detect`; web requests always
+    # detect in-process
+    DETECTION_WORKERS = 1
+    # Months with fewer attendance records than this are not worth splitting
+    PARALLEL_MIN_RECORDS = 5000
+
+    # 'python' checks records in this process; 'aggregation' runs bulk
+    # detection as MongoDB pipelines (see MismatchAggregation)
+    ENGINE = 'python'
+
+    # How long a dry run (preview_mismatches) is kept for apply_preview
+    PREVIEW_TTL_SECONDS = 15 * 60
+
+    _previews = {}
+    _previews_lock = threading.Lock()
+
+    # Leave hours are counted between 6:00 AM and 7:00 PM (minutes into the day)
+    LEAVE_WINDOW_START = 6 * 60
+    LEAVE_WINDOW_END = 19 * 60
+
     @classmethod
-    def detect_and_create_mismatches(cls, site_id, month_year):
+    def detect_and_create_mismatches(cls, site_id, month_year, bulk=True, settings=None, workers=1):
+        """
+        Detect mismatches for every attendance record of a site-month.
+
+        With bulk=True the month's swipe, WFH and leave data for the site's
+        users is read once from MonthlyCoverage (see CoverageIndex) instead
+        of being queried per record, and results are written as unordered
+        bulk upserts plus one attendance update; the detected mismatches are
+        identical either way. Thresholds come from one SystemConfig snapshot
+        for the whole run unless settings is passed in. Every pending dirty
+        key of the month is covered by the run and cleared.
+
+        With ENGINE set to 'aggregation' bulk runs are evaluated by MongoDB
+        instead, falling back to Python if a pipeline or its writes fail. With
+        workers above 1 (only passed by the CLI), Python bulk runs over at
+        least PARALLEL_MIN_RECORDS records are split across worker processes
+        (see _detect_parallel).
+        """
+        started = datetime.utcnow()
+
         # Get monthly cycle upload status
         cycle = MonthlyCycle.get_by_month(site_id, month_year)
         if not cycle:
             # No cycle means no uploads yet; skip mismatch detection
             return 0
 
-        upload_status = cycle.get('data_upload_status', {})
-        swipe_uploaded = upload_status.get('swipe_data', {}).get('uploaded', False)
-        wfh_uploaded = upload_status.get('wfh_data', {}).get('uploaded', False)
-        leave_uploaded = upload_status.get('leave_data', {}).get('uploaded', False)
+        uploaded_flags = cls._uploaded_flags(cycle)
+        if settings is None:
+            settings = SystemConfig.get_snapshot()
 
-        # Get attendance records for the month
-        attendance_records = Attendance.find({
+        # Thresholds and upload flags are resolved once for the whole run
+        rules = MismatchRules.compile(settings, *uploaded_flags)
+
+        attendance_query = {
             "site_id": site_id,
             "date": {"$regex": f"^{month_year}"}
-        })
+        }
 
-        mismatch_count = 0
+        mismatch_count = None
+        if bulk and cls.ENGINE == 'aggregation':
+            from app.utils.mismatch_aggregation import MismatchAggregation
+            mismatch_count = MismatchAggregation.detect_and_write(
+                site_id, month_year, settings, uploaded_flags, MonthlyCycle.active_batch_filters(site_id)
+            )
 
-        for record in attendance_records:
-            mismatch = cls.check_record_for_mismatches(
-                record, month_year,
-                swipe_uploaded=swipe_uploaded,
-                wfh_uploaded=wfh_uploaded,
-                leave_uploaded=leave_uploaded
+        if mismatch_count is None and bulk and workers > 1:
+            user_ids = [record['user_id'] for record in Attendance.find(attendance_query, projection={'user_id': 1})]
+            if len(user_ids) >= cls.PARALLEL_MIN_RECORDS:
+                CoverageIndex.ensure_current(site_id, month_year, cycle)
+                mismatch_count = cls._detect_parallel(site_id, month_year, set(user_ids), settings, uploaded_flags, rules, workers)
+
+        if mismatch_count is None and bulk:
+            # Bulk runs read the month's per-user coverage documents
+            mismatch_count = cls._detect_bulk(
+                month_year, Attendance.find(attendance_query), CoverageIndex.load(site_id, month_year, cycle), rules
             )
+        elif mismatch_count is None:
+            mismatch_count = cls._detect_per_record(
+                month_year, Attendance.find(attendance_query),
+                DatabaseSourceData(MonthlyCycle.active_batch_filters(site_id)), rules
+            )
+
+        rules.log_counters(f"Mismatch detection {site_id} {month_year}:")
+
+        cls._finish_full_run(site_id, month_year, cycle, started)
+        return mismatch_count
+
+    @staticmethod
+    def _finish_full_run(site_id, month_year, cycle, started):
+        """A full run covered every dirty key marked before it started"""
+        MismatchDirtyKey.clear(site_id, month_year, started)
+        if cycle.get('mismatch_full_scan_required'):
+            MonthlyCycle.set_full_mismatch_scan_required(site_id, month_year, False)
+
+    @classmethod
+    def preview_version(cls, site_id, month_year, cycle, settings):
+        """
+        Key of everything detection of a site-month reads: the active
+        uploads, the month's attendance records, the thresholds, plus its
+        dirty keys, which every attendance or resolution change marks
+        """
+        attendance = Attendance.month_state(site_id, month_year)
+        dirty = MismatchDirtyKey.month_state(site_id, month_year)
+        thresholds = sorted(set(
+            (rule['threshold'][0], settings.get(*rule['threshold']))
+            for status_rules in MISMATCH_RULES.values()
+            for rule in status_rules if 'threshold' in rule
+        ))
+        state = (f"{CoverageIndex.signature(cycle)}|{attendance['count']}:{attendance['updated_at']}|"
+                 f"{dirty['count']}:{dirty['marked_at']}|{thresholds}")
+        return hashlib.sha1(state.encode()).hexdigest()
+
+    @classmethod
+    def _cached_preview(cls, site_id, month_year, version, pop=False):
+        key = (str(site_id), month_year)
+        with cls._previews_lock:
+            entry = cls._previews.get(key)
+            if entry is None:
+                return None
+            if entry['version'] != version or time.monotonic() - entry['stored_at'] > cls.PREVIEW_TTL_SECONDS:
+                cls._previews.pop(key, None)
+                return None
+            if pop:
+                cls._previews.pop(key, None)
+            return entry
+
+    @classmethod
+    def preview_mismatches(cls, site_id, month_year, settings=None):
+        """
+        Dry run of bulk detection: the mismatches a site-month would get,
+        diffed against the stored ones, with nothing written. Returns None
+        without a monthly cycle, else {'version', 'computed_at', 'detected',
+        'new', 'changed', 'reopened', 'resolved', 'unchanged'} (see
+        _preview_diff). The detected set is kept under the version for
+        apply_preview, and returned again while the version holds.
+        """
+        started = datetime.utcnow()
+        cycle = MonthlyCycle.get_by_month(site_id, month_year)
+        if not cycle:
+            return None
+        if settings is None:
+            settings = SystemConfig.get_snapshot()
+
+        version = cls.preview_version(site_id, month_year, cycle, settings)
+        cached = cls._cached_preview(site_id, month_year, version)
+        if cached:
+            return cached['diff']
+
+        rules = MismatchRules.compile(settings, *cls._uploaded_flags(cycle))
+        detected, mismatched_attendance_ids = cls.collect_mismatches(
+            month_year,
+            Attendance.find({"site_id": site_id, "date": {"$regex": f"^{month_year}"}}),
+            CoverageIndex.load(site_id, month_year, cycle),
+            rules
+        )
+        rules.log_counters(f"Mismatch preview {site_id} {month_year}:")
+
+        diff = cls._preview_diff(site_id, month_year, detected)
+        diff.update(version=version, computed_at=started, detected=len(detected))
+        with cls._previews_lock:
+            cls._previews[(str(site_id), month_year)] = {
+                'version': version,
+                'started': started,
+                'stored_at': time.monotonic(),
+                'detected': detected,
+                'attendance_ids': mismatched_attendance_ids,
+                'diff': diff
+            }
+        return diff
+
+    @staticmethod
+    def _preview_diff(site_id, month_year, detected):
+        """
+        How writing detected would change the stored mismatches of the
+        month, with bulk_upsert_mismatches semantics: 'new' records without
+        one, 'changed' pending ones whose type changes, 'reopened' ones in
+        another status whose type changes (they go back to pending) and
+        'resolved' open ones that are no longer detected (left as they
+        are). Entries are {'user_id', 'date', 'mismatch_type',
+        'previous_type', 'status'}; 'unchanged' counts the rest.
+        """
+        existing = {
+            (str(mismatch['user_id']), mismatch['date']): mismatch
+            for mismatch in MismatchManagement.get_site_mismatches(
+                site_id, month_year, projection=MismatchManagement.LIST_FIELDS)
+        }
+        diff = {'new': [], 'changed': [], 'reopened': [], 'resolved': [], 'unchanged': 0}
+        detected_keys = set()
+        for mismatch in detected:
+            key = (str(mismatch['user_id']), mismatch['date'])
+            detected_keys.add(key)
+            current = existing.get(key)
+            entry = {
+                'user_id': key[0],
+                'date': key[1],
+                'mismatch_type': mismatch['mismatch_type'],
+                'previous_type': current.get('mismatch_type') if current else None,
+                'status': current.get('status') if current else None
+            }
+            if current is None:
+                diff['new'].append(entry)
+            elif current.get('mismatch_type') == mismatch['mismatch_type']:
+                diff['unchanged'] += 1
+            elif current.get('status') == 'pending':
+                diff['changed'].append(entry)
+            else:
+                diff['reopened'].append(entry)
+
+        for key, current in existing.items():
+            if key not in detected_keys and current.get('status') in ('pending', 'vendor_updated'):
+                diff['resolved'].append({
+                    'user_id': key[0],
+                    'date': key[1],
+                    'mismatch_type': [],
+                    'previous_type': current.get('mismatch_type'),
+                    'status': current.get('status')
+                })
+
+        for entries in (diff['new'], diff['changed'], diff['reopened'], diff['resolved']):
+            entries.sort(key=lambda entry: (entry['date'], entry['user_id']))
+        return diff
+
+    @classmethod
+    def apply_preview(cls, site_id, month_year, version=None):
+        """
+        Write the mismatches of a site-month's last preview if nothing
+        detection reads changed since (and it is the version the caller
+        saw, if given); otherwise run detect_and_create_mismatches.
+        Returns (mismatch count, whether the preview was reused).
+        """
+        cycle = MonthlyCycle.get_by_month(site_id, month_year)
+        if not cycle:
+            return 0, False
+        settings = SystemConfig.get_snapshot()
+
+        current_version = cls.preview_version(site_id, month_year, cycle, settings)
+        entry = None
+        if version is None or version == current_version:
+            entry = cls._cached_preview(site_id, month_year, current_version, pop=True)
+        if entry is None:
+            return cls.detect_and_create_mismatches(site_id, month_year, settings=settings), False
+
+        MismatchManagement.bulk_upsert_mismatches(entry['detected'])
+        Attendance.mark_many_as_mismatch(entry['attendance_ids'], True)
+        cls._finish_full_run(site_id, month_year, cycle, entry['started'])
+        return len(entry['detected']), True
+
+    @classmethod
+    def _detect_bulk(cls, month_year, attendance_records, source_data, rules):
+        """Check records and write their mismatches as one bulk upsert; returns the count"""
+        detected, mismatched_attendance_ids = cls.collect_mismatches(month_year, attendance_records, source_data, rules)
+
+        MismatchManagement.bulk_upsert_mismatches(detected)
+        Attendance.mark_many_as_mismatch(mismatched_attendance_ids, True)
+        return len(detected)
+
+    @classmethod
+    def collect_mismatches(cls, month_year, attendance_records, source_data, rules):
+        """Check records without writing; returns (mismatches, ids of the mismatched records)"""
+        detected = []
+        mismatched_attendance_ids = []
+        for record in attendance_records:
+            mismatch = cls.check_record_for_mismatches(record, month_year, source_data=source_data, rules=rules)
+            if mismatch:
+                detected.append(mismatch)
+                mismatched_attendance_ids.append(record['_id'])
+        return detected, mismatched_attendance_ids
+
+    @classmethod
+    def _detect_per_record(cls, month_year, attendance_records, source_data, rules):
+        """Check records and write each mismatch as it is found; returns the count"""
+        mismatch_count = 0
+        for record in attendance_records:
+            mismatch = cls.check_record_for_mismatches(record, month_year, source_data=source_data, rules=rules)
 
             if mismatch:
                 existing_mismatch = MismatchManagement.find_one({
@@ -67,183 +335,176 @@ class MismatchProcessor:
 
         return mismatch_count
 
+    @classmethod
+    def _detect_parallel(cls, site_id, month_year, user_ids, settings, uploaded_flags, rules, workers):
+        """
+        Split the month's users into workers partitions by a
+        stable hash of the user id and run bulk detection for each in a
+        worker process with its own database connection. Merges the
+        workers' counts and rule counters into rules; returns the count, or
+        None if the pool failed and the caller should run in-process.
+        """
+        partitions = [[] for _ in range(workers)]
+        for user_id in user_ids:
+            partitions[zlib.crc32(str(user_id).encode()) % workers].append(user_id)
+
+        mismatch_count = 0
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_detection_worker,
+                initargs=(Database.URI,)
+            ) as executor:
+                futures = [
+                    executor.submit(_detect_partition, site_id, month_year, partition, settings, uploaded_flags)
+                    for partition in partitions if partition
+                ]
+                results = [future.result() for future in futures]
+        except Exception as e:
+            # Bulk upserts are idempotent, so rerunning the whole month is safe
+            logger.error(f"Parallel mismatch detection failed for {site_id} {month_year}: {e}")
+            return None
+
+        for count, counters in results:
+            mismatch_count += count
+            rules.merge_counters(counters)
+        return mismatch_count
+
+    @classmethod
+    def _detect_users(cls, site_id, month_year, user_ids, settings, uploaded_flags):
+        """Bulk detection for some users of a site-month; returns (count, rule counters)"""
+        rules = MismatchRules.compile(settings, *uploaded_flags)
+        attendance_records = Attendance.find({
+            "site_id": site_id,
+            "user_id": {"$in": list(user_ids)},
+            "date": {"$regex": f"^{month_year}"}
+        })
+        source_data = CoverageIndex.load(site_id, month_year, user_ids=user_ids)
+        return cls._detect_bulk(month_year, attendance_records, source_data, rules), rules.counters
+
+    @classmethod
+    def detect_incremental(cls, site_id, month_year, settings=None):
+        """
+        Re-evaluate only the attendance records of a site-month whose dirty
+        key (MismatchDirtyKey) was marked since the last run, with the same
+        rules and writes as bulk detect_and_create_mismatches. Falls back to
+        the full run when an upload replaced a whole batch. Returns the
+        number of mismatches detected among the re-evaluated records.
+        """
+        started = datetime.utcnow()
+
+        cycle = MonthlyCycle.get_by_month(site_id, month_year)
+        if not cycle:
+            return 0
+        if cycle.get('mismatch_full_scan_required'):
+            return cls.detect_and_create_mismatches(site_id, month_year, settings=settings)
+
+        dirty_keys = MismatchDirtyKey.find_for_month(site_id, month_year)
+        if not dirty_keys:
+            return 0
+
+        user_ids = set(user_id for user_id, _ in dirty_keys)
+        attendance_records = [
+            record for record in Attendance.find({
+                "site_id": site_id,
+                "user_id": {"$in": list(user_ids)},
+                "date": {"$in": list(set(date for _, date in dirty_keys))}
+            })
+            if (str(record['user_id']), record['date']) in dirty_keys
+        ]
+
+        if settings is None:
+            settings = SystemConfig.get_snapshot()
+        rules = MismatchRules.compile(settings, *cls._uploaded_flags(cycle))
+        source_data = CoverageIndex.load(site_id, month_year, cycle, user_ids)
+
+        mismatch_count = cls._detect_bulk(month_year, attendance_records, source_data, rules)
+        MismatchDirtyKey.clear(site_id, month_year, started)
+
+        rules.log_counters(f"Incremental mismatch detection {site_id} {month_year}:")
+        return mismatch_count
+
+    @staticmethod
+    def _uploaded_flags(cycle):
+        """(swipe_uploaded, wfh_uploaded, leave_uploaded) of a monthly cycle"""
+        upload_status = cycle.get('data_upload_status', {})
+        return (
+            upload_status.get('swipe_data', {}).get('uploaded', False),
+            upload_status.get('wfh_data', {}).get('uploaded', False),
+            upload_status.get('leave_data', {}).get('uploaded', False)
+        )
+
     @classmethod
     def check_record_for_mismatches(cls, attendance_record, month_year,
                                     swipe_uploaded=True,
                                     wfh_uploaded=True,
-                                    leave_uploaded=True):
+                                    leave_uploaded=True,
+                                    source_data=None,
+                                    settings=None,
+                                    batch_filters=None,
+                                    rules=None):
         """
         Check a single attendance record for mismatches,
-        but only raise mismatches for data types that are uploaded
-        """
-        site_id = attendance_record['site_id']
-        user_id = attendance_record['user_id']
-        date = attendance_record['date']
-        status = attendance_record['status']
-
-        min_office_hours = SystemConfig.get_setting("minimum_office_hours", 4.0)
-        min_half_office_hours = SystemConfig.get_setting("minimum_half_office_hours", 2.0)
-        min_half_leave_hours = SystemConfig.get_setting("minimum_half_leave_hours", 3.0)
-        min_full_leave_hours = SystemConfig.get_setting("minimum_full_leave_hours", 6.0)
-
-        mismatch_types = []
-        expected_data_sequence = []
-        actual_data_sequence = []
-
-        # Rule 1: Pending status always checked
-        if status == "Pending":
-            mismatch_types.append(MismatchType.PENDING_STATUS.value)
-            expected_data_sequence.append({})
-            actual_data_sequence.append({})
-
-        # Rule 2: In office full day - only if swipe data uploaded
-        elif status == "In office full day" and swipe_uploaded:
-            swipe_data = SwipeData.find_by_user_date(user_id, date)
-            if not swipe_data:
-                mismatch_types.append(MismatchType.NO_SWIPE.value)
-                expected_data_sequence.append({"swipe_hours": min_office_hours})
-                actual_data_sequence.append({"swipe_hours": 0})
-            elif swipe_data.get('total_hours', 0) < min_office_hours:
-                mismatch_types.append(MismatchType.SHORT_SWIPE.value)
-                expected_data_sequence.append({"swipe_hours": min_office_hours})
-                actual_data_sequence.append({"swipe_hours": swipe_data.get('total_hours', 0)})
-
-        # Rule 3: Office half + work from home half
-        elif status == "Office half + work from home half":
-            swipe_data = SwipeData.find_by_user_date(user_id, date) if swipe_uploaded else None
-            wfh_data = WFHData.find_by_user_date(user_id, date) if wfh_uploaded else None
-
-            if swipe_uploaded:
-                if not swipe_data:
-                    mismatch_types.append(MismatchType.NO_SWIPE.value)
-                    expected_data_sequence.append({"swipe_hours": min_half_office_hours})
-                    actual_data_sequence.append({"swipe_hours": 0})
-                elif swipe_data.get('total_hours', 0) < min_half_office_hours:
-                    mismatch_types.append(MismatchType.SHORT_HALF_SWIPE.value)
-                    expected_data_sequence.append({"swipe_hours": min_half_office_hours})
-                    actual_data_sequence.append({"swipe_hours": swipe_data.get('total_hours', 0)})
-
-            if wfh_uploaded and not wfh_data:
-                mismatch_types.append(MismatchType.NO_WFH.value)
-                expected_data_sequence.append({"wfh_required": True})
-                actual_data_sequence.append({"wfh_present": False})
-
-        # Rule 4: Office half + leave half
-        elif status == "Office half + leave half":
-            swipe_data = SwipeData.find_by_user_date(user_id, date) if swipe_uploaded else None
-            leave_data = LeaveData.find_by_user_date(user_id, date) if leave_uploaded else None
-
-            if swipe_uploaded:
-                if not swipe_data:
-                    mismatch_types.append(MismatchType.NO_SWIPE.value)
-                    expected_data_sequence.append({"swipe_hours": min_half_office_hours})
-                    actual_data_sequence.append({"swipe_hours": 0})
-                elif swipe_data.get('total_hours', 0) < min_half_office_hours:
-                    mismatch_types.append(MismatchType.SHORT_HALF_SWIPE.value)
-                    expected_data_sequence.append({"swipe_hours": min_half_office_hours})
-                    actual_data_sequence.append({"swipe_hours": swipe_data.get('total_hours', 0)})
-
-            if leave_uploaded:
-                leave_hours = cls.total_leave_hours_in_window(user_id, date)
-                if leave_hours < min_half_leave_hours and leave_hours > 0:
-                    mismatch_types.append(MismatchType.SHORT_HALF_LEAVE.value)
-                    expected_data_sequence.append({"leave_hours_6AM_to_7PM": 3.0})
-                    actual_data_sequence.append({"leave_hours_present_6AM_to_7PM": leave_hours})
-                elif leave_hours == 0:
-                    mismatch_types.append(MismatchType.NO_LEAVE.value)
-                    expected_data_sequence.append({"leave_hours_6AM_to_7PM": 3.0})
-                    actual_data_sequence.append({"leave_hours_present_6AM_to_7PM": 0})
-
-        # Rule 5: Work from home full
-        elif status == "Work from home full":
-            wfh_data = WFHData.find_by_user_date(user_id, date) if wfh_uploaded else None
-            if wfh_uploaded and not wfh_data:
-                mismatch_types.append(MismatchType.NO_WFH.value)
-                expected_data_sequence.append({"wfh_required": True})
-                actual_data_sequence.append({"wfh_present": False})
-
-        # Rule 6: Leave
-        elif status == "Leave":
-            leave_data = LeaveData.find_by_user_date(user_id, date) if leave_uploaded else None
-            if leave_uploaded:
-                leave_hours = cls.total_leave_hours_in_window(user_id, date)
-                if leave_hours < min_full_leave_hours and leave_hours > 0:
-                    mismatch_types.append(MismatchType.SHORT_LEAVE.value)
-                    expected_data_sequence.append({"leave_hours_6AM_to_7PM": 6.0})
-                    actual_data_sequence.append({"leave_hours_present_6AM_to_7PM": leave_hours})
-                elif leave_hours == 0:
-                    mismatch_types.append(MismatchType.NO_LEAVE.value)
-                    expected_data_sequence.append({"leave_hours_6AM_to_7PM": 6.0})
-                    actual_data_sequence.append({"leave_hours_present_6AM_to_7PM": 0})
-
-        # Rule 7: WFH half + leave half
-        elif status == "Work from home half + leave half":
-            wfh_data = WFHData.find_by_user_date(user_id, date) if wfh_uploaded else None
-            leave_data = LeaveData.find_by_user_date(user_id, date) if leave_uploaded else None
-            if wfh_uploaded and not wfh_data:
-                mismatch_types.append(MismatchType.NO_WFH.value)
-                expected_data_sequence.append({"wfh_required": True})
-                actual_data_sequence.append({"wfh_present": False})
-
-            if leave_uploaded:
-                leave_hours = cls.total_leave_hours_in_window(user_id, date)
-                if leave_hours < min_half_leave_hours and leave_hours > 0:
-                    mismatch_types.append(MismatchType.SHORT_HALF_LEAVE.value)
-                    expected_data_sequence.append({"leave_hours_6AM_to_7PM": 3.0})
-                    actual_data_sequence.append({"leave_hours_present_6AM_to_7PM": leave_hours})
-                elif leave_hours == 0:
-                    mismatch_types.append(MismatchType.NO_LEAVE.value)
-                    expected_data_sequence.append({"leave_hours_6AM_to_7PM": 3.0})
-                    actual_data_sequence.append({"leave_hours_present_6AM_to_7PM": 0})
+        but only raise mismatches for data types that are uploaded.
+        If source_data (MismatchSourceData or CoverageSourceData) is given,
+        lookups are served from memory instead of the database; settings is
+        a SystemConfig snapshot (taken here if not given). batch_filters
+        (MonthlyCycle.active_batch_filters) restricts database lookups to
+        the active upload batches. rules (MismatchRules.compile) replaces
+        settings and the uploaded flags when a caller checks many records.
+        """
+        if source_data is None:
+            source_data = DatabaseSourceData(batch_filters)
+
+        if rules is None:
+            if settings is None:
+                settings = SystemConfig.get_snapshot()
+            rules = MismatchRules.compile(settings, swipe_uploaded, wfh_uploaded, leave_uploaded)
+
+        mismatch_types, expected_data_sequence, actual_data_sequence = rules.evaluate(
+            attendance_record['status'], source_data, attendance_record['user_id'], attendance_record['date']
+        )
 
         if mismatch_types:
             return {
-                "site_id": site_id,
-                "user_id": user_id,
-                "date": date,
+                "site_id": attendance_record['site_id'],
+                "user_id": attendance_record['user_id'],
+                "date": attendance_record['date'],
                 "mismatch_type": mismatch_types,
-                "original_status": status,
+                "original_status": attendance_record['status'],
                 "expected_data": expected_data_sequence,
                 "actual_data": actual_data_sequence
             }
         else:
             return None
-        
-    @classmethod
-    def calculate_leave_hours_in_window(cls, leave, date):
-        window_start = datetime.combine(date.date(), time(6, 0))  # 6:00 AM
-        window_end = datetime.combine(date.date(), time(19, 0))   # 7:00 PM
-
-        start_time_str = leave.get('start_time', '00:00')
-        end_time_str = leave.get('end_time', '23:59')
 
-        leave_start_dt = datetime.combine(
-            datetime.strptime(leave['start_date'], "%Y-%m-%d").date(),
-            datetime.strptime(start_time_str, '%H:%M:%S').time()
-        )
-        leave_end_dt = datetime.combine(
-            datetime.strptime(leave['end_date'], "%Y-%m-%d").date(),
-            datetime.strptime(end_time_str, '%H:%M:%S').time()
-        )
+    @classmethod
+    def leave_window(cls, date_str):
+        """The 6AM-7PM window of a date, in LeaveData minutes since epoch"""
+        day_start = LeaveData.day_number(date_str) * 1440
+        return day_start + cls.LEAVE_WINDOW_START, day_start + cls.LEAVE_WINDOW_END
 
-        actual_start = max(leave_start_dt, window_start)
-        actual_end = min(leave_end_dt, window_end)
+    @classmethod
+    def calculate_leave_hours_in_window(cls, leave, date):
+        window_start, window_end = cls.leave_window(date.strftime("%Y-%m-%d"))
+        leave_start, leave_end = LeaveData.interval(leave)
 
-        overlap_seconds = (actual_end - actual_start).total_seconds()
-        return max(overlap_seconds, 0) / 3600  # hours
+        overlap_minutes = min(leave_end, window_end) - max(leave_start, window_start)
+        return max(overlap_minutes, 0) / 60  # hours
 
     @classmethod
-    def total_leave_hours_in_window(cls, user_id, date_str):
+    def total_leave_hours_in_window(cls, user_id, date_str, batch_filter=None):
         date = datetime.strptime(date_str, "%Y-%m-%d")
-        leaves = Database.find(
-            LeaveData.COLLECTION,
-            {
-                "user_id": ObjectId(user_id),
-                "start_date": {"$lte": date_str},
-                "end_date": {"$gte": date_str}
-            }
-        )
+        query = {
+            "user_id": ObjectId(user_id),
+            "start_date": {"$lte": date_str},
+            "end_date": {"$gte": date_str}
+        }
+        if batch_filter:
+            query.update(batch_filter)
+        leaves = Database.find(LeaveData.COLLECTION, query)
         total_hours = 0
         for leave in leaves:
             total_hours += cls.calculate_leave_hours_in_window(leave, date)
-        return total_hours
\ No newline at end of file
+        return total_hours
@@ -0,0 +1,184 @@
+# app/utils/mismatch_rules.py
+"""Mismatch rules as data, compiled once per detection run"""
+import logging
+import time
+
+from app.enums.mismatch_types import MismatchType
+
+logger = logging.getLogger(__name__)
+
+
+# Attendance status -> checks applied to it, in order. Each check names the
+# uploaded source it reads and is skipped when that source is not uploaded
+# for the month:
+#   swipe: no record -> missing; total_hours below the threshold setting -> short
+#   wfh:   no WFH record covering the day -> missing
+#   leave: no leave hours in the 6AM-7PM window -> missing; fewer than the
+#          threshold setting -> short. expected_hours is what is reported.
+MISMATCH_RULES = {
+    "Pending": [
+        {"source": "pending"}
+    ],
+    "In office full day": [
+        {"source": "swipe", "threshold": ("minimum_office_hours", 4.0),
+         "short": MismatchType.SHORT_SWIPE}
+    ],
+    "Office half + work from home half": [
+        {"source": "swipe", "threshold": ("minimum_half_office_hours", 2.0),
+         "short": MismatchType.SHORT_HALF_SWIPE},
+        {"source": "wfh"}
+    ],
+    "Office half + leave half": [
+        {"source": "swipe", "threshold": ("minimum_half_office_hours", 2.0),
+         "short": MismatchType.SHORT_HALF_SWIPE},
+        {"source": "leave", "threshold": ("minimum_half_leave_hours", 3.0),
+         "short": MismatchType.SHORT_HALF_LEAVE, "expected_hours": 3.0}
+    ],
+    "Work from home full": [
+        {"source": "wfh"}
+    ],
+    "Leave": [
+        {"source": "leave", "threshold": ("minimum_full_leave_hours", 6.0),
+         "short": MismatchType.SHORT_LEAVE, "expected_hours": 6.0}
+    ],
+    "Work from home half + leave half": [
+        {"source": "wfh"},
+        {"source": "leave", "threshold": ("minimum_half_leave_hours", 3.0),
+         "short": MismatchType.SHORT_HALF_LEAVE, "expected_hours": 3.0}
+    ]
+}
+
+
+def _pending_check(rule, threshold):
+    def check(lookups, user_id, date):
+        return MismatchType.PENDING_STATUS.value, {}, {}
+    return check
+
+
+def _swipe_check(rule, threshold):
+    short_type = rule["short"].value
+
+    def check(lookups, user_id, date):
+        swipe = lookups.find_swipe(user_id, date)
+        if not swipe:
+            return MismatchType.NO_SWIPE.value, {"swipe_hours": threshold}, {"swipe_hours": 0}
+        hours = swipe.get('total_hours', 0)
+        if hours < threshold:
+            return short_type, {"swipe_hours": threshold}, {"swipe_hours": hours}
+        return None
+    return check
+
+
+def _wfh_check(rule, threshold):
+    def check(lookups, user_id, date):
+        if not lookups.find_wfh(user_id, date):
+            return MismatchType.NO_WFH.value, {"wfh_required": True}, {"wfh_present": False}
+        return None
+    return check
+
+
+def _leave_check(rule, threshold):
+    short_type = rule["short"].value
+    expected = {"leave_hours_6AM_to_7PM": rule["expected_hours"]}
+
+    def check(lookups, user_id, date):
+        hours = lookups.total_leave_hours_in_window(user_id, date)
+        if hours == 0:
+            return MismatchType.NO_LEAVE.value, expected, {"leave_hours_present_6AM_to_7PM": 0}
+        if hours < threshold:
+            return short_type, expected, {"leave_hours_present_6AM_to_7PM": hours}
+        return None
+    return check
+
+
+CHECK_BUILDERS = {
+    "pending": _pending_check,
+    "swipe": _swipe_check,
+    "wfh": _wfh_check,
+    "leave": _leave_check
+}
+
+
+class CompiledMismatchRules:
+    """
+    MISMATCH_RULES bound to one run's settings and upload state. Keeps,
+    per status, how many records were evaluated, how many mismatched and
+    the time spent evaluating them.
+    """
+
+    def __init__(self, checks_by_status):
+        self.checks_by_status = checks_by_status
+        self.counters = {
+            status: {"evaluated": 0, "hits": 0, "seconds": 0.0}
+            for status in checks_by_status
+        }
+
+    def evaluate(self, status, lookups, user_id, date):
+        """
+        (mismatch_types, expected_data, actual_data) of a record; empty
+        lists when it has no mismatch or its status has no rule.
+        lookups provides find_swipe, find_wfh and total_leave_hours_in_window.
+        """
+        checks = self.checks_by_status.get(status)
+        if not checks:
+            return [], [], []
+
+        started = time.perf_counter()
+        mismatch_types, expected_data, actual_data = [], [], []
+        for check in checks:
+            found = check(lookups, user_id, date)
+            if found:
+                mismatch_types.append(found[0])
+                expected_data.append(dict(found[1]))
+                actual_data.append(dict(found[2]))
+
+        counter = self.counters[status]
+        counter["evaluated"] += 1
+        counter["seconds"] += time.perf_counter() - started
+        if mismatch_types:
+            counter["hits"] += 1
+        return mismatch_types, expected_data, actual_data
+
+    def merge_counters(self, counters):
+        """Add the counters of another run of the same rules (e.g. a worker's)"""
+        for status, counter in counters.items():
+            own = self.counters.setdefault(status, {"evaluated": 0, "hits": 0, "seconds": 0.0})
+            for key in own:
+                own[key] += counter.get(key, 0)
+
+    def log_counters(self, label):
+        for status, counter in self.counters.items():
+            if counter["evaluated"]:
+                logger.info(
+                    f"{label} rule '{status}': {counter['evaluated']} evaluated, "
+                    f"{counter['hits']} mismatched, {counter['seconds'] * 1000:.1f}ms"
+                )
+
+
+class MismatchRules:
+    """Compiles MISMATCH_RULES into per-status lists of check functions"""
+
+    @classmethod
+    def compile(cls, settings, swipe_uploaded=True, wfh_uploaded=True, leave_uploaded=True, rules=None):
+        """
+        Resolve thresholds from settings (a SystemConfig snapshot) once and
+        drop the checks of sources that are not uploaded.
+        """
+        uploaded = {
+            "pending": True,
+            "swipe": swipe_uploaded,
+            "wfh": wfh_uploaded,
+            "leave": leave_uploaded
+        }
+        checks_by_status = {}
+        for status, status_rules in (rules or MISMATCH_RULES).items():
+            checks = []
+            for rule in status_rules:
+                if not uploaded[rule["source"]]:
+                    continue
+                threshold = None
+                if "threshold" in rule:
+                    threshold = settings.get(*rule["threshold"])
+                checks.append(CHECK_BUILDERS[rule["source"]](rule, threshold))
+            checks_by_status[status] = checks
+        return CompiledMismatchRules(checks_by_status)
@@ -0,0 +1,141 @@
+# app/utils/mismatch_source_data.py
+from bisect import bisect_left
+from bson import ObjectId
+from app.models.swipe_data import SwipeData
+from app.models.wfh_data import WFHData
+from app.models.leave_data import LeaveData
+
+
+class MismatchSourceData:
+    """
+    In-memory view of the swipe, WFH and leave data for one site-month.
+
+    Loaded once per detection run so that every attendance record can be
+    checked without a per-record database round trip. Lookups mirror the
+    semantics of SwipeData/WFHData/LeaveData.find_by_user_date.
+    """
+
+    def __init__(self, swipe_records=None, wfh_records=None, leave_records=None):
+        # (user_id, date) -> first swipe record, like find_one would return
+        self.swipe_by_user_date = {}
+        for swipe in swipe_records or []:
+            key = (str(swipe['user_id']), swipe['date'])
+            self.swipe_by_user_date.setdefault(key, swipe)
+
+        # user_id -> list of WFH / leave records, in natural order
+        self.wfh_by_user = {}
+        for wfh in wfh_records or []:
+            self.wfh_by_user.setdefault(str(wfh['user_id']), []).append(wfh)
+
+        self.leave_by_user = {}
+        for leave in leave_records or []:
+            self.leave_by_user.setdefault(str(leave['user_id']), []).append(leave)
+
+        self.leave_intervals = {
+            user_id: LeaveIntervals(LeaveData.interval(leave) for leave in leaves)
+            for user_id, leaves in self.leave_by_user.items()
+        }
+
+    @classmethod
+    def load(cls, user_ids, month_year, batch_filters=None):
+        """
+        Load all source data for the given users that touches month_year,
+        limited to the active upload batches if batch_filters
+        (MonthlyCycle.active_batch_filters) is given.
+        """
+        object_ids = []
+        for user_id in set(str(uid) for uid in user_ids):
+            try:
+                object_ids.append(ObjectId(user_id))
+            except Exception:
+                continue
+
+        if not object_ids:
+            return cls()
+
+        start_date = f"{month_year}-01"
+        end_date = f"{month_year}-31"
+        batch_filters = batch_filters or {}
+
+        return cls(
+            swipe_records=SwipeData.find_by_users_in_range(
+                object_ids, start_date, end_date, batch_filters.get('swipe_data')),
+            wfh_records=WFHData.find_by_users_overlapping(
+                object_ids, start_date, end_date, batch_filters.get('wfh_data')),
+            leave_records=LeaveData.find_by_users_overlapping(
+                object_ids, start_date, end_date, batch_filters.get('leave_data'))
+        )
+
+    def find_swipe(self, user_id, date_str):
+        """Swipe record for user on date, or None"""
+        return self.swipe_by_user_date.get((str(user_id), date_str))
+
+    def find_wfh(self, user_id, date_str):
+        """First WFH record covering date for user, or None"""
+        for wfh in self.wfh_by_user.get(str(user_id), []):
+            if wfh['start_date'] <= date_str <= wfh['end_date']:
+                return wfh
+        return None
+
+    def find_leaves(self, user_id, date_str):
+        """All leave records covering date for user"""
+        return [
+            leave for leave in self.leave_by_user.get(str(user_id), [])
+            if leave['start_date'] <= date_str <= leave['end_date']
+        ]
+
+    def total_leave_hours_in_window(self, user_id, date_str):
+        """Same result as MismatchProcessor.total_leave_hours_in_window, from memory"""
+        from app.utils.mismatch_processor import MismatchProcessor
+
+        intervals = self.leave_intervals.get(str(user_id))
+        if intervals is None:
+            return 0
+        window_start, window_end = MismatchProcessor.leave_window(date_str)
+        return intervals.overlap_minutes(window_start, window_end) / 60
+
+
+class LeaveIntervals:
+    """
+    One user's leave intervals (minutes since LeaveData.EPOCH), sorted by
+    start, for summing their overlap with a time window.
+    """
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.starts = [start for start, _ in self.intervals]
+        # No interval reaches further back than this from its end
+        self.max_length = max((end - start for start, end in self.intervals), default=0)
+
+    def overlap_minutes(self, window_start, window_end):
+        """Sum of each interval's overlap with window_start..window_end"""
+        first = bisect_left(self.starts, window_start - self.max_length)
+        last = bisect_left(self.starts, window_end)
+        total = 0
+        for start, end in self.intervals[first:last]:
+            overlap = min(end, window_end) - max(start, window_start)
+            if overlap > 0:
+                total += overlap
+        return total
+
+
+class DatabaseSourceData:
+    """
+    The lookups of MismatchSourceData answered with one query each,
+    restricted to the active upload batches if batch_filters
+    (MonthlyCycle.active_batch_filters) is given.
+    """
+
+    def __init__(self, batch_filters=None):
+        self.batch_filters = batch_filters or {}
+
+    def find_swipe(self, user_id, date_str):
+        return SwipeData.find_by_user_date(user_id, date_str, self.batch_filters.get('swipe_data'))
+
+    def find_wfh(self, user_id, date_str):
+        return WFHData.find_by_user_date(user_id, date_str, self.batch_filters.get('wfh_data'))
+
+    def total_leave_hours_in_window(self, user_id, date_str):
+        from app.utils.mismatch_processor import MismatchProcessor
+
+        return MismatchProcessor.total_leave_hours_in_window(user_id, date_str, self.batch_filters.get('leave_data'))
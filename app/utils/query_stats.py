@@ -0,0 +1,166 @@
+# app/utils/query_stats.py
+"""Timing hooks for Database facade calls, per-request totals and slow-query log"""
+from collections import Counter
+from datetime import datetime, date
+from functools import wraps
+import inspect
+import json
+import logging
+import time
+
+from bson.objectid import ObjectId
+from flask import g, has_app_context, has_request_context, request
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('app.slow_queries')
+
+SCALAR_TYPES = (str, bytes, int, float, bool, datetime, date, ObjectId, type(None))
+
+
+def query_shape(value):
+    """
+    Strip literal values from a query, update or pipeline, keeping its
+    structure: {'user_id': ObjectId(..), 'date': {'$gte': '2025-08-01'}}
+    becomes {'user_id': '?', 'date': {'$gte': '?'}}. Lists of literals
+    collapse to ['?'] and other objects (bulk operations) to their type name.
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    if isinstance(value, SCALAR_TYPES):
+        return '?'
+    return type(value).__name__
+
+
+class QueryStats:
+    """Collects the timings recorded by @instrumented facade methods"""
+
+    # Queries slower than this (milliseconds) go to the slow-query log
+    slow_query_ms = 100
+    # Requests issuing more queries than this log their most repeated shapes
+    request_query_warning = 50
+
+    @classmethod
+    def record(cls, collection_name, operation, query, duration_ms, count):
+        shape = None
+
+        if duration_ms >= cls.slow_query_ms:
+            shape = json.dumps(query_shape(query), sort_keys=True)
+            slow_query_logger.warning(
+                f"{duration_ms:.1f}ms {collection_name}.{operation} {shape} -> {count} docs"
+                + (f" [{request.method} {request.path}]" if has_request_context() else "")
+            )
+
+        if not has_app_context():
+            return
+        stats = g.get('query_stats')
+        if stats is None:
+            stats = g.query_stats = {'count': 0, 'time_ms': 0.0, 'docs': 0, 'shapes': Counter()}
+        stats['count'] += 1
+        stats['time_ms'] += duration_ms
+        stats['docs'] += count
+        if shape is None:
+            shape = json.dumps(query_shape(query), sort_keys=True)
+        stats['shapes'][(collection_name, operation, shape)] += 1
+
+    @classmethod
+    def current(cls):
+        """Totals for the current request (or app context), if any"""
+        if not has_app_context():
+            return None
+        return g.get('query_stats')
+
+
+def _result_count(result):
+    """Number of documents a facade call returned or touched"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    if isinstance(result, dict) and all(isinstance(v, int) for v in result.values()):
+        return sum(result.values())
+    return 0 if result is None else 1
+
+
+def _query_kwarg(kwargs):
+    for name in ('query', 'document', 'pipeline', 'operations'):
+        if name in kwargs:
+            return kwargs[name]
+    return None
+
+
+def instrumented(operation):
+    """
+    Decorate a Database facade method taking (collection_name, query, ...)
+    so each call is timed and recorded with QueryStats. Generator methods
+    are timed across the whole iteration, excluding time spent by the caller.
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_wrapper(collection_name, *args, **kwargs):
+                query = args[0] if args else _query_kwarg(kwargs)
+                iterator = func(collection_name, *args, **kwargs)
+                elapsed = 0.0
+                count = 0
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            document = next(iterator)
+                        except StopIteration:
+                            elapsed += time.perf_counter() - start
+                            break
+                        elapsed += time.perf_counter() - start
+                        count += 1
+                        yield document
+                finally:
+                    iterator.close()
+                    QueryStats.record(collection_name, operation, query, elapsed * 1000, count)
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(collection_name, *args, **kwargs):
+            query = args[0] if args else _query_kwarg(kwargs)
+            start = time.perf_counter()
+            result = func(collection_name, *args, **kwargs)
+            duration_ms = (time.perf_counter() - start) * 1000
+            QueryStats.record(collection_name, operation, query, duration_ms, _result_count(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def init_query_stats(app):
+    """Read thresholds from config and report per-request totals in response headers"""
+    QueryStats.slow_query_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', QueryStats.slow_query_ms)
+    QueryStats.request_query_warning = app.config.get('REQUEST_QUERY_WARNING', QueryStats.request_query_warning)
+
+    slow_query_log = app.config.get('SLOW_QUERY_LOG_FILE')
+    if slow_query_log:
+        handler = logging.FileHandler(slow_query_log)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        slow_query_logger.addHandler(handler)
+
+    @app.after_request
+    def add_query_stats_headers(response):
+        stats = QueryStats.current()
+        if not stats:
+            return response
+        response.headers['X-DB-Query-Count'] = str(stats['count'])
+        response.headers['X-DB-Query-Time-Ms'] = f"{stats['time_ms']:.1f}"
+        response.headers['X-DB-Docs'] = str(stats['docs'])
+
+        if stats['count'] > QueryStats.request_query_warning:
+            repeated = ', '.join(
+                f"{n}x {collection}.{operation} {shape}"
+                for (collection, operation, shape), n in stats['shapes'].most_common(3)
+            )
+            logger.warning(f"{request.method} {request.path} issued {stats['count']} queries; top: {repeated}")
+        return response
@@ -0,0 +1,95 @@
+# app/utils/site_directory.py
+"""Per-site cache of vending companies, departments and managers keyed by id"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SiteDirectory:
+    """
+    Vending companies, departments and active managers of a site, loaded
+    with three queries and kept in memory as {str(_id): document} maps.
+
+    Entries are dropped by invalidate() whenever one of these records is
+    written through the models, and expire after TTL_SECONDS so that other
+    worker processes converge too. Returned documents are shared: callers
+    must not mutate them.
+    """
+
+    TTL_SECONDS = 300
+
+    _entries = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _load(cls, site_id):
+        from app.models.department import Department
+        from app.models.user import User
+        from app.models.vending_company import VendingCompany
+
+        return {
+            'companies': {str(c['_id']): c for c in VendingCompany.get_all(site_id)},
+            'departments': {str(d['_id']): d for d in Department.get_all(site_id)},
+            'managers': {
+                str(m['_id']): m
+                for m in User.get_all_by_site(site_id, 'manager', projection=User.DISPLAY_FIELDS)
+            },
+            'loaded_at': time.monotonic()
+        }
+
+    @classmethod
+    def _entry(cls, site_id):
+        key = str(site_id)
+        entry = cls._entries.get(key)
+        if entry is None or time.monotonic() - entry['loaded_at'] > cls.TTL_SECONDS:
+            entry = cls._load(site_id)
+            with cls._lock:
+                cls._entries[key] = entry
+        return entry
+
+    @classmethod
+    def invalidate(cls, site_id=None):
+        """Drop the cached directory of one site, or of every site"""
+        with cls._lock:
+            if site_id is None:
+                cls._entries.clear()
+            else:
+                cls._entries.pop(str(site_id), None)
+
+    @classmethod
+    def companies(cls, site_id):
+        """Vending companies of a site, like VendingCompany.get_all"""
+        return list(cls._entry(site_id)['companies'].values())
+
+    @classmethod
+    def departments(cls, site_id):
+        """Departments of a site, like Department.get_all"""
+        return list(cls._entry(site_id)['departments'].values())
+
+    @classmethod
+    def managers(cls, site_id):
+        """Active managers of a site (User.DISPLAY_FIELDS only)"""
+        return list(cls._entry(site_id)['managers'].values())
+
+    @classmethod
+    def company(cls, site_id, company_id):
+        """Vending company by id within a site, or None"""
+        if not company_id:
+            return None
+        return cls._entry(site_id)['companies'].get(str(company_id))
+
+    @classmethod
+    def department(cls, site_id, department_id):
+        """Department by id within a site, or None"""
+        if not department_id:
+            return None
+        return cls._entry(site_id)['departments'].get(str(department_id))
+
+    @classmethod
+    def manager(cls, site_id, manager_id):
+        """Active manager by id within a site, or None"""
+        if not manager_id:
+            return None
+        return cls._entry(site_id)['managers'].get(str(manager_id))
@@ -15,8 +15,49 @@ def calculate_hours_for_status(status):
     else:
         return 0
 
+def build_work_dates_hours(attendance_records, mismatches):
+    """
+    Hours per worked date of a vendor's month and the number of pending
+    mismatch days, from their attendance records and mismatches
+    """
+    # Calculate worked dates and hours
+    work_dates_hours = {}
+    for record in attendance_records:
+        status = record.get('status', '')
+        date = record.get('date')
+        hours = calculate_hours_for_status(status)
+        if hours > 0:
+            work_dates_hours[date] = hours
+
+    # Handle mismatches according to status
+    mismatch_leave_days = 0
+    for mismatch in mismatches:
+        mismatch_status = mismatch.get('status', '')
+        date = mismatch.get('date')
+
+        if mismatch_status == 'pending':
+            # Consider as leave (8 hours lost)
+            mismatch_leave_days += 1
+            if date in work_dates_hours:
+                del work_dates_hours[date]  # Remove work hours for this date
+
+        elif mismatch_status == 'vendor_updated':
+            # Consider what vendor submitted
+            vendor_data = mismatch.get('vendor_data', {})
+            vendor_status = vendor_data.get('status', '')
+            if vendor_status:
+                hours = calculate_hours_for_status(vendor_status)
+                work_dates_hours[date] = hours
+
+    return work_dates_hours, mismatch_leave_days
+
 def generate_timesheets_for_month(site_id, manager_id, month_year, vending_company_id=None):
-    """Generate detailed timesheets for vendors"""
+    """
+    Generate detailed timesheets for vendors. Attendance, mismatches and
+    offsets of all the vendors are read with one query each and every
+    timesheet is written in one unordered bulk upsert. Returns the number
+    of vendors.
+    """
     year, month = map(int, month_year.split('-'))
 
     # Filter vendors by site, optionally manager and vending company
@@ -25,66 +66,45 @@ def generate_timesheets_for_month(site_id, manager_id, month_year, vending_compa
         query['manager_id'] = manager_id
     if vending_company_id:
         query['vending_company_id'] = vending_company_id
-        
-    vendors = User.find(query)
 
+    vendors = User.find(query, projection={'_id': 1, 'vending_company_id': 1})
+    vendor_ids = [vendor['_id'] for vendor in vendors]
+
+    attendance_by_vendor = {}
+    for record in Attendance.find_by_users_and_month(vendor_ids, year, month,
+                                                     projection={'user_id': 1, 'date': 1, 'status': 1}):
+        attendance_by_vendor.setdefault(str(record['user_id']), []).append(record)
+
+    mismatches_by_vendor = {}
+    for mismatch in MismatchManagement.find_by_users_and_month(
+            vendor_ids, month_year, projection={'user_id': 1, 'date': 1, 'status': 1, 'vendor_data': 1}):
+        mismatches_by_vendor.setdefault(str(mismatch['user_id']), []).append(mismatch)
+
+    # Offsets from previous months or late corrections
+    offsets_by_vendor = AttendanceOffset.find_for_vendors(vendor_ids, month_year)
+
+    timesheets = []
     for vendor in vendors:
-        vendor_id = vendor['_id']
-
-        # Get attendance records for the month
-        attendance_records = Attendance.find_by_user_and_month(str(vendor_id), year, month)
-        
-        # Get mismatches for the month
-        mismatches = MismatchManagement.find_by_user_and_month(str(vendor_id), month_year)
-
-        # Get offsets from previous months
-        offsets_summary = AttendanceOffset.get_offsets_summary(vendor_id, month_year)
-
-        # Calculate worked dates and hours
-        work_dates_hours = {}
-        for record in attendance_records:
-            status = record.get('status', '')
-            date = record.get('date')
-            hours = calculate_hours_for_status(status)
-            if hours > 0:
-                work_dates_hours[date] = hours
+        vendor_id = str(vendor['_id'])
+        work_dates_hours, mismatch_leave_days = build_work_dates_hours(
+            attendance_by_vendor.get(vendor_id, []), mismatches_by_vendor.get(vendor_id, [])
+        )
+        offsets_summary = AttendanceOffset.summarize(offsets_by_vendor.get(vendor_id, []))
 
-        # Handle mismatches according to status
-        mismatch_leave_days = 0
-        for mismatch in mismatches:
-            mismatch_status = mismatch.get('status', '')
-            date = mismatch.get('date')
-            
-            if mismatch_status == 'pending':
-                # Consider as leave (8 hours lost)
-                mismatch_leave_days += 1
-                if date in work_dates_hours:
-                    del work_dates_hours[date]  # Remove work hours for this date
-                    
-            elif mismatch_status == 'vendor_updated':
-                # Consider what vendor submitted
-                vendor_data = mismatch.get('vendor_data', {})
-                vendor_status = vendor_data.get('status', '')
-                if vendor_status:
-                    hours = calculate_hours_for_status(vendor_status)
-                    work_dates_hours[date] = hours
-
-        # Get offsets (from previous months or late corrections)
-        offset_dates_hours = offsets_summary.get('dates_hours', {})
-        total_offset_hours = offsets_summary.get('total_hours', 0)
-
-        # Create or update detailed timesheet
-        Timesheet.create_or_update_detailed(
-            vendor_id=vendor_id,
+        timesheets.append(Timesheet.detailed_document(
+            vendor_id=vendor['_id'],
             vending_company_id=vendor.get('vending_company_id'),
             month_year=month_year,
             work_dates_hours=work_dates_hours,
             mismatch_leave_days=mismatch_leave_days,
-            offset_dates_hours=offset_dates_hours,
-            total_offset_hours=total_offset_hours
-        )
+            offset_dates_hours=offsets_summary.get('dates_hours', {}),
+            total_offset_hours=offsets_summary.get('total_hours', 0)
+        ))
+
+    Timesheet.bulk_upsert_detailed(timesheets)
 
     print(f"Timesheets generated for {len(vendors)} vendors for {month_year}")
+    return len(vendors)
 
 def update_offset_for_late_changes(vendor_id, changed_month_year, offset_days):
     from app.models.timesheet import Timesheet
@@ -0,0 +1,86 @@
+# app/utils/upload_jobs.py
+"""Background processing of uploaded data files"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import uuid
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from app.models.upload_job import UploadJob
+from app.utils.data_upload_processor import DataUploadProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJobRunner:
+    """
+    Saves uploads to UPLOAD_FOLDER and processes them on a local thread pool,
+    so the request returns as soon as the file is on disk. Progress is kept
+    on the job's upload_jobs document.
+
+    Jobs run in the process that accepted the upload; a job whose process
+    exits mid-run stays 'running' and has to be uploaded again.
+    """
+
+    upload_folder = None
+    max_workers = 2
+    _executor = None
+
+    @classmethod
+    def init_app(cls, app):
+        cls.upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'jobs')
+        cls.max_workers = app.config.get('UPLOAD_JOB_WORKERS', cls.max_workers)
+        os.makedirs(cls.upload_folder, exist_ok=True)
+
+    @classmethod
+    def _get_executor(cls):
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=cls.max_workers, thread_name_prefix='upload-job')
+        return cls._executor
+
+    @classmethod
+    def submit(cls, file, data_type, month_year, site_id, created_by=None):
+        """Save the uploaded file, record a queued job and schedule it. Returns the job id."""
+        filename = secure_filename(file.filename)
+        file_path = os.path.join(cls.upload_folder, f"{uuid.uuid4().hex}_{filename}")
+        file.save(file_path)
+
+        job_id = UploadJob.create(site_id, month_year, data_type, filename, file_path, created_by)
+        if not job_id:
+            os.remove(file_path)
+            return None
+
+        cls._get_executor().submit(cls.run, job_id)
+        return job_id
+
+    @classmethod
+    def run(cls, job_id):
+        """Process a queued job; always removes its saved file"""
+        job = UploadJob.find_by_id(job_id)
+        if not job:
+            return
+
+        UploadJob.mark_running(job_id)
+
+        def progress(parsed, inserted, rejected):
+            UploadJob.update_progress(job_id, parsed, inserted, rejected)
+
+        try:
+            with open(job['file_path'], 'rb') as stream:
+                file = FileStorage(stream=stream, filename=job['filename'])
+                result = DataUploadProcessor.process_upload(
+                    file, job['data_type'], job['month_year'], job['site_id'], progress=progress
+                )
+        except Exception as e:
+            logger.error(f"Upload job {job_id} failed: {e}")
+            result = {'success': False, 'error': str(e)}
+        finally:
+            try:
+                os.remove(job['file_path'])
+            except OSError:
+                pass
+
+        UploadJob.finish(job_id, result)
+        return result
@@ -1,7 +1,7 @@
 # app/utils/workday_calculator.py
 from app.models.attendance import Attendance
 from app.models.user import User
-from app.models.vending_company import VendingCompany
+from app.utils.site_directory import SiteDirectory
 from app.models.system_config import SystemConfig
 from app.utils.database import Database
 from bson.objectid import ObjectId
@@ -13,9 +13,12 @@ class WorkdayCalculator:
     """Calculate workdays and generate reports for vending companies"""
 
     @classmethod
-    def calculate_monthly_workdays(cls, site_id, month_year):
+    def calculate_monthly_workdays(cls, site_id, month_year, settings=None):
         """Calculate final workdays for all vendors in a month"""
         try:
+            if settings is None:
+                settings = SystemConfig.get_snapshot()
+
             # Get all finalized attendance (resolved mismatches) 
             attendance_records = cls._get_finalized_attendance(site_id, month_year)
 
@@ -27,7 +30,7 @@ class WorkdayCalculator:
                 final_status = record.get('final_status', record['status'])
 
                 # Get workday value based on final status
-                workday_value = cls.get_workday_value(final_status)
+                workday_value = cls.get_workday_value(final_status, settings)
 
                 if user_id not in vendor_workdays:
                     vendor_workdays[user_id] = {
@@ -72,9 +75,11 @@ class WorkdayCalculator:
             return None
 
     @classmethod
-    def get_workday_value(cls, status):
+    def get_workday_value(cls, status, settings=None):
         """Return workday value based on attendance status"""
-        wfh_rate = SystemConfig.get_setting("wfh_workday_rate", 0.8)
+        if settings is None:
+            settings = SystemConfig.get_snapshot()
+        wfh_rate = settings.get("wfh_workday_rate", 0.8)
 
         if status == "In office full day":
             return 1.0
@@ -103,7 +108,7 @@ class WorkdayCalculator:
             ]
         }
 
-        return Database.find("attendance", query, sort=[("date", 1)])
+        return Database.iter_find("attendance", query, sort=[("date", 1)])
 
     @classmethod
     def _group_by_vending_company(cls, vendor_workdays, site_id):
@@ -121,7 +126,7 @@ class WorkdayCalculator:
                 continue
 
             # Get company details
-            company = VendingCompany.find_by_id(vendor_company_id)
+            company = SiteDirectory.company(site_id, vendor_company_id)
             if not company:
                 continue
 
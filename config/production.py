@@ -6,7 +6,18 @@ class ProductionConfig:
     SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(24)
     MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/vendor_management_prod'
     UPLOAD_FOLDER = os.path.abspath('app/static/uploads')
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024
+    UPLOAD_CHUNK_SIZE = 5000  # rows parsed and inserted per batch
+    UPLOAD_JOB_WORKERS = 2  # background threads processing uploads
+    UPLOAD_DELTA_MAX_ROWS = 5000  # changed rows above which a re-upload replaces the whole batch
     ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
     PERMANENT_SESSION_LIFETIME = timedelta(hours=8)
+    ENSURE_INDEXES_ON_STARTUP = False  # run `flask --app app indexes ensure` as a deploy step
+    CURSOR_BATCH_SIZE = 500  # documents per round trip for streamed queries
+    SLOW_QUERY_THRESHOLD_MS = 100
+    SYSTEM_CONFIG_TTL_SECONDS = 60
+    SITE_DIRECTORY_TTL_SECONDS = 300
+    MISMATCH_DETECTION_WORKERS = int(os.environ.get('MISMATCH_DETECTION_WORKERS', 1))  # processes for `flask mismatches detect`
+    MISMATCH_DETECTION_ENGINE = os.environ.get('MISMATCH_DETECTION_ENGINE', 'python')  # 'aggregation' detects on the MongoDB server
+    SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')
     DEBUG = False